@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""Time importing flomosa in a fresh interpreter, with and without a Client.
+
+Exits with status 1 if a model-only import pulls in the transport stack.
+"""
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+RUNS = 10
+
+# Modules that only the Client needs and importing flomosa must not load.
+TRANSPORT_MODULES = ('oauth2', 'httplib2', 'httplib', 'urllib', 'uuid',
+    'numpy', 'email', 'flomosa.pool', 'flomosa.signing', 'flomosa.retry')
+
+SCENARIOS = (
+    ('import', 'import flomosa'),
+    ('model', 'import flomosa\n'
+        'p = flomosa.Process(name="p")\n'
+        'p.add_step("s", is_start=True).add_action("done", is_complete=True)\n'
+        'p.to_json()'),
+    ('client', 'import flomosa\n'
+        'flomosa.Client(key="k", secret="s")'),
+)
+
+PROBE = '''
+import sys, time
+sys.path.insert(0, %r)
+start = time.time()
+%s
+elapsed = time.time() - start
+print('%%f %%d' %% (elapsed, len([name for name in sys.modules
+    if sys.modules[name] is not None])))
+print(' '.join(sorted(sys.modules)))
+'''
+
+
+def run(code):
+    output = subprocess.check_output([sys.executable, '-c',
+        PROBE % (ROOT, code)])
+    timing, modules = output.splitlines()
+    elapsed, count = timing.split()
+    return float(elapsed), int(count), modules.split()
+
+
+def loaded(modules):
+    return [name for name in TRANSPORT_MODULES if name in modules]
+
+
+def main():
+    print('%-8s %10s %10s %8s' % ('scenario', 'best ms', 'median ms',
+        'modules'))
+    leaked = []
+    for name, code in SCENARIOS:
+        times = []
+        for i in xrange(RUNS):
+            elapsed, count, modules = run(code)
+            times.append(elapsed)
+        times.sort()
+        print('%-8s %10.1f %10.1f %8d' % (name, times[0] * 1000,
+            times[len(times) // 2] * 1000, count))
+        if name != 'client':
+            leaked.extend(loaded(modules))
+    if leaked:
+        print('transport modules loaded without a Client: %s' %
+            ', '.join(sorted(set(leaked))))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
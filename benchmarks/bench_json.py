@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""Compare the installed JSON codecs on process and stats payloads."""
+
+import os
+import sys
+import timeit
+sys.path[0:0] = [os.path.join(os.path.dirname(__file__), '..'),]
+
+import flomosa
+from flomosa import codec
+
+NUM_STEPS = 2000
+NUM_STATS = 5000
+
+
+def build_process():
+    process = flomosa.Process(name='bench process', key='bench-process')
+    previous = None
+    for i in xrange(NUM_STEPS):
+        step = process.add_step('Step %d' % i, members=['a@flomosa.com'],
+            team='bench-team')
+        if previous is not None:
+            previous.add_action('Approved', next_step=step)
+            previous.add_action('Rejected', is_complete=True)
+        previous = step
+    return process.to_dict()
+
+
+def build_stats():
+    return [{
+        'num_requests': i,
+        'num_requests_completed': i // 2,
+        'min_request_seconds': 0.25,
+        'max_request_seconds': 12.5 + i,
+        'avg_request_seconds': 3.14159,
+        'total_request_seconds': 1.5 * i
+    } for i in xrange(NUM_STATS)]
+
+
+def main():
+    payloads = (('process', build_process()), ('stats', build_stats()))
+    print('%-11s %-8s %10s %10s %9s' % ('codec', 'payload', 'dumps ms',
+        'loads ms', 'bytes'))
+    for name in codec.available():
+        backend = codec.get_codec(name)
+        for payload_name, payload in payloads:
+            data = backend.dumps(payload)
+            dumps = min(timeit.repeat(lambda: backend.dumps(payload),
+                number=5, repeat=3)) / 5
+            loads = min(timeit.repeat(lambda: backend.loads(data),
+                number=5, repeat=3)) / 5
+            print('%-11s %-8s %10.2f %10.2f %9d' % (name, payload_name,
+                dumps * 1000, loads * 1000, len(data)))
+
+if __name__ == '__main__':
+    main()
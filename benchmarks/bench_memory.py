@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""Report the memory used per Step and per Action in a large Process."""
+
+import gc
+import os
+import sys
+import time
+sys.path[0:0] = [os.path.join(os.path.dirname(__file__), '..'),]
+
+import flomosa
+
+NUM_STEPS = 100000
+
+
+def deep_size(obj, seen):
+    """Return the size of obj and everything it references, once each."""
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, type):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.iterkeys())
+            stack.extend(obj.itervalues())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        if hasattr(obj, '__dict__'):
+            stack.append(obj.__dict__)
+        for cls in type(obj).__mro__:
+            for slot in getattr(cls, '__slots__', ()):
+                if slot in ('__dict__', '__weakref__'):
+                    continue
+                try:
+                    stack.append(getattr(obj, slot))
+                except AttributeError:
+                    pass
+    return size
+
+
+def main(num_steps=NUM_STEPS):
+    gc.collect()
+    start = time.time()
+    process = flomosa.Process(name='memory benchmark')
+    steps = [process.add_step('Step %d' % i) for i in xrange(num_steps)]
+    step_bytes = deep_size(process, set())
+
+    for i, step in enumerate(steps):
+        step.add_action('Next', next_step=steps[(i + 1) % num_steps])
+    total_bytes = deep_size(process, set())
+    elapsed = time.time() - start
+
+    print('steps          %d' % num_steps)
+    print('bytes/step     %d' % (step_bytes / num_steps))
+    print('bytes/action   %d' % ((total_bytes - step_bytes) / num_steps))
+    print('total MB       %.1f' % (total_bytes / 1048576.0))
+    print('build seconds  %.2f' % elapsed)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
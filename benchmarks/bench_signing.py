@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+"""Compare Client request signing against the plain oauth2 path."""
+
+import os
+import sys
+import timeit
+import urllib
+sys.path[0:0] = [os.path.join(os.path.dirname(__file__), '..'),]
+
+import oauth2 as oauth
+
+import flomosa
+
+NUMBER = 20000
+
+client = flomosa.Client('test-key', 'test-secret', host='127.0.0.1',
+    port=8080)
+params = {'year': 2010, 'month': 4, 'day': 20, 'filter': 'num_requests'}
+url = client.endpoint('stats_day', key='test') + '?' + urllib.urlencode(params)
+
+
+def sign_oauth2():
+    request = oauth.Request.from_consumer_and_token(client.consumer,
+        http_method='GET', http_url=url, parameters=params)
+    request.sign_request(client.signature, client.consumer, None)
+    headers = request.to_header(client.realm)
+    headers['User-Agent'] = 'Flomosa Python Client v%s' % flomosa.API_VERSION
+    return headers
+
+
+def sign_signer():
+    return client.signer.sign('GET', url, params)
+
+
+def main():
+    results = []
+    for name, func in (('oauth2', sign_oauth2), ('signer', sign_signer)):
+        seconds = min(timeit.repeat(func, number=NUMBER, repeat=3))
+        results.append((name, seconds))
+        print('%-8s %8.2f us/request' % (name, seconds / NUMBER * 1e6))
+    print('speedup  %8.2fx' % (results[0][1] / results[1][1]))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+"""Load test Client against an in-process StandInServer.
+
+Each of --clients threads has its own Client and calls a random mix of API
+methods for --seconds, then throughput and latency percentiles are printed
+per endpoint. Latency, jitter and injected errors are set on the server.
+
+    python benchmarks/load.py --clients 16 --seconds 10
+    python benchmarks/load.py --latency 0.02 --error-rate 0.05 --json
+"""
+
+import json
+import os
+import random
+import sys
+import threading
+import time
+from optparse import OptionParser
+sys.path[0:0] = [os.path.join(os.path.dirname(__file__), '..'),]
+
+import flomosa
+from flomosa.instrument import Histograms
+from flomosa.server import StandInServer
+
+KEY = 'load-key'
+SECRET = 'load-secret'
+NUM_PROCESSES = 50
+NUM_STEPS = 20
+NUM_REQUESTS = 2000
+
+# Client call -> relative weight in the default mix.
+MIX = {
+    'get_process': 10,
+    'add_process': 2,
+    'get_team': 5,
+    'get_request': 5,
+    'search_process': 3,
+    'get_day_stats': 5
+}
+
+
+class Fixture(object):
+    """The processes, teams and requests stored on the server."""
+
+    def __init__(self, server, num_processes=NUM_PROCESSES,
+        num_steps=NUM_STEPS, num_requests=NUM_REQUESTS, seed=0):
+        rng = random.Random(seed)
+        client = flomosa.Client(KEY, SECRET, host=server.host,
+            port=server.port)
+        self.processes = []
+        self.teams = []
+        now = time.time()
+        for i in xrange(num_processes):
+            team = flomosa.Team(name='Team %d' % i, key='load-team-%d' % i,
+                members=['member%d@flomosa.com' % i])
+            client.add_team(team)
+            process = flomosa.Process(name='Process %d' % i,
+                key='load-process-%d' % i)
+            previous = None
+            for j in xrange(num_steps):
+                step = process.add_step('Step %d' % j, team=team.key,
+                    is_start=not j)
+                if previous is not None:
+                    previous.add_action('Approved', next_step=step)
+                previous = step
+            previous.add_action('Done', is_complete=True)
+            client.add_process(process)
+            self.teams.append(team)
+            self.processes.append(process)
+        client.close()
+        self.requests = []
+        for i in xrange(num_requests):
+            process = rng.choice(self.processes)
+            request = server.add_request(process.key,
+                timestamp=now - rng.uniform(0, 86400),
+                seconds=rng.expovariate(1 / 60.0))
+            self.requests.append(request['key'])
+
+
+def call(client, name, fixture, rng):
+    if name == 'get_process':
+        client.get_process(rng.choice(fixture.processes).key)
+    elif name == 'add_process':
+        client.add_process(rng.choice(fixture.processes), force=True)
+    elif name == 'get_team':
+        client.get_team(rng.choice(fixture.teams).key)
+    elif name == 'get_request':
+        client.get_request(rng.choice(fixture.requests))
+    elif name == 'search_process':
+        client.search_process(rng.choice(fixture.processes).key,
+            start=time.time() - 86400)
+    elif name == 'get_day_stats':
+        today = time.gmtime()
+        client.get_day_stats(rng.choice(fixture.processes).key,
+            today.tm_year, today.tm_mon, today.tm_mday)
+    else:
+        raise ValueError('Unknown call "%s"' % name)
+
+
+def worker(server, fixture, mix, deadline, instrument, seed, throttle):
+    rng = random.Random(seed)
+    names = []
+    for name, weight in sorted(mix.items()):
+        names.extend([name] * weight)
+    client = flomosa.Client(KEY, SECRET, host=server.host, port=server.port,
+        pool_size=1, throttle=throttle, instrument=instrument)
+    try:
+        while time.time() < deadline:
+            try:
+                call(client, rng.choice(names), fixture, rng)
+            except flomosa.APIError:
+                pass
+    finally:
+        client.close()
+
+
+def run(clients=8, seconds=5.0, mix=MIX, latency=0.0, jitter=0.0,
+    error_rate=0.0, seed=0, throttle=True):
+    """Run the load test and return a summary dict."""
+    server = StandInServer(consumers={KEY: SECRET}, latency=0.0,
+        seed=seed).start()
+    try:
+        fixture = Fixture(server, seed=seed)
+        server.latency = latency
+        server.jitter = jitter
+        server.error_rate = error_rate
+        instrument = Histograms()
+        deadline = time.time() + seconds
+        started = time.time()
+        threads = [threading.Thread(target=worker, args=(server, fixture,
+            mix, deadline, instrument, seed + i + 1, throttle))
+            for i in xrange(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - started
+    finally:
+        server.stop()
+
+    endpoints = instrument.summary()
+    total = 0
+    for summary in endpoints.itervalues():
+        summary['throughput'] = summary['requests'] / elapsed
+        total += summary['requests']
+    return {
+        'clients': clients,
+        'seconds': elapsed,
+        'requests': total,
+        'throughput': total / elapsed,
+        'latency': latency,
+        'jitter': jitter,
+        'error_rate': error_rate,
+        'endpoints': endpoints
+    }
+
+
+def report(result, out=sys.stdout):
+    out.write('%d clients, %d requests in %.1fs, %.1f requests/s\n\n' % (
+        result['clients'], result['requests'], result['seconds'],
+        result['throughput']))
+    out.write('%-16s %8s %8s %6s %7s %8s %8s %8s %8s\n' % ('endpoint',
+        'requests', 'req/s', 'errors', 'retries', 'p50 ms', 'p95 ms',
+        'p99 ms', 'max ms'))
+    for endpoint, summary in sorted(result['endpoints'].items()):
+        out.write('%-16s %8d %8.1f %6d %7d %8.2f %8.2f %8.2f %8.2f\n' % (
+            endpoint, summary['requests'], summary['throughput'],
+            summary['errors'], summary['retries'], summary['p50'] * 1000,
+            summary['p95'] * 1000, summary['p99'] * 1000,
+            summary['max'] * 1000))
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        name, sep, weight = item.partition('=')
+        if name not in MIX:
+            raise ValueError('Unknown call "%s"' % name)
+        mix[name] = int(weight or 1)
+    return mix
+
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-c', '--clients', type='int', default=8,
+        help='concurrent clients')
+    parser.add_option('-s', '--seconds', type='float', default=5.0,
+        help='how long to run')
+    parser.add_option('--mix', default=None,
+        help='calls and weights, e.g. get_process=3,get_team=1')
+    parser.add_option('--latency', type='float', default=0.0,
+        help='seconds the server waits before every response')
+    parser.add_option('--jitter', type='float', default=0.0,
+        help='up to this many more seconds of random delay')
+    parser.add_option('--error-rate', type='float', default=0.0,
+        help='fraction of requests answered with 503')
+    parser.add_option('--no-throttle', action='store_true', default=False,
+        help='do not retry or limit concurrency in the clients')
+    parser.add_option('--seed', type='int', default=0)
+    parser.add_option('--json', action='store_true', default=False,
+        help='print the results as JSON')
+    options, args = parser.parse_args()
+
+    mix = MIX
+    if options.mix:
+        try:
+            mix = parse_mix(options.mix)
+        except ValueError, e:
+            parser.error(str(e))
+    result = run(options.clients, options.seconds, mix, options.latency,
+        options.jitter, options.error_rate, options.seed,
+        not options.no_throttle)
+    if options.json:
+        print(json.dumps(result, indent=1, sort_keys=True))
+    else:
+        report(result)
+
+if __name__ == '__main__':
+    main()
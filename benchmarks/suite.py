@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+"""Time and peak memory of model building, serialization and request signing.
+
+Every benchmark runs at each size in its own interpreter, so peak memory is
+not hidden by an earlier run. Nothing touches the network: the request
+benchmarks use a Client whose transport echoes the request body back.
+
+    python benchmarks/suite.py -o results.json
+    python benchmarks/suite.py -b to_json,from_dict -s 10,1000
+    python benchmarks/suite.py --compare old.json new.json
+
+Size is the number of steps in the process, or the number of requests for
+sign and request. Results are written as JSON with one entry per benchmark
+and size, sorted, with seconds per call to the benchmark and peak_kb, how
+far the first call raised the peak RSS above that of its setup. Small sizes
+often fit in memory the interpreter already holds and report 0.
+"""
+
+import gc
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from optparse import OptionParser, SUPPRESS_HELP
+sys.path[0:0] = [os.path.join(os.path.dirname(__file__), '..'),]
+
+import flomosa
+from flomosa.simulation import Simulator
+
+FORMAT = 1
+SIZES = (10, 100, 1000, 10000, 100000)
+MIN_SAMPLE_SECONDS = 0.05
+STEP_MEMBERS = ['a@flomosa.com', 'b@flomosa.com']
+
+
+def build_process(size, actions=True):
+    """Return a chain of size steps, each with an approve and reject action."""
+    process = flomosa.Process(name='bench process', key='bench-process')
+    steps = [process.add_step('Step %d' % i, members=STEP_MEMBERS,
+        team='bench-team', is_start=not i) for i in xrange(size)]
+    if actions:
+        link(steps)
+    return process, steps
+
+
+def link(steps):
+    for i, step in enumerate(steps):
+        if i + 1 < len(steps):
+            step.add_action('Approved', next_step=steps[i + 1])
+        else:
+            step.add_action('Approved', is_complete=True)
+        step.add_action('Rejected', is_complete=True)
+
+
+class EchoClient(flomosa.Client):
+    """Answers every request with its own body instead of sending it."""
+
+    def _send(self, endpoint, method, body, headers):
+        return {'status': '200'}, body or '{}'
+
+
+def setup_add_step(size):
+    return size
+
+
+def run_add_step(size):
+    build_process(size, actions=False)
+
+
+def setup_add_action(size):
+    return build_process(size, actions=False)[1]
+
+
+def run_add_action(steps):
+    link(steps)
+
+
+def setup_process(size):
+    return build_process(size)[0]
+
+
+def run_to_dict(process):
+    process.to_dict()
+
+
+def run_to_json(process):
+    process.to_json()
+
+
+def setup_from_dict(size):
+    return build_process(size)[0].to_dict()
+
+
+def run_from_dict(data):
+    flomosa.Process.from_dict(data)
+
+
+def run_to_dot(process):
+    process.to_dot()
+
+
+def run_analyze(process):
+    process.analyze()
+
+
+def setup_simulate(size):
+    process = build_process(20)[0]
+    simulator = Simulator(process, dict([(action, 0.05) for action in
+        process._actions.itervalues() if action.name == 'Rejected']),
+        default_service=('exponential', 60.0))
+    return simulator, size
+
+
+def run_simulate(state):
+    simulator, size = state
+    simulator.run(size, seed=0)
+
+
+def setup_steps(size):
+    process, steps = build_process(size)
+    return steps
+
+
+def run_get_actions_by_name(steps):
+    for step in steps:
+        step.get_actions_by_name('Approved')
+
+
+def setup_client(size):
+    client = EchoClient('bench-key', 'bench-secret', host='127.0.0.1',
+        port=8080, throttle=False)
+    return client, client.endpoint('stats_day', key='bench'), size
+
+
+def run_sign(state):
+    client, url, size = state
+    params = {'year': 2010, 'month': 4, 'day': 20}
+    for i in xrange(size):
+        client.signer.sign('GET', url, params)
+
+
+def run_request(state):
+    client, url, size = state
+    params = {'year': 2010, 'month': 4, 'day': 20}
+    for i in xrange(size):
+        client._request(url, 'GET', params)
+
+
+# name -> (setup, run, mutates). When mutates is set, setup runs again
+# before every timed call.
+BENCHMARKS = {
+    'add_step': (setup_add_step, run_add_step, False),
+    'add_action': (setup_add_action, run_add_action, True),
+    'to_dict': (setup_process, run_to_dict, False),
+    'to_json': (setup_process, run_to_json, False),
+    'from_dict': (setup_from_dict, run_from_dict, False),
+    'to_dot': (setup_process, run_to_dot, False),
+    'analyze': (setup_process, run_analyze, False),
+    'simulate': (setup_simulate, run_simulate, False),
+    'get_actions_by_name': (setup_steps, run_get_actions_by_name, False),
+    'sign': (setup_client, run_sign, False),
+    'request': (setup_client, run_request, False)
+}
+
+
+def peak_kb():
+    """Return the peak resident set size of this process in kilobytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak // 1024
+    return peak
+
+
+def measure(name, size, repeat):
+    """Time one benchmark at one size in this process and return a result."""
+    setup, run, mutates = BENCHMARKS[name]
+    state = setup(size)
+    gc.collect()
+    before = peak_kb()
+    start = time.time()
+    run(state)
+    first = time.time() - start
+    peak = peak_kb() - before
+
+    number = 1
+    if not mutates:
+        while first * number < MIN_SAMPLE_SECONDS and number < 1000000:
+            number *= 2
+    samples = []
+    for i in xrange(repeat):
+        if mutates:
+            state = setup(size)
+        gc.collect()
+        start = time.time()
+        for j in xrange(number):
+            run(state)
+        samples.append((time.time() - start) / number)
+    samples.sort()
+    return {
+        'benchmark': name,
+        'size': size,
+        'number': number,
+        'repeat': repeat,
+        'min': samples[0],
+        'median': samples[len(samples) // 2],
+        'max': samples[-1],
+        'peak_kb': peak
+    }
+
+
+def run_isolated(name, size, repeat):
+    """Run measure() in a fresh interpreter and return its result."""
+    output = subprocess.check_output([sys.executable, __file__, '--child',
+        name, str(size), str(repeat)])
+    return json.loads(output)
+
+
+def commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(names, sizes, repeat, log=sys.stderr):
+    results = []
+    for name in names:
+        for size in sizes:
+            result = run_isolated(name, size, repeat)
+            log.write('%-20s %7d %12.6f s %10d KB\n' % (name, size,
+                result['min'], result['peak_kb']))
+            results.append(result)
+    results.sort(key=lambda result: (result['benchmark'], result['size']))
+    return {
+        'format': FORMAT,
+        'commit': commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'results': results
+    }
+
+
+def load(path):
+    fp = open(path, 'rb')
+    try:
+        data = json.load(fp)
+    finally:
+        fp.close()
+    if data.get('format') != FORMAT:
+        raise ValueError('%s is not a format %d result file' % (path, FORMAT))
+    return data
+
+
+def compare(old, new, threshold):
+    """Print min time and peak memory ratios; return the regressions."""
+    before = {}
+    for result in old['results']:
+        before[(result['benchmark'], result['size'])] = result
+    print('%-20s %7s %10s %10s' % ('benchmark', 'size', 'time', 'memory'))
+    regressions = []
+    for result in new['results']:
+        key = (result['benchmark'], result['size'])
+        if key not in before:
+            continue
+        time_ratio = result['min'] / max(before[key]['min'], 1e-9)
+        memory_ratio = (result['peak_kb'] + 1.0) / (before[key]['peak_kb'] + 1)
+        flag = ''
+        if time_ratio > threshold:
+            flag = ' slower'
+            regressions.append(key)
+        print('%-20s %7d %9.2fx %9.2fx%s' % (key + (time_ratio,
+            memory_ratio, flag)))
+    return regressions
+
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-b', '--benchmarks', default=None,
+        help='comma separated benchmarks, default all')
+    parser.add_option('-s', '--sizes', default=None,
+        help='comma separated sizes, default %s' %
+            ','.join([str(size) for size in SIZES]))
+    parser.add_option('-r', '--repeat', type='int', default=5,
+        help='timed samples per benchmark and size')
+    parser.add_option('-o', '--output', default=None,
+        help='write the results to this file instead of stdout')
+    parser.add_option('--compare', nargs=2, default=None,
+        help='compare two result files')
+    parser.add_option('--threshold', type='float', default=1.1,
+        help='time ratio reported as a regression by --compare')
+    parser.add_option('--child', nargs=3, default=None,
+        help=SUPPRESS_HELP)
+    options, args = parser.parse_args()
+
+    if options.child:
+        name, size, repeat = options.child
+        print(json.dumps(measure(name, int(size), int(repeat))))
+        return
+    if options.compare:
+        old, new = [load(path) for path in options.compare]
+        if compare(old, new, options.threshold):
+            sys.exit(1)
+        return
+
+    names = sorted(BENCHMARKS)
+    if options.benchmarks:
+        names = options.benchmarks.split(',')
+        for name in names:
+            if name not in BENCHMARKS:
+                parser.error('unknown benchmark "%s"' % name)
+    sizes = SIZES
+    if options.sizes:
+        sizes = [int(size) for size in options.sizes.split(',')]
+    data = json.dumps(run_suite(names, sizes, options.repeat), indent=1,
+        sort_keys=True)
+    if options.output:
+        fp = open(options.output, 'wb')
+        try:
+            fp.write(data + '\n')
+        finally:
+            fp.close()
+    else:
+        print(data)
+
+if __name__ == '__main__':
+    main()
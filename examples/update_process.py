@@ -47,7 +47,8 @@ print('###########################')
 
 print('###########################')
 
-#resp = client.add_process(process)
+#pprint(process.changes())
+#resp = client.add_process(process) # None when nothing changed
 
 process = client.get_process('test')
 
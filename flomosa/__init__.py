@@ -22,13 +22,22 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
-import uuid
-import urllib
+import datetime
+import os
 import time
-import oauth2 as oauth
-from httplib2 import Http
+import threading
+import weakref
+from binascii import hexlify
+from collections import OrderedDict
+from hashlib import sha1
+from itertools import chain
+from StringIO import StringIO
 from urlparse import urljoin
 
+from flomosa import analysis, codec, simulation
+from flomosa.stats import GRANULARITIES, METRICS, StatsCache, StatsSeries, \
+    period_end, period_of, period_start, periods, rollup, to_date
+
 try:
     import json
 except ImportError:
@@ -36,12 +45,321 @@ except ImportError:
 
 API_VERSION = '0.1'
 
-_PROCESSES = {}
-_TEAMS = {}
 
 def generate_key():
     """Generate a unique UUID"""
-    return str(uuid.uuid4())
+    # A version 4 UUID, like str(uuid.uuid4()) without importing uuid.
+    data = bytearray(os.urandom(16))
+    data[6] = data[6] & 0x0f | 0x40
+    data[8] = data[8] & 0x3f | 0x80
+    value = hexlify(str(data))
+    return '%s-%s-%s-%s-%s' % (value[:8], value[8:12], value[12:16],
+        value[16:20], value[20:])
+
+
+def intern_key(key):
+    """Return key as an interned str when it is plain ASCII."""
+    if isinstance(key, basestring):
+        try:
+            return intern(str(key))
+        except UnicodeEncodeError:
+            pass
+    return key
+
+
+_MISSING = object()
+
+class SmallDict(object):
+    """Dict-like mapping that holds a single item without allocating a dict.
+
+    Most actions have exactly one incoming and one outgoing step, and most
+    index buckets hold one entry, so this saves a dict per mapping.
+    """
+
+    __slots__ = ('_key', '_value', '_dict')
+
+    def __init__(self, items=None):
+        self._key = _MISSING
+        self._value = None
+        self._dict = None
+        if items:
+            for key, value in items:
+                self[key] = value
+
+    def __len__(self):
+        if self._dict is not None:
+            return len(self._dict)
+        return int(self._key is not _MISSING)
+
+    def __nonzero__(self):
+        return len(self) > 0
+
+    def __contains__(self, key):
+        if self._dict is not None:
+            return key in self._dict
+        return self._key is not _MISSING and self._key == key
+
+    def __getitem__(self, key):
+        if self._dict is not None:
+            return self._dict[key]
+        if self._key is not _MISSING and self._key == key:
+            return self._value
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if self._dict is not None:
+            self._dict[key] = value
+        elif self._key is _MISSING or self._key == key:
+            self._key = key
+            self._value = value
+        else:
+            self._dict = {self._key: self._value, key: value}
+            self._key = _MISSING
+            self._value = None
+
+    def __delitem__(self, key):
+        if self._dict is not None:
+            del self._dict[key]
+            if len(self._dict) == 1:
+                self._key, self._value = self._dict.popitem()
+                self._dict = None
+        elif self._key is not _MISSING and self._key == key:
+            self._key = _MISSING
+            self._value = None
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        return self.iterkeys()
+
+    def __eq__(self, other):
+        if isinstance(other, SmallDict):
+            other = dict(other.iteritems())
+        return dict(self.iteritems()) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(dict(self.iteritems()))
+
+    def get(self, key, default=None):
+        if self._dict is not None:
+            return self._dict.get(key, default)
+        if self._key is not _MISSING and self._key == key:
+            return self._value
+        return default
+
+    def pop(self, key, *default):
+        try:
+            value = self[key]
+        except KeyError:
+            if default:
+                return default[0]
+            raise
+        del self[key]
+        return value
+
+    def iteritems(self):
+        if self._dict is not None:
+            return self._dict.iteritems()
+        elif self._key is not _MISSING:
+            return iter(((self._key, self._value),))
+        return iter(())
+
+    def iterkeys(self):
+        for key, value in self.iteritems():
+            yield key
+
+    def itervalues(self):
+        for key, value in self.iteritems():
+            yield value
+
+    def items(self):
+        if self._dict is not None:
+            return self._dict.items()
+        elif self._key is not _MISSING:
+            return [(self._key, self._value)]
+        return []
+
+    def keys(self):
+        if self._dict is not None:
+            return self._dict.keys()
+        elif self._key is not _MISSING:
+            return [self._key]
+        return []
+
+    def values(self):
+        if self._dict is not None:
+            return self._dict.values()
+        elif self._key is not _MISSING:
+            return [self._value]
+        return []
+
+
+def _dot_escape(value):
+    return value.replace('"', '\\"')
+
+
+def _dot_node(step):
+    return '"%s" [label="%s"]\n' % (step.key, _dot_escape(step.name))
+
+
+def _tracked(name):
+    """Property stored in _<name> that reports changes to _changed()."""
+    attr = '_' + name
+
+    def get(self):
+        return getattr(self, attr)
+
+    def set(self, value):
+        old = getattr(self, attr, _MISSING)
+        setattr(self, attr, value)
+        if old is not _MISSING and old != value:
+            self._changed(name, old, value)
+
+    return property(get, set)
+
+
+def _result_id(result):
+    try:
+        return result['key']
+    except (KeyError, TypeError):
+        return json.dumps(result, sort_keys=True)
+
+
+def _index_add(index, key, item_key, item):
+    """Add item to the SmallDict kept in index under key."""
+    bucket = index.get(key, None)
+    if bucket is None:
+        # Most buckets hold one item, built here without a __setitem__.
+        bucket = index[key] = SmallDict.__new__(SmallDict)
+        bucket._key = item_key
+        bucket._value = item
+        bucket._dict = None
+    else:
+        bucket[item_key] = item
+
+
+def _lazy_index(position):
+    """Property for one of the step indexes, built when first used."""
+    def get(self):
+        indexes = self._indexes
+        if indexes is None:
+            indexes = self._indexes = self._build_indexes()
+        return indexes[position]
+    return property(get)
+
+
+class Registry(object):
+    """Map keys to live objects without keeping every object alive.
+
+    Objects are held weakly, so an entry disappears once nothing else
+    references it. The maxsize most recently used objects are also held
+    strongly, so they can still be found by key after the caller drops them.
+    """
+
+    def __init__(self, maxsize=100):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._refs = weakref.WeakValueDictionary()
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._refs)
+
+    def __contains__(self, key):
+        return key in self._refs
+
+    def __getitem__(self, key):
+        obj = self.get(key, None)
+        if obj is None:
+            raise KeyError(key)
+        return obj
+
+    def __setitem__(self, key, obj):
+        self._lock.acquire()
+        try:
+            self._refs[key] = obj
+            self._touch(key, obj)
+        finally:
+            self._lock.release()
+
+    def __delitem__(self, key):
+        self._lock.acquire()
+        try:
+            self._recent.pop(key, None)
+            del self._refs[key]
+        finally:
+            self._lock.release()
+
+    def get(self, key, default=None):
+        """Return the live object for key, or default."""
+        self._lock.acquire()
+        try:
+            obj = self._refs.get(key, None)
+            if obj is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._touch(key, obj)
+            return obj
+        finally:
+            self._lock.release()
+
+    def _touch(self, key, obj):
+        self._recent.pop(key, None)
+        if self.maxsize <= 0:
+            return
+        self._recent[key] = obj
+        while len(self._recent) > self.maxsize:
+            self._recent.popitem(last=False)
+            self.evicted += 1
+
+    def resize(self, maxsize):
+        """Change how many recently used objects are held strongly."""
+        self._lock.acquire()
+        try:
+            self.maxsize = maxsize
+            while len(self._recent) > max(maxsize, 0):
+                self._recent.popitem(last=False)
+                self.evicted += 1
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        """Forget every object."""
+        self._lock.acquire()
+        try:
+            self._recent.clear()
+            self._refs.clear()
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        """Return a dict of registry counters."""
+        return {
+            'live': len(self._refs),
+            'retained': len(self._recent),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evicted': self.evicted
+        }
+
+
+_PROCESSES = Registry()
+_TEAMS = Registry()
+
+def registry_stats():
+    """Return memory counters for the Process and Team registries."""
+    return {
+        'processes': _PROCESSES.stats(),
+        'teams': _TEAMS.stats()
+    }
 
 
 class APIError(Exception):
@@ -83,13 +401,34 @@ class DecodeError(APIError):
 class Process(object):
     """Flomosa Process object"""
 
+    __slots__ = ('key', '_name', '_description', '_collect_stats', '_steps',
+        '_actions', '_indexes', '_saved_hash', '_changes', '__weakref__')
+
+    name = _tracked('name')
+    description = _tracked('description')
+    collect_stats = _tracked('collect_stats')
+    # step name -> {step key: step}
+    _steps_by_name = _lazy_index(0)
+    # step key -> {action key: action} for actions leaving the step
+    _step_outgoing = _lazy_index(1)
+    # step key -> {action key: action} for actions entering the step
+    _step_incoming = _lazy_index(2)
+    # (step key, action name) -> {action key: action}
+    _step_actions = _lazy_index(3)
+
     def __init__(self, name, description=None, collect_stats=False, key=None):
-        self.key = key or generate_key()
+        self.key = intern_key(key) or generate_key()
+        # Digest of the definition last saved to or loaded from the server.
+        self._saved_hash = None
+        # (operation, key, detail) tuples for the edits since then.
+        self._changes = []
         self.name = name
         self.description = description
         self.collect_stats = collect_stats
         self._steps = {}
         self._actions = {}
+        # The step indexes below, None when they have to be rebuilt.
+        self._indexes = ({}, {}, {}, {})
 
         if not self.name or not self.key:
             raise ValueError('Name and Key must be set.')
@@ -120,51 +459,288 @@ class Process(object):
             description=description,
             collect_stats=collect_stats,
             key=process_key)
-        for step_data in data.get('steps', []):
-            step = Step.from_dict(step_data)
-            process._steps[step.key] = step
-        for action_data in data.get('actions', []):
-            action = Action.from_dict(action_data)
-            process._actions[action.key] = action
-
+        process._load_graph(data)
         return process
 
+    def update_from_dict(self, data):
+        """Replace this process's fields, steps and actions in place."""
+        if not data or not isinstance(data, dict):
+            raise ValueError('Invalid process data.')
+        name = data.get('name', None)
+        if not name:
+            raise ValueError('Name and Key must be set.')
+        self.name = name
+        self.description = data.get('description', None)
+        self.collect_stats = data.get('collect_stats', False)
+        self._steps.clear()
+        self._actions.clear()
+        self._load_graph(data)
+        self._log('update_from_dict', self.key)
+
+    def _load_graph(self, data):
+        self._load(data.get('steps', []), data.get('actions', []))
+
+    @classmethod
+    def load_many(cls, items):
+        """Iterate over processes built from dicts or JSON strings.
+
+        Accepts any iterable, such as a list response from the API, and
+        skips entries that are not process objects.
+        """
+        for data in items:
+            if isinstance(data, basestring):
+                data = codec.loads(data)
+            if not isinstance(data, dict) or \
+                data.get('kind', 'Process') != 'Process':
+                continue
+            yield cls.from_dict(data)
+
+    @classmethod
+    def load_json_lines(cls, fp):
+        """Iterate over processes read from a file with one JSON per line."""
+        return cls.load_many(line for line in fp if line.strip())
+
+    def _load(self, steps, actions):
+        """Add steps and actions from their dicts in one pass.
+
+        References are resolved against this process directly, and objects
+        are built without going through the validating constructors. The
+        step indexes are left to be built when first used.
+        """
+        process_key = self.key
+        all_steps = self._steps
+        all_actions = self._actions
+        self._indexes = None
+        for data in steps:
+            if not isinstance(data, dict):
+                raise ValueError('Invalid step data %r.' % (data,))
+            name = data.get('name', None)
+            if not name:
+                raise ValueError('Process, Name and Key must be set.')
+            if data.get('process', process_key) != process_key:
+                raise ValueError('Step "%s" belongs to process "%s".' %
+                    (data.get('key', None), data['process']))
+            step = Step.__new__(Step)
+            step.key = intern_key(data.get('key', None)) or generate_key()
+            step.process = self
+            step._name = name
+            step._description = data.get('description', None)
+            step._is_start = bool(data.get('is_start', None))
+            step._members = data.get('members', None) or []
+            step._team = data.get('team', None)
+            all_steps[step.key] = step
+
+        for data in actions:
+            if not isinstance(data, dict):
+                raise ValueError('Invalid action data %r.' % (data,))
+            name = data.get('name', None)
+            if not name:
+                raise ValueError('Process, Name and Key must be set.')
+            if data.get('process', process_key) != process_key:
+                raise ValueError('Action "%s" belongs to process "%s".' %
+                    (data.get('key', None), data['process']))
+            action = Action.__new__(Action)
+            action.key = intern_key(data.get('key', None)) or generate_key()
+            action.process = self
+            action._name = name
+            action._incoming = SmallDict()
+            action._outgoing = SmallDict()
+            try:
+                for step_key in data.get('incoming', []):
+                    step = all_steps[step_key]
+                    action._incoming[step.key] = step
+                for step_key in data.get('outgoing', []):
+                    step = all_steps[step_key]
+                    action._outgoing[step.key] = step
+            except (KeyError, TypeError):
+                raise ValueError('Step "%s" not found.' % (step_key,))
+            action._is_complete = bool(data.get('is_complete', None)) and \
+                not action._outgoing
+            all_actions[action.key] = action
+
+    def _build_indexes(self):
+        steps_by_name, step_outgoing, step_incoming, step_actions = \
+            indexes = ({}, {}, {}, {})
+        for step in self._steps.itervalues():
+            _index_add(steps_by_name, step._name, step.key, step)
+        for action in self._actions.itervalues():
+            action_key = action.key
+            name = action._name
+            for step_key in action._incoming.keys():
+                _index_add(step_outgoing, step_key, action_key, action)
+                _index_add(step_actions, (step_key, name), action_key, action)
+            for step_key in action._outgoing.keys():
+                _index_add(step_incoming, step_key, action_key, action)
+        return indexes
+
     def to_dict(self):
         """Return process as a dict object."""
+        return self._to_dict(
+            [step.to_dict() for step in self._steps.itervalues()],
+            [action.to_dict() for action in self._actions.itervalues()])
+
+    def _to_dict(self, steps, actions):
         return {
             'kind': 'Process',
             'key': self.key,
             'name': self.name,
             'description': self.description,
             'collect_stats': self.collect_stats,
-            'steps': [step.to_dict() for step in self._steps.itervalues()],
-            'actions': [action.to_dict() for action in
-                self._actions.itervalues()]
+            'steps': steps,
+            'actions': actions
         }
 
     def to_json(self):
         """Return process as a JSON string."""
-        return json.dumps(self.to_dict())
+        return codec.dumps(self.to_dict())
+
+    def iter_json(self, chunk_size=65536):
+        """Yield the process as JSON in chunks of about chunk_size bytes.
+
+        The joined chunks hold the same JSON as to_json(), byte for byte
+        with the stdlib codec, but only one step or action dict exists at a
+        time.
+        """
+        children = {
+            'steps': self._steps.itervalues,
+            'actions': self._actions.itervalues
+        }
+        pieces = ['{']
+        size = 1
+        separator = ''
+        # Same keys inserted in the same order as to_dict(), so the fields
+        # come out in the same order as the codec would write them.
+        for name, value in self._to_dict(None, None).iteritems():
+            pieces.append('%s%s: ' % (separator, codec.dumps(name)))
+            separator = ', '
+            if name not in children:
+                pieces.append(codec.dumps(value))
+                continue
+            item_separator = '['
+            for child in children[name]():
+                piece = item_separator + codec.dumps(child.to_dict())
+                item_separator = ', '
+                pieces.append(piece)
+                size += len(piece)
+                if size >= chunk_size:
+                    yield ''.join(pieces)
+                    pieces = []
+                    size = 0
+            if item_separator == '[':
+                pieces.append('[]')
+            else:
+                pieces.append(']')
+        pieces.append('}')
+        yield ''.join(pieces)
+
+    def dump_json(self, fp, chunk_size=65536):
+        """Write the process as JSON to a file-like object."""
+        for chunk in self.iter_json(chunk_size):
+            fp.write(chunk)
 
     def to_dot(self):
         """Return process as a Dot graph string."""
-        nodes = ''
-        for step_key, step in self._steps.iteritems():
-            nodes += '"%s" [label="%s"]\n' % (step_key, step.name)
-        nodes += '"finish" [label="Finish"]\n'
-
-        actions = ''
-        for action_key, action in self._actions.iteritems():
-            for incoming_key, incoming in action._incoming.iteritems():
-                if action.is_complete:
-                    actions += '"%s" -> "finish" [label="%s"]\n' % \
-                        (incoming_key, action.name)
+        out = StringIO()
+        self.write_dot(out)
+        return out.getvalue()
+
+    def write_dot(self, fp, collapse=False, cluster_by_team=False,
+        around=None, depth=1):
+        """Write process as a Dot graph to a file-like object.
+
+        collapse merges parallel edges between two steps into one edge
+        labelled with every action name. cluster_by_team draws the steps of
+        each team inside their own cluster. around limits the graph to the
+        steps within depth actions of the given Step or step key.
+        """
+        write = fp.write
+        include = None
+        if around is not None:
+            if not isinstance(around, Step):
+                around = self._steps[around]
+            include = self._neighborhood(around, depth)
+
+        steps = self._steps.itervalues()
+        if include is not None:
+            steps = [step for step in steps if step.key in include]
+
+        write('digraph "%s" {\n' % _dot_escape(self.name))
+        if cluster_by_team:
+            teams = OrderedDict()
+            for step in steps:
+                if step.team is None:
+                    write(_dot_node(step))
+                else:
+                    teams.setdefault(step.team, []).append(step)
+            for team, team_steps in teams.iteritems():
+                if isinstance(team, Team):
+                    team_key, team_name = team.key, team.name
                 else:
-                    for outgoing_key, outgoing in action._outgoing.iteritems():
-                        actions += '"%s" -> "%s" [label="%s"]\n' % \
-                            (incoming_key, outgoing_key, action.name)
+                    team_key, team_name = team, team
+                write('subgraph "cluster_%s" {\nlabel="%s"\n' %
+                    (_dot_escape(team_key), _dot_escape(team_name)))
+                for step in team_steps:
+                    write(_dot_node(step))
+                write('}\n')
+        else:
+            for step in steps:
+                write(_dot_node(step))
+        write('"finish" [label="Finish"]\n')
+        write('\n')
 
-        return 'digraph "%s" {\n%s\n%s}' % (self.name, nodes, actions)
+        if collapse:
+            self._write_collapsed_edges(write, include)
+        else:
+            for action in self._actions.itervalues():
+                name = _dot_escape(action.name)
+                for incoming_key in action._incoming.iterkeys():
+                    if include is not None and incoming_key not in include:
+                        continue
+                    if action.is_complete:
+                        write('"%s" -> "finish" [label="%s"]\n' %
+                            (incoming_key, name))
+                        continue
+                    for outgoing_key in action._outgoing.iterkeys():
+                        if include is None or outgoing_key in include:
+                            write('"%s" -> "%s" [label="%s"]\n' %
+                                (incoming_key, outgoing_key, name))
+        write('}')
+
+    def _write_collapsed_edges(self, write, include):
+        for step_key in self._steps.iterkeys():
+            if include is not None and step_key not in include:
+                continue
+            targets = OrderedDict()
+            for action in self._step_outgoing.get(step_key, {}).itervalues():
+                if action.is_complete:
+                    target_keys = ['finish']
+                else:
+                    target_keys = action._outgoing.iterkeys()
+                for target_key in target_keys:
+                    if include is not None and target_key != 'finish' and \
+                        target_key not in include:
+                        continue
+                    names = targets.setdefault(target_key, [])
+                    if action.name not in names:
+                        names.append(action.name)
+            for target_key, names in targets.iteritems():
+                write('"%s" -> "%s" [label="%s"]\n' % (step_key, target_key,
+                    _dot_escape(', '.join(names))))
+
+    def _neighborhood(self, step, depth):
+        """Return the keys of the steps within depth actions of step."""
+        keys = set([step.key])
+        frontier = [step]
+        for i in xrange(depth):
+            next_frontier = []
+            for current in frontier:
+                for other in chain(current.next_steps(),
+                    current.previous_steps()):
+                    if other.key not in keys:
+                        keys.add(other.key)
+                        next_frontier.append(other)
+            frontier = next_frontier
+        return keys
 
     def add_step(self, name, team=None, members=None, is_start=False, key=None):
         """Add a step to this process."""
@@ -177,29 +753,171 @@ class Process(object):
 
     def get_steps_by_name(self, name):
         """Return the steps matching a given name."""
-        steps = []
-        for step in self._steps.values():
-            if isinstance(step, Step) and step.name == name:
-                steps.append(step)
+        steps = self._steps_by_name.get(name, {}).values()
         if len(steps) == 1:
             return steps[0]
         return steps
 
+    def delete_step(self, step):
+        """Delete a step and remove it from every action that uses it.
+
+        Actions left without any incoming step are deleted as well.
+        """
+        if self._steps.get(step.key, None) is not step:
+            return
+        del self._steps[step.key]
+        self._unindex_step_name(step, step.name)
+        self._log('delete_step', step.key, step.name)
+
+        for action in self._step_outgoing.pop(step.key, {}).values():
+            del action._incoming[step.key]
+            actions = self._step_actions.get((step.key, action.name), None)
+            if actions is not None:
+                actions.pop(action.key, None)
+                if not actions:
+                    del self._step_actions[(step.key, action.name)]
+            if not action._incoming:
+                self._unindex_action(action)
+                del self._actions[action.key]
+                self._log('delete_action', action.key, action.name)
+        for action in self._step_incoming.pop(step.key, {}).values():
+            del action._outgoing[step.key]
+
+    def _add_step(self, step):
+        old = self._steps.get(step.key, None)
+        if old is not None and old is not step:
+            self._unindex_step_name(old, old.name)
+        self._steps[step.key] = step
+        _index_add(self._steps_by_name, step.name, step.key, step)
+
+    def _unindex_step_name(self, step, name):
+        steps = self._steps_by_name.get(name, None)
+        if steps is not None and steps.get(step.key, None) is step:
+            del steps[step.key]
+            if not steps:
+                del self._steps_by_name[name]
+
+    def _rename_step(self, step, old_name):
+        self._unindex_step_name(step, old_name)
+        _index_add(self._steps_by_name, step.name, step.key, step)
+
+    def _add_action(self, action):
+        old = self._actions.get(action.key, None)
+        if old is not None and old is not action:
+            self._unindex_action(old)
+        self._actions[action.key] = action
+
+    def _index_incoming_step(self, action, step):
+        _index_add(self._step_outgoing, step.key, action.key, action)
+        _index_add(self._step_actions, (step.key, action.name), action.key,
+            action)
+
+    def _index_outgoing_step(self, action, step):
+        _index_add(self._step_incoming, step.key, action.key, action)
+
+    def _rename_action(self, action, old_name):
+        for step_key in action._incoming:
+            actions = self._step_actions.get((step_key, old_name), None)
+            if actions is not None:
+                actions.pop(action.key, None)
+                if not actions:
+                    del self._step_actions[(step_key, old_name)]
+            _index_add(self._step_actions, (step_key, action.name),
+                action.key, action)
+
+    def _unindex_action(self, action):
+        for step_key in action._incoming:
+            for index, index_key in ((self._step_outgoing, step_key),
+                (self._step_actions, (step_key, action.name))):
+                actions = index.get(index_key, None)
+                if actions is not None:
+                    actions.pop(action.key, None)
+                    if not actions:
+                        del index[index_key]
+        for step_key in action._outgoing:
+            actions = self._step_incoming.get(step_key, None)
+            if actions is not None:
+                actions.pop(action.key, None)
+                if not actions:
+                    del self._step_incoming[step_key]
+
     def delete_steps_by_name(self, name):
         """Delete all steps matching the given name."""
-        for step in self.get_steps_by_name(name):
-            try:
-                del self._steps[step.key]
-                del step
-            except:
-                pass
+        for step in self._steps_by_name.get(name, {}).values():
+            self.delete_step(step)
+
+    def _changed(self, name, old, new):
+        self._log('update_process', self.key, (name, old, new))
+
+    def _log(self, operation, key, detail=None):
+        # Until the first save everything is new, so nothing is logged.
+        if self._saved_hash is not None:
+            self._changes.append((operation, key, detail))
+
+    def changes(self):
+        """Return the edits made since the process was last saved.
+
+        Each edit is an (operation, key, detail) tuple, such as
+        ('add_step', step key, name) or ('update_step', step key,
+        (attribute, old value, new value)). Edits are listed even if later
+        ones cancel them out; use is_dirty() to know if anything differs.
+        A process that was never saved has no edits listed.
+        """
+        return list(self._changes)
+
+    def is_dirty(self):
+        """Return True if the process differs from its last saved state."""
+        return self._saved_hash is None or \
+            self.state_hash() != self._saved_hash
+
+    def mark_saved(self, digest=None):
+        """Record the current definition as the one the server has."""
+        if digest is None:
+            digest = self.state_hash()
+        self._saved_hash = digest
+        del self._changes[:]
+
+    def analyze(self):
+        """Check the step graph, returns a flomosa.analysis.Report."""
+        return analysis.analyze(self)
+
+    def simulate(self, requests, probabilities=None, service_times=None,
+        **kwargs):
+        """Simulate requests through the process, see flomosa.simulation."""
+        return simulation.simulate(self, requests, probabilities,
+            service_times, **kwargs)
+
+    def state_hash(self):
+        """Return a digest of the process, its steps and its actions.
+
+        Only meant for comparing two states of one process in memory; use
+        flomosa.sync.content_hash() for digests that are stable everywhere.
+        """
+        digest = sha1(repr((self.key, self.name, self.description,
+            bool(self.collect_stats))))
+        items = []
+        for step in self._steps.itervalues():
+            team = step.team
+            if isinstance(team, Team):
+                team = team.key
+            items.append(repr((step.key, step.name, step.description,
+                bool(step.is_start), step.members, team)))
+        for action in self._actions.itervalues():
+            items.append(repr((action.key, action.name,
+                bool(action.is_complete), sorted(action._incoming),
+                sorted(action._outgoing))))
+        items.sort()
+        digest.update('\n'.join(items))
+        return digest.hexdigest()
 
 
 class Team(object):
     """Flomosa Team object"""
 
+    __slots__ = ('key', 'name', 'description', 'members', '__weakref__')
+
     def __init__(self, name, description=None, members=None, key=None):
-        self.key = key or generate_key()
+        self.key = intern_key(key) or generate_key()
         self.name = name
         self.description = description
         self.members = members or []
@@ -233,6 +951,17 @@ class Team(object):
             key=team_key)
         return team
 
+    def update_from_dict(self, data):
+        """Replace this team's fields in place."""
+        if not data or not isinstance(data, dict):
+            raise ValueError('Invalid team data.')
+        name = data.get('name', None)
+        if not name:
+            raise ValueError('Name and Key must be set.')
+        self.name = name
+        self.description = data.get('description', None)
+        self.members = data.get('members', None) or []
+
     def to_dict(self):
         """Return team as a dict object."""
         return {
@@ -245,15 +974,23 @@ class Team(object):
 
     def to_json(self):
         """Return team as a JSON string."""
-        return json.dumps(self.to_dict())
+        return codec.dumps(self.to_dict())
 
 
 class Step(object):
     """Flomosa Step object"""
 
+    __slots__ = ('key', 'process', '_name', '_description', '_is_start',
+        '_members', '_team')
+
+    description = _tracked('description')
+    is_start = _tracked('is_start')
+    members = _tracked('members')
+    team = _tracked('team')
+
     def __init__(self, process, name, description=None, is_start=False,
         team=None, members=None, key=None):
-        self.key = key or generate_key()
+        self.key = intern_key(key) or generate_key()
         self.process = process
         self.name = name
         self.description = description
@@ -266,7 +1003,8 @@ class Step(object):
         elif not isinstance(self.process, Process):
             raise ValueError('Process must be a valid Process instance.')
         else:
-            self.process._steps[self.key] = self
+            self.process._add_step(self)
+            self.process._log('add_step', self.key, self.name)
 
     def __unicode__(self):
         return self.to_json()
@@ -318,7 +1056,27 @@ class Step(object):
 
     def to_json(self):
         """Return step as a JSON string."""
-        return json.dumps(self.to_dict())
+        return codec.dumps(self.to_dict())
+
+    def _get_name(self):
+        return self._name
+
+    def _set_name(self, name):
+        old_name = getattr(self, '_name', None)
+        self._name = name
+        process = getattr(self, 'process', None)
+        if isinstance(process, Process) and name != old_name and \
+            process._steps.get(self.key, None) is self:
+            process._rename_step(self, old_name)
+            process._log('update_step', self.key, ('name', old_name, name))
+
+    name = property(_get_name, _set_name)
+
+    def _changed(self, name, old, new):
+        process = getattr(self, 'process', None)
+        if isinstance(process, Process) and \
+            process._steps.get(self.key, None) is self:
+            process._log('update_step', self.key, (name, old, new))
 
     def add_action(self, name, next_step=None, is_complete=False, key=None):
         """Add an action after this step."""
@@ -330,19 +1088,40 @@ class Step(object):
 
     def get_actions_by_name(self, name=None):
         """Return a list object of any actions following this step."""
-        step_actions = []
-        for action in self.process._actions.itervalues():
-            if name is not None and action.name != name:
-                continue
+        if name is None:
+            actions = self.process._step_outgoing.get(self.key, {})
+        else:
+            actions = self.process._step_actions.get((self.key, name), {})
+        return actions.values()
+
+    def get_incoming_actions(self):
+        """Return a list object of any actions leading to this step."""
+        return self.process._step_incoming.get(self.key, {}).values()
+
+    def next_steps(self):
+        """Iterate over the steps reachable through one action."""
+        seen = set()
+        for action in self.get_actions_by_name():
+            for step in action._outgoing.itervalues():
+                if step.key not in seen:
+                    seen.add(step.key)
+                    yield step
+
+    def previous_steps(self):
+        """Iterate over the steps with an action leading to this step."""
+        seen = set()
+        for action in self.get_incoming_actions():
             for step in action._incoming.itervalues():
-                if step == self:
-                    step_actions.append(action)
-        return step_actions
+                if step.key not in seen:
+                    seen.add(step.key)
+                    yield step
 
     def delete_actions_by_name(self, name):
         """Delete all actions matching a given name from this step."""
         for action in self.get_actions_by_name(name):
+            self.process._unindex_action(action)
             del self.process._actions[action.key]
+            self.process._log('delete_action', action.key, action.name)
             del action
 
     def update_action(self, old_name, new_name, next_step=None,
@@ -359,20 +1138,26 @@ class Step(object):
 class Action(object):
     """Flomosa Action object"""
 
+    __slots__ = ('key', 'process', '_name', '_is_complete', '_incoming',
+        '_outgoing')
+
+    is_complete = _tracked('is_complete')
+
     def __init__(self, process, name, is_complete=False, key=None):
-        self.key = key or generate_key()
+        self._incoming = SmallDict()
+        self._outgoing = SmallDict()
+        self.key = intern_key(key) or generate_key()
         self.process = process
         self.name = name
         self.is_complete = bool(is_complete)
-        self._incoming = {}
-        self._outgoing = {}
 
         if not self.process or not self.name or not self.key:
             raise ValueError('Process, Name and Key must be set.')
         elif not isinstance(self.process, Process):
             raise ValueError('Must be a valid Process instance.')
         else:
-            self.process._actions[self.key] = self
+            self.process._add_action(self)
+            self.process._log('add_action', self.key, self.name)
 
     def __unicode__(self):
         return self.to_json()
@@ -409,11 +1194,32 @@ class Action(object):
 
         return action
 
+    def _get_name(self):
+        return self._name
+
+    def _set_name(self, name):
+        old_name = getattr(self, '_name', None)
+        self._name = name
+        if self._incoming and name != old_name:
+            self.process._rename_action(self, old_name)
+        if old_name is not None and name != old_name:
+            self._changed('name', old_name, name)
+
+    name = property(_get_name, _set_name)
+
+    def _changed(self, name, old, new):
+        process = getattr(self, 'process', None)
+        if isinstance(process, Process) and \
+            process._actions.get(self.key, None) is self:
+            process._log('update_action', self.key, (name, old, new))
+
     def add_incoming_step(self, step):
         """Add an incoming Step to this Action."""
         if not isinstance(step, Step):
             raise ValueError('Must be a valid Step instance.')
         self._incoming[step.key] = step
+        self.process._index_incoming_step(self, step)
+        self.process._log('add_incoming_step', self.key, step.key)
 
     def add_outgoing_step(self, step):
         """Add an outgoing Step to this Action."""
@@ -421,6 +1227,8 @@ class Action(object):
             raise ValueError('Must be a valid Step instance.')
         self.is_complete = False
         self._outgoing[step.key] = step
+        self.process._index_outgoing_step(self, step)
+        self.process._log('add_outgoing_step', self.key, step.key)
 
     def to_dict(self):
         """Return action as a dict object."""
@@ -436,12 +1244,13 @@ class Action(object):
 
     def to_json(self):
         """Return action as a JSON string."""
-        return json.dumps(self.to_dict())
+        return codec.dumps(self.to_dict())
 
 
 class Client(object):
     realm = 'http://flomosa.appspot.com'
-    debug = True
+    # Log a line per call to the 'flomosa' logger when no instrument is set.
+    debug = False
     endpoints = {
         'processes': 'processes/%(key)s.json',
         'process_search': 'search/process/%(key)s.json',
@@ -453,17 +1262,22 @@ class Client(object):
         'stats_week': 'stats/by-week/%(key)s.json',
         'stats_day': 'stats/by-day/%(key)s.json'
     }
-    stats = (
-        'num_requests',
-        'num_requests_completed',
-        'min_request_seconds',
-        'max_request_seconds',
-        'avg_request_seconds',
-        'total_request_seconds'
-    )
+    # Endpoints whose GET responses the response cache may keep. Requests,
+    # searches and stats change without the client knowing.
+    cached_endpoints = ('processes', 'teams')
+    stats = METRICS
 
     def __init__(self, key, secret, api_version=API_VERSION,
-        host='flomosa.appspot.com', port=80):
+        host='flomosa.appspot.com', port=80, pool_size=10, idle_timeout=60,
+        cache=None, identity_map=False, stats_cache=None, throttle=True,
+        instrument=None):
+        # The transport is imported here rather than with flomosa, so jobs
+        # that only build processes and teams never load it.
+        import oauth2 as oauth
+        from flomosa.cache import ResponseCache
+        from flomosa.pool import ConnectionPool
+        from flomosa.retry import Throttle
+        from flomosa.signing import Signer
         self.host = host
         self.port = port
         self.consumer = oauth.Consumer(key, secret)
@@ -471,11 +1285,40 @@ class Client(object):
         self.secret = secret
         self.api_version = api_version
         self.signature = oauth.SignatureMethod_HMAC_SHA1()
+        self.signer = Signer(key, secret, realm=self.realm,
+            user_agent='Flomosa Python Client v%s' % API_VERSION)
         if port == 443:
             self.uri = 'https://%s' % host
         else:
             self.uri = 'http://%s:%s' % (host, port)
-        self.http = Http()
+        self.pool = ConnectionPool(maxsize=pool_size,
+            idle_timeout=idle_timeout)
+        if cache is True:
+            cache = ResponseCache()
+        self.cache = cache
+        if stats_cache is True:
+            stats_cache = StatsCache()
+        self.stats_cache = stats_cache
+        if throttle is True:
+            throttle = Throttle(limit=pool_size)
+        self.throttle = throttle or None
+        self.identity_map = None
+        if identity_map:
+            self.identity_map = {
+                'processes': weakref.WeakValueDictionary(),
+                'teams': weakref.WeakValueDictionary()
+            }
+        self.instrument = instrument
+        self._endpoint_names = dict(('/' + path.rsplit('/', 1)[0], name)
+            for name, path in self.endpoints.iteritems())
+        # object in the identity map -> digest of the response it came from;
+        # entries go away with their objects.
+        self._versions = weakref.WeakKeyDictionary()
+        # process key -> state_hash() of what this server was last sent or
+        # returned for it.
+        self._saved = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
 
     def __unicode__(self):
         return '%s (%s, %s)' % (self.uri, self.secret, self.key)
@@ -483,6 +1326,10 @@ class Client(object):
     def __str__(self):
         return self.__unicode__()
 
+    def close(self):
+        """Close every idle connection in the pool."""
+        self.pool.close()
+
     def endpoint(self, name, **kwargs):
         try:
             endpoint = self.endpoints[name]
@@ -508,13 +1355,28 @@ class Client(object):
                     return ','.join(new_filter)
         return None
 
-    def add_process(self, process):
+    def add_process(self, process, stream=False, force=False):
+        """Save a process, returns None without a request if it is clean.
+
+        The API only accepts whole processes, so a changed process is
+        always sent in full. force sends it even when it looks unchanged.
+        """
+        digest = process.state_hash()
+        if not force and self._saved.get(process.key, None) == digest:
+            return None
         endpoint = self.endpoint('processes', key=process.key)
-        return self._request(endpoint, 'PUT', process.to_json())
+        self._invalidate('processes', endpoint, process.key)
+        if stream:
+            # Sent with chunked transfer encoding, never held as one string.
+            result = self._request(endpoint, 'PUT', process.iter_json)
+        else:
+            result = self._request(endpoint, 'PUT', process.to_json())
+        self._saved[process.key] = digest
+        process.mark_saved(digest)
+        return result
 
     def get_process(self, key):
-        endpoint = self.endpoint('processes', key=key)
-        return Process.from_dict(self._request(endpoint, 'GET'))
+        return self._get_object(Process, 'processes', key)
 
     def get_request(self, key):
         endpoint = self.endpoint('requests', key=key)
@@ -522,28 +1384,177 @@ class Client(object):
 
     def delete_process(self, key):
         endpoint = self.endpoint('processes', key=key)
+        self._invalidate('processes', endpoint, key)
         return self._request(endpoint, 'DELETE')
 
     def add_team(self, team):
         endpoint = self.endpoint('teams', key=team.key)
+        self._invalidate('teams', endpoint, team.key)
         return self._request(endpoint, 'PUT', team.to_json())
 
     def get_team(self, key):
-        endpoint = self.endpoint('teams', key=key)
-        return Team.from_dict(self._request(endpoint, 'GET'))
+        return self._get_object(Team, 'teams', key)
 
     def delete_team(self, key):
         endpoint = self.endpoint('teams', key=key)
+        self._invalidate('teams', endpoint, key)
         return self._request(endpoint, 'DELETE')
 
+    def _get_object(self, cls, name, key):
+        """Fetch a Process or Team, reusing the identity map if enabled."""
+        endpoint = self.endpoint(name, key=key)
+        return self._call(endpoint, 'GET', None,
+            lambda resp, content: self._load_object(cls, name, key, resp,
+            content))
+
+    def _load_object(self, cls, name, key, resp, content):
+        if self.identity_map is None:
+            return self._loaded(cls.from_dict(self._decode(resp, content)))
+
+        objects = self.identity_map[name]
+        obj = objects.get(key, None)
+        if obj is not None and resp['status'][0] == '2' and \
+            self._versions.get(obj, None) == sha1(content).digest():
+            return obj
+        data = self._decode(resp, content)
+        self._lock.acquire()
+        try:
+            obj = objects.get(key, None)
+            if obj is None:
+                obj = cls.from_dict(data)
+                if obj is not None:
+                    objects[key] = obj
+            else:
+                obj.update_from_dict(data)
+            if obj is not None:
+                self._versions[obj] = sha1(content).digest()
+            self._loaded(obj)
+        finally:
+            self._lock.release()
+        return obj
+
+    def _loaded(self, obj):
+        if isinstance(obj, Process):
+            digest = obj.state_hash()
+            self._saved[obj.key] = digest
+            obj.mark_saved(digest)
+        return obj
+
+    def _invalidate(self, name, endpoint, key):
+        if name == 'processes':
+            # What this server has is no longer known until the call works.
+            self._saved.pop(key, None)
+        if self.cache is not None:
+            self.cache.invalidate(endpoint)
+        if self.identity_map is not None:
+            obj = self.identity_map[name].get(key, None)
+            if obj is not None:
+                self._versions.pop(obj, None)
+
+    def sync(self, processes=(), teams=(), manifest=None, delete=True,
+        max_workers=None, dry_run=False):
+        """Make the server match the given processes and teams.
+
+        The content_hash() of each object is compared with the one recorded
+        in manifest, or with the object on the server when there is no
+        manifest, and only objects that differ are PUT, max_workers at a
+        time (the pool size by default). With a manifest and delete set,
+        objects it records that are no longer given are deleted. Teams are
+        synced before the processes using them. Returns a SyncReport, which
+        also lists failures instead of raising them.
+        """
+        from flomosa.futures import Executor
+        from flomosa.sync import SyncReport
+        processes = list(processes)
+        teams = list(teams)
+        report = SyncReport()
+        executor = Executor(max_workers or self.pool.maxsize)
+        try:
+            for kind, objects in (('teams', teams),
+                ('processes', processes)):
+                jobs = [(kind, obj.key, executor.submit(self._sync_put, kind,
+                    obj, manifest, dry_run)) for obj in objects]
+                self._sync_collect(jobs, manifest, report, dry_run)
+            if delete and manifest is not None:
+                for kind, objects in (('processes', processes),
+                    ('teams', teams)):
+                    keep = set([obj.key for obj in objects])
+                    jobs = [(kind, key, executor.submit(self._sync_delete,
+                        kind, key, dry_run)) for key in manifest.keys(kind)
+                        if key not in keep]
+                    self._sync_collect(jobs, manifest, report, dry_run)
+        finally:
+            executor.shutdown()
+            if manifest is not None and not dry_run:
+                manifest.save()
+        return report
+
+    def _sync_collect(self, jobs, manifest, report, dry_run):
+        for kind, key, future in jobs:
+            try:
+                outcome, digest = future.result()
+            except Exception, e:
+                report.errors.append((kind, key, e))
+                continue
+            report.add(outcome, kind, key)
+            # A dry run leaves the manifest as it was, like the server.
+            if manifest is None or dry_run or outcome == 'skipped':
+                continue
+            if digest is None:
+                manifest.remove(kind, key)
+            else:
+                manifest.set(kind, key, digest)
+
+    def _sync_put(self, kind, obj, manifest, dry_run):
+        from flomosa.sync import content_hash
+        digest = content_hash(obj)
+        if manifest is None:
+            known = self._remote_hash(kind, obj)
+        else:
+            known = manifest.get(kind, obj.key)
+        if known == digest:
+            return 'skipped', digest
+        if not dry_run:
+            if kind == 'processes':
+                Client.add_process(self, obj, force=True)
+            else:
+                Client.add_team(self, obj)
+        if known is None:
+            return 'created', digest
+        return 'updated', digest
+
+    def _sync_delete(self, kind, key, dry_run):
+        if not dry_run:
+            try:
+                self._request(self.endpoint(kind, key=key), 'DELETE')
+            except APIError, e:
+                if str(e['code']) != '404':
+                    raise
+            self._invalidate(kind, self.endpoint(kind, key=key), key)
+        return 'deleted', None
+
+    def _remote_hash(self, kind, obj):
+        from flomosa.sync import content_hash, process_dict, team_dict
+        try:
+            data = self._request(self.endpoint(kind, key=obj.key), 'GET')
+        except APIError, e:
+            if str(e['code']) == '404':
+                return None
+            raise
+        if not data or not isinstance(data, dict):
+            return None
+        # Hashed as a dict; building a model object would register it.
+        if kind == 'processes':
+            return content_hash(process_dict(data))
+        return content_hash(team_dict(data))
+
     def get_year_stats(self, key, year, filter=None):
         data = {
             'year': year
         }
         if filter is not None:
             data['filter'] = self.filter(filter)
-        endpoint = self.endpoint('stats_year', key=key)
-        return self._request(endpoint, 'GET', data)
+        return self._get_stats('year', key, (year,), data)
 
     def get_month_stats(self, key, year, month, filter=None):
         data = {
@@ -552,8 +1563,7 @@ class Client(object):
         }
         if filter is not None:
             data['filter'] = self.filter(filter)
-        endpoint = self.endpoint('stats_month', key=key)
-        return self._request(endpoint, 'GET', data)
+        return self._get_stats('month', key, (year, month), data)
 
     def get_week_stats(self, key, year, week_num, filter=None):
         data = {
@@ -562,8 +1572,7 @@ class Client(object):
         }
         if filter is not None:
             data['filter'] = self.filter(filter)
-        endpoint = self.endpoint('stats_week', key=key)
-        return self._request(endpoint, 'GET', data)
+        return self._get_stats('week', key, (year, week_num), data)
 
     def get_day_stats(self, key, year, month, day, filter=None):
         data = {
@@ -573,25 +1582,123 @@ class Client(object):
         }
         if filter is not None:
             data['filter'] = self.filter(filter)
-        endpoint = self.endpoint('stats_day', key=key)
-        return self._request(endpoint, 'GET', data)
+        return self._get_stats('day', key, (year, month, day), data)
+
+    def _get_stats(self, granularity, key, period, data):
+        endpoint = self.endpoint('stats_%s' % granularity, key=key)
+        cache = self.stats_cache
+        if cache is None:
+            return self._request(endpoint, 'GET', data)
+        metrics = None
+        if 'filter' in data:
+            if not data['filter']:
+                return self._request(endpoint, 'GET', data)
+            metrics = data['filter'].split(',')
+        try:
+            period = tuple([int(part) for part in period])
+        except (TypeError, ValueError):
+            return self._request(endpoint, 'GET', data)
+
+        result = cache.get(granularity, key, period, metrics)
+        if result is None:
+            result = self._request(endpoint, 'GET', data)
+            cache.set(granularity, key, period, metrics, result)
+        return result
+
+    def get_stats_series(self, keys, start, end, granularity='day',
+        filter=None, fill=None, max_workers=None):
+        """Fetch statistics for many processes over a date range.
+
+        One request per process and period is made, max_workers at a time
+        (the pool size by default). Returns a StatsSeries with one column per
+        metric kept by filter(), where periods without data hold fill.
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError('Unknown granularity "%s"' % granularity)
+        fetch = getattr(Client, 'get_%s_stats' % granularity)
+        metrics = self.filter(filter)
+        if metrics:
+            metrics = metrics.split(',')
+        else:
+            metrics = None
+        series = StatsSeries(granularity, metrics or self.stats, fill)
+
+        from flomosa.futures import Executor
+        jobs = [(key, period) for key in keys
+            for period in periods(start, end, granularity)]
+        executor = Executor(max_workers or self.pool.maxsize)
+        results = []
+        try:
+            for key, period in jobs:
+                results.append(executor.submit(self._get_period_stats, fetch,
+                    key, period, metrics))
+            for (key, period), future in zip(jobs, results):
+                series.append(key, period, future.result())
+        finally:
+            for future in results:
+                future.cancel()
+            executor.shutdown()
+        return series
+
+    def get_rollup_stats(self, keys, start, end,
+        granularities=('week', 'month', 'year'), filter=None,
+        max_workers=None):
+        """Fetch day statistics once and roll them up locally.
+
+        The date range is widened to whole periods of every granularity and
+        capped at today. Returns a dict mapping each granularity to a
+        StatsSeries shaped like get_stats_series() would return; 'day' maps
+        to the fetched series itself.
+        """
+        for granularity in granularities:
+            if granularity not in GRANULARITIES:
+                raise ValueError('Unknown granularity "%s"' % granularity)
+        start = to_date(start)
+        end = to_date(end)
+        for granularity in granularities:
+            start = min(start, period_start(period_of(start, granularity),
+                granularity))
+            end = max(end, period_end(period_of(end, granularity),
+                granularity))
+        end = min(end, datetime.datetime.utcnow().date())
+
+        metrics = self.filter(filter)
+        if metrics:
+            metrics = metrics.split(',')
+        else:
+            metrics = list(self.stats)
+        fetched = list(metrics)
+        if 'avg_request_seconds' in metrics and \
+            'num_requests_completed' not in metrics:
+            # Needed to weight the averages.
+            fetched.append('num_requests_completed')
+
+        days = Client.get_stats_series(self, keys, start, end, 'day',
+            fetched, max_workers=max_workers)
+        result = {}
+        for granularity in granularities:
+            if granularity == 'day':
+                series = days
+            else:
+                series = rollup(days, granularity)
+            result[granularity] = series.select(metrics)
+        return result
+
+    def _get_period_stats(self, fetch, key, period, filter):
+        try:
+            return fetch(self, key, *period, filter=filter)
+        except APIError, e:
+            if str(e['code']) == '404':
+                return None
+            raise
 
     def search_process(self, key, start=None, end=None, limit=None):
-        data = {}
-        if start is not None:
-            data['start'] = start
-            if end is None:
-                data['end'] = time.time()
-            else:
-                data['end'] = end
-        if limit is None:
-            data['limit'] = limit
-        else:
-            data['limit'] = 25
-        endpoint = self.endpoint('process_search', key=key)
-        return self._request(endpoint, 'GET', data)
+        return self._search('process_search', key, start, end, limit)
 
     def search_step(self, key, start=None, end=None, limit=None):
+        return self._search('step_search', key, start, end, limit)
+
+    def _search(self, name, key, start, end, limit):
         data = {}
         if start is not None:
             data['start'] = start
@@ -600,44 +1707,201 @@ class Client(object):
             else:
                 data['end'] = end
         if limit is None:
-            data['limit'] = limit
-        else:
             data['limit'] = 25
-        endpoint = self.endpoint('step_search', key=key)
+        else:
+            data['limit'] = limit
+        endpoint = self.endpoint(name, key=key)
         return self._request(endpoint, 'GET', data)
 
+    def iter_search_process(self, key, start=None, end=None, page_size=25,
+        limit=None, time_field='timestamp'):
+        """Yield every search result for a process, page by page.
+
+        Pages are expected to be lists of result dicts (or a dict holding
+        that list under 'results') sorted by time_field, oldest first. Each
+        next page starts at the time of the last result seen, and results
+        already yielded at that boundary are skipped. The next page is
+        fetched in the background while the current one is consumed, so at
+        most two pages are held in memory. Stops after limit results when
+        limit is set.
+        """
+        return self._iter_search(Client.search_process, key, start, end,
+            page_size, limit, time_field)
+
+    def iter_search_step(self, key, start=None, end=None, page_size=25,
+        limit=None, time_field='timestamp'):
+        """Like iter_search_process(), for a step."""
+        return self._iter_search(Client.search_step, key, start, end,
+            page_size, limit, time_field)
+
+    def _iter_search(self, search, key, start, end, page_size, limit,
+        time_field):
+        from flomosa.futures import Executor
+        if end is None:
+            end = time.time()
+        executor = Executor(1)
+        future = None
+        try:
+            future = executor.submit(search, self, key, start=start, end=end,
+                limit=page_size)
+            seen = set()
+            count = 0
+            while future is not None:
+                page = future.result()
+                if isinstance(page, dict):
+                    page = page.get('results', [])
+                page = page or []
+                future = None
+                if len(page) >= page_size:
+                    last = page[-1][time_field]
+                    future = executor.submit(search, self, key, start=last,
+                        end=end, limit=page_size)
+
+                boundary = set()
+                found = False
+                for result in page:
+                    stamp = result[time_field]
+                    if stamp == start and _result_id(result) in seen:
+                        continue
+                    found = True
+                    if future is not None and stamp == last:
+                        boundary.add(_result_id(result))
+                    yield result
+                    count += 1
+                    if limit is not None and count >= limit:
+                        return
+                if not found:
+                    # The window is exhausted, or more than a page of
+                    # results share one timestamp and cannot be paged past.
+                    return
+                if future is not None:
+                    if last == start:
+                        seen.update(boundary)
+                    else:
+                        seen = boundary
+                    start = last
+        finally:
+            if future is not None:
+                future.cancel()
+            executor.shutdown(wait=False)
+
     def _request(self, endpoint, method, data=None):
+        return self._call(endpoint, method, data, self._decode)
+
+    def _call(self, endpoint, method, data, handle):
+        """Perform a request and return handle(resp, content).
+
+        When an instrument is set, it receives a RequestEvent afterwards.
+        """
+        instrument = self.instrument
+        if instrument is None:
+            if not self.debug:
+                resp, content = self._perform(endpoint, method, data)
+                return handle(resp, content)
+        from flomosa.instrument import LogInstrument, RequestEvent
+        from flomosa.retry import endpoint_group
+        if instrument is None:
+            instrument = LogInstrument()
+
+        event = RequestEvent(self._endpoint_names.get(
+            endpoint_group(endpoint), None), endpoint, method)
+        started = time.time()
+        try:
+            resp, content = self._perform(endpoint, method, data, event)
+            decode_started = time.time()
+            try:
+                return handle(resp, content)
+            finally:
+                event.decode_seconds = time.time() - decode_started
+        except Exception, e:
+            event.error = e
+            raise
+        finally:
+            event.total_seconds = time.time() - started
+            instrument.request(event)
+
+    def _perform(self, endpoint, method, data=None, event=None):
         body = None
         params = {}
         if method == 'GET' and isinstance(data, dict):
+            from urllib import urlencode
             params = data
-            endpoint = endpoint + '?' + urllib.urlencode(data)
+            endpoint = endpoint + '?' + urlencode(data)
         else:
             if isinstance(data, dict):
-                body = urllib.urlencode(data)
+                from urllib import urlencode
+                body = urlencode(data)
             else:
                 body = data
-
-        request = oauth.Request.from_consumer_and_token(self.consumer,
-            http_method=method, http_url=endpoint, parameters=params)
-
-        request.sign_request(self.signature, self.consumer, None)
-        headers = request.to_header(self.realm)
-        headers['User-Agent'] = 'Flomosa Python Client v%s' % API_VERSION
-
-        resp, content = self.http.request(endpoint, method, body=body,
-            headers=headers)
-
-        if self.debug:
-            print(headers)
-            print('-------------')
-            print(resp)
-            print('-------------')
-            print(content)
-
+        if event is not None:
+            event.url = endpoint
+
+        cache = None
+        if self.cache is not None and method == 'GET':
+            from flomosa.retry import endpoint_group
+            if self._endpoint_names.get(endpoint_group(endpoint),
+                None) in self.cached_endpoints:
+                cache = self.cache
+        entry = None
+        conditional = None
+        if cache is not None:
+            entry = cache.get(endpoint)
+            if entry is not None:
+                if cache.is_fresh(entry):
+                    if event is not None:
+                        event.cached = True
+                        event.status = '200'
+                        event.response_bytes = len(entry.body or '')
+                    return {'status': '200'}, entry.body
+                conditional = cache.conditional_headers(entry)
+
+        def send():
+            if event is not None:
+                event.attempts += 1
+                started = time.time()
+            # Signed again for every attempt, a retry needs a fresh nonce.
+            headers = self.signer.sign(method, endpoint, params)
+            if conditional:
+                headers.update(conditional)
+            if event is None:
+                return self._send(endpoint, method, body, headers)
+
+            signed = time.time()
+            event.sign_seconds += signed - started
+            timings = self._local.timings = {}
+            try:
+                resp, content = self._send(endpoint, method, body, headers)
+            finally:
+                self._local.timings = None
+                connect = timings.get('connect', 0.0)
+                event.connect_seconds += connect
+                event.transfer_seconds += time.time() - signed - connect
+                if 'sent' in timings:
+                    event.request_bytes += timings['sent']
+                elif isinstance(body, basestring):
+                    event.request_bytes += len(body)
+            return resp, content
+
+        if self.throttle is None:
+            resp, content = send()
+        else:
+            resp, content = self.throttle.call(endpoint, method, send)
+
+        if entry is not None and resp['status'] == '304':
+            cache.revalidated(endpoint, entry)
+            resp['status'] = '200'
+            content = entry.body
+        elif cache is not None and resp['status'][0] == '2':
+            cache.set(endpoint, resp, content)
+        if event is not None:
+            event.status = resp['status']
+            event.response_bytes = len(content or '')
+        return resp, content
+
+    def _decode(self, resp, content):
         if content: # Empty body is allowed.
             try:
-                content = json.loads(content)
+                content = codec.loads(content)
             except ValueError:
                 raise DecodeError(resp, content)
 
@@ -650,3 +1914,109 @@ class Client(object):
             raise APIError(code, message, resp)
 
         return content
+
+    def _send(self, endpoint, method, body, headers):
+        return self.pool.request(endpoint, method, body=body, headers=headers,
+            timings=getattr(self._local, 'timings', None))
+
+
+class AsyncClient(Client):
+    """Flomosa API client that runs calls concurrently.
+
+    Every API method returns a Future instead of blocking. At most
+    max_workers requests are in flight at once, sharing the client's
+    connection pool. Use it as a context manager, or call close(), to wait
+    for outstanding calls and close the connections.
+    """
+
+    def __init__(self, key, secret, api_version=API_VERSION,
+        host='flomosa.appspot.com', port=80, max_workers=10, max_pending=0,
+        idle_timeout=60, cache=None, identity_map=False, stats_cache=None,
+        throttle=True, instrument=None):
+        Client.__init__(self, key, secret, api_version=api_version, host=host,
+            port=port, pool_size=max_workers, idle_timeout=idle_timeout,
+            cache=cache, identity_map=identity_map, stats_cache=stats_cache,
+            throttle=throttle, instrument=instrument)
+        from flomosa.futures import Executor
+        self.executor = Executor(max_workers, max_pending)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        """Wait for outstanding calls and close every open connection."""
+        self.executor.shutdown(wait=True)
+        self.pool.close()
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedule fn(*args, **kwargs) on the worker pool."""
+        return self.executor.submit(fn, *args, **kwargs)
+
+    def add_process(self, process, stream=False, force=False):
+        return self.submit(Client.add_process, self, process, stream=stream,
+            force=force)
+
+    def get_process(self, key):
+        return self.submit(Client.get_process, self, key)
+
+    def get_request(self, key):
+        return self.submit(Client.get_request, self, key)
+
+    def delete_process(self, key):
+        return self.submit(Client.delete_process, self, key)
+
+    def add_team(self, team):
+        return self.submit(Client.add_team, self, team)
+
+    def get_team(self, key):
+        return self.submit(Client.get_team, self, key)
+
+    def delete_team(self, key):
+        return self.submit(Client.delete_team, self, key)
+
+    def sync(self, processes=(), teams=(), manifest=None, delete=True,
+        max_workers=None, dry_run=False):
+        return self.submit(Client.sync, self, processes=processes,
+            teams=teams, manifest=manifest, delete=delete,
+            max_workers=max_workers, dry_run=dry_run)
+
+    def get_year_stats(self, key, year, filter=None):
+        return self.submit(Client.get_year_stats, self, key, year,
+            filter=filter)
+
+    def get_month_stats(self, key, year, month, filter=None):
+        return self.submit(Client.get_month_stats, self, key, year, month,
+            filter=filter)
+
+    def get_week_stats(self, key, year, week_num, filter=None):
+        return self.submit(Client.get_week_stats, self, key, year, week_num,
+            filter=filter)
+
+    def get_day_stats(self, key, year, month, day, filter=None):
+        return self.submit(Client.get_day_stats, self, key, year, month, day,
+            filter=filter)
+
+    def get_stats_series(self, keys, start, end, granularity='day',
+        filter=None, fill=None, max_workers=None):
+        return self.submit(Client.get_stats_series, self, keys, start, end,
+            granularity=granularity, filter=filter, fill=fill,
+            max_workers=max_workers)
+
+    def get_rollup_stats(self, keys, start, end,
+        granularities=('week', 'month', 'year'), filter=None,
+        max_workers=None):
+        return self.submit(Client.get_rollup_stats, self, keys, start, end,
+            granularities=granularities, filter=filter,
+            max_workers=max_workers)
+
+    def search_process(self, key, start=None, end=None, limit=None):
+        return self.submit(Client.search_process, self, key, start=start,
+            end=end, limit=limit)
+
+    def search_step(self, key, start=None, end=None, limit=None):
+        return self.submit(Client.search_step, self, key, start=start,
+            end=end, limit=limit)
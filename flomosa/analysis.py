@@ -0,0 +1,546 @@
+"""
+Graph analysis for checking a process before it is uploaded.
+
+A process is compiled once into a Graph: steps get integer ids and the
+actions between them become arrays of successor and predecessor ids, so
+reachability, cycles and paths to completion run in linear time without
+touching the Step and Action objects again.
+"""
+
+from array import array
+from itertools import izip
+
+# For bytearray.translate(), swaps 0 and 1.
+_INVERT = bytearray([1]) + bytearray(255)
+
+
+def _csr(size, heads, tails):
+    """Return (offsets, targets) listing the tails of each head in order."""
+    offsets = array('l', [0]) * (size + 1)
+    for head in heads:
+        offsets[head + 1] += 1
+    for i in xrange(size):
+        offsets[i + 1] += offsets[i]
+    position = array('l', offsets)
+    targets = array('l', [0]) * len(heads)
+    for head, tail in izip(heads, tails):
+        targets[position[head]] = tail
+        position[head] += 1
+    return offsets, targets
+
+
+def _search(offsets, targets, sources, within=None):
+    """Return a bytearray marking the ids reachable from sources.
+
+    If within is given, only the ids it marks are searched.
+    """
+    if within is None:
+        seen = bytearray(len(offsets) - 1)
+    else:
+        # 0 for the ids to search, 1 for the others, as if already seen.
+        seen = within.translate(_INVERT)
+    queue = []
+    for source in sources:
+        if not seen[source]:
+            seen[source] = 1
+            queue.append(source)
+    append = queue.append
+    for node in queue:
+        for other in targets[offsets[node]:offsets[node + 1]]:
+            if not seen[other]:
+                seen[other] = 1
+                append(other)
+    if within is not None:
+        seen = bytearray(len(seen))
+        for node in queue:
+            seen[node] = 1
+    return seen
+
+
+def _check_outgoing(action, steps, reported, dangling):
+    """Add the outgoing steps of action that are not in steps to dangling."""
+    for key, step in action._outgoing.items():
+        if steps.get(key) is not step and (action.key, key) not in reported:
+            reported.add((action.key, key))
+            dangling.append((action.key, 'outgoing', key))
+
+
+class Graph(object):
+    """The steps of a process as integer ids with array adjacency.
+
+    keys[i] is the key of step i. The steps one action after step i are
+    targets[offsets[i]:offsets[i + 1]] and the steps one action before it
+    are sources[reverse_offsets[i]:reverse_offsets[i + 1]]. completes[i] is
+    1 when step i has an is_complete action. dangling lists (action key,
+    'incoming' or 'outgoing', step key) for each reference to a step that is
+    not in the process.
+
+    The edges are given as heads and tails, or already as adjacency, an
+    (offsets, targets, reverse_offsets, sources) tuple.
+    """
+
+    def __init__(self, keys, starts, heads, tails, completes, dangling=(),
+        num_actions=0, ids=None, adjacency=None):
+        if ids is None:
+            ids = dict(izip(keys, xrange(len(keys))))
+        if adjacency is None:
+            adjacency = _csr(len(keys), heads, tails) + \
+                _csr(len(keys), tails, heads)
+        self.keys = keys
+        self.ids = ids
+        self.starts = starts
+        self.completes = completes
+        self.dangling = list(dangling)
+        self.num_actions = num_actions
+        (self.offsets, self.targets, self.reverse_offsets,
+            self.sources) = adjacency
+        self._distances = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __repr__(self):
+        return '<Graph %d steps, %d edges>' % (len(self.keys),
+            len(self.targets))
+
+    @classmethod
+    def from_process(cls, process):
+        """Compile a Process.
+
+        The edges are read from the index the Process keeps of the actions
+        leaving each step, so they come out already grouped by step. A
+        Process just loaded by from_dict() has not built its indexes yet,
+        so its actions are read directly instead of building them.
+
+        With 100,000 steps and 200,000 actions this takes 0.6-0.7s of CPU
+        and Report() another 0.2s, or 0.3s when a cycle runs through all
+        the steps: about a second in all, not much under it.
+        """
+        if process._indexes is None:
+            return cls._from_actions(process)
+        steps = process._steps
+        keys = list(steps)
+        size = len(keys)
+        ids = dict(izip(keys, xrange(size)))
+        starts = [ids[key] for key, step in steps.iteritems()
+            if step._is_start]
+        completes = bytearray(size)
+        dangling = []
+        reported = set()
+        # Actions with one incoming step are in the index once, the others
+        # once per step, so counting them tells if any were not visited.
+        visits = 0
+        shared = set()
+        index = process._step_outgoing
+        offsets = array('l', [0]) * (size + 1)
+        heads = array('l')
+        targets = array('l')
+        add_head = heads.append
+        add_target = targets.append
+        get_step = steps.get
+        for i, (key, step) in enumerate(steps.iteritems()):
+            actions = index.get(key)
+            if actions is not None:
+                # The SmallDicts are read directly when they hold one
+                # item, as most do.
+                if actions._dict is None:
+                    actions = (actions._value,)
+                else:
+                    actions = actions._dict.values()
+                for action in actions:
+                    incoming = action._incoming
+                    if incoming._dict is None:
+                        visits += 1
+                        other_step = incoming._value
+                    else:
+                        shared.add(action.key)
+                        other_step = incoming._dict.get(key)
+                    # A step replaced under the same key is dangling too.
+                    if other_step is not step:
+                        dangling.append((action.key, 'incoming', key))
+                        _check_outgoing(action, steps, reported, dangling)
+                        continue
+                    if action._is_complete:
+                        completes[i] = 1
+                    outgoing = action._outgoing
+                    if outgoing._dict is None:
+                        other_step = outgoing._value
+                        if other_step is None:
+                            continue
+                        other = outgoing._key
+                        if get_step(other) is other_step:
+                            add_head(i)
+                            add_target(ids[other])
+                            continue
+                        items = ((other, other_step),)
+                    else:
+                        items = outgoing._dict.items()
+                    for other, other_step in items:
+                        if get_step(other) is other_step:
+                            add_head(i)
+                            add_target(ids[other])
+                        elif (action.key, other) not in reported:
+                            reported.add((action.key, other))
+                            dangling.append((action.key, 'outgoing', other))
+            offsets[i + 1] = len(targets)
+        for key, actions in index.iteritems():
+            if key not in steps:
+                for action in actions.values():
+                    if len(action._incoming) == 1:
+                        visits += 1
+                    else:
+                        shared.add(action.key)
+                    dangling.append((action.key, 'incoming', key))
+                    _check_outgoing(action, steps, reported, dangling)
+        if visits + len(shared) < len(process._actions):
+            # Actions without incoming steps are not in the index.
+            for action in process._actions.itervalues():
+                if not action._incoming:
+                    _check_outgoing(action, steps, reported, dangling)
+        reverse_offsets, sources = _csr(size, targets, heads)
+        return cls(keys, starts, None, None, completes, dangling,
+            len(process._actions), ids,
+            (offsets, targets, reverse_offsets, sources))
+
+    @classmethod
+    def _from_actions(cls, process):
+        steps = process._steps
+        keys = list(steps)
+        size = len(keys)
+        ids = dict(izip(keys, xrange(size)))
+        starts = [ids[key] for key, step in steps.iteritems()
+            if step._is_start]
+        completes = bytearray(size)
+        dangling = []
+        heads = array('l')
+        tails = array('l')
+        add_head = heads.append
+        add_tail = tails.append
+        get_step = steps.get
+        for action in process._actions.itervalues():
+            incoming = action._incoming
+            outgoing = action._outgoing
+            # Most actions go from one step to at most one other, both in
+            # the process; their SmallDicts are read directly.
+            if incoming._dict is None and outgoing._dict is None:
+                key = incoming._key
+                step = incoming._value
+                other_step = outgoing._value
+                if step is not None and get_step(key) is step and (
+                    other_step is None or
+                    get_step(outgoing._key) is other_step):
+                    source = ids[key]
+                    if action._is_complete:
+                        completes[source] = 1
+                    if other_step is not None:
+                        add_head(source)
+                        add_tail(ids[outgoing._key])
+                    continue
+            targets = []
+            for other, other_step in outgoing.items():
+                if get_step(other) is other_step:
+                    targets.append(ids[other])
+                else:
+                    dangling.append((action.key, 'outgoing', other))
+            for key, step in incoming.items():
+                # A step replaced under the same key is dangling too.
+                if get_step(key) is not step:
+                    dangling.append((action.key, 'incoming', key))
+                    continue
+                source = ids[key]
+                if action._is_complete:
+                    completes[source] = 1
+                for target in targets:
+                    add_head(source)
+                    add_tail(target)
+        return cls(keys, starts, heads, tails, completes, dangling,
+            len(process._actions), ids)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Compile a process dict, as returned by Process.to_dict().
+
+        Unlike Process.from_dict(), references to missing steps are
+        reported in dangling instead of raising.
+        """
+        steps = data.get('steps', [])
+        keys = [step['key'] for step in steps]
+        ids = dict(izip(keys, xrange(len(keys))))
+        starts = [ids[step['key']] for step in steps if step.get('is_start')]
+        actions = data.get('actions', [])
+        heads = array('l')
+        tails = array('l')
+        completes = bytearray(len(keys))
+        dangling = []
+        for action in actions:
+            targets = []
+            for key in action.get('outgoing', []):
+                if key in ids:
+                    targets.append(ids[key])
+                else:
+                    dangling.append((action.get('key'), 'outgoing', key))
+            is_complete = action.get('is_complete') and \
+                not action.get('outgoing')
+            for key in action.get('incoming', []):
+                if key not in ids:
+                    dangling.append((action.get('key'), 'incoming', key))
+                    continue
+                source = ids[key]
+                if is_complete:
+                    completes[source] = 1
+                for target in targets:
+                    heads.append(source)
+                    tails.append(target)
+        return cls(keys, starts, heads, tails, completes, dangling,
+            len(actions), ids)
+
+    def _ids(self, keys):
+        if keys is None:
+            return self.starts
+        return [self.ids[key] for key in keys]
+
+    def reachable(self, keys=None):
+        """Return a bytearray marking the steps reachable from keys.
+
+        keys defaults to the start steps. Indexes are step ids.
+        """
+        return _search(self.offsets, self.targets, self._ids(keys))
+
+    def can_complete(self):
+        """Return a bytearray marking the steps with a way to completion."""
+        return _search(self.reverse_offsets, self.sources,
+            [i for i in xrange(len(self.keys)) if self.completes[i]])
+
+    def distances(self):
+        """Return (distance, next) arrays for the shortest way to complete.
+
+        distance[i] is the fewest actions that complete the process from
+        step i, counting the completing action, or -1 if it cannot
+        complete. next[i] is the step to go to first, or -1.
+        """
+        if self._distances is not None:
+            return self._distances
+        size = len(self.keys)
+        distance = array('l', [-1]) * size
+        following = array('l', [-1]) * size
+        queue = []
+        for i in xrange(size):
+            if self.completes[i]:
+                distance[i] = 1
+                queue.append(i)
+        offsets = self.reverse_offsets
+        sources = self.sources
+        append = queue.append
+        for node in queue:
+            step = distance[node] + 1
+            for k in xrange(offsets[node], offsets[node + 1]):
+                other = sources[k]
+                if distance[other] < 0:
+                    distance[other] = step
+                    following[other] = node
+                    append(other)
+        self._distances = distance, following
+        return self._distances
+
+    def path_to_completion(self, key):
+        """Return the keys of the steps on a shortest way to complete.
+
+        The path starts with key and ends with a step that has an
+        is_complete action; it is empty if key cannot complete.
+        """
+        distance, following = self.distances()
+        i = self.ids[key]
+        if distance[i] < 0:
+            return []
+        path = []
+        while i >= 0:
+            path.append(self.keys[i])
+            i = following[i]
+        return path
+
+    def components(self):
+        """Return the strongly connected components as lists of step ids.
+
+        Components are listed before any component that leads to them.
+        """
+        return self._components(xrange(len(self.keys)))
+
+    def _components(self, roots):
+        # Tarjan's algorithm with an explicit stack of (node, next edge).
+        size = len(self.keys)
+        offsets = self.offsets
+        targets = self.targets
+        index = array('l', [-1]) * size
+        low = array('l', [0]) * size
+        on_stack = bytearray(size)
+        stack = []
+        result = []
+        counter = 0
+        for root in roots:
+            if index[root] >= 0:
+                continue
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = 1
+            nodes = [root]
+            edges = [offsets[root]]
+            while nodes:
+                node = nodes[-1]
+                k = edges[-1]
+                end = offsets[node + 1]
+                node_low = low[node]
+                while k < end:
+                    other = targets[k]
+                    k += 1
+                    if index[other] < 0:
+                        break
+                    if on_stack[other] and index[other] < node_low:
+                        node_low = index[other]
+                else:
+                    other = -1
+                low[node] = node_low
+                if other >= 0:
+                    edges[-1] = k
+                    index[other] = low[other] = counter
+                    counter += 1
+                    stack.append(other)
+                    on_stack[other] = 1
+                    nodes.append(other)
+                    edges.append(offsets[other])
+                    continue
+                nodes.pop()
+                edges.pop()
+                if nodes:
+                    parent = nodes[-1]
+                    if node_low < low[parent]:
+                        low[parent] = node_low
+                if node_low == index[node]:
+                    component = []
+                    while True:
+                        other = stack.pop()
+                        on_stack[other] = 0
+                        component.append(other)
+                        if other == node:
+                            break
+                    result.append(component)
+        return result
+
+    def cycles(self):
+        """Return the components that contain a cycle, as lists of step ids."""
+        # Peel off the steps no cycle leads to, as in a topological sort.
+        # Every step after one that is left is left too, so the search for
+        # components only needs to start from those.
+        size = len(self.keys)
+        offsets = self.offsets
+        targets = self.targets
+        reverse_offsets = self.reverse_offsets
+        degree = array('l', [0]) * size
+        queue = []
+        for i in xrange(size):
+            degree[i] = reverse_offsets[i + 1] - reverse_offsets[i]
+            if not degree[i]:
+                queue.append(i)
+        append = queue.append
+        for node in queue:
+            for k in xrange(offsets[node], offsets[node + 1]):
+                other = targets[k]
+                degree[other] -= 1
+                if not degree[other]:
+                    append(other)
+        left = [i for i in xrange(size) if degree[i]]
+        if not left:
+            return []
+        # The steps left are often one large component, a loop back to the
+        # start. Two searches from one of them find it without Tarjan.
+        mask = bytearray(size)
+        for i in left:
+            mask[i] = 1
+        mask = _search(offsets, targets, left[:1], mask)
+        mask = _search(reverse_offsets, self.sources, left[:1], mask)
+        if mask.count('\x01') == len(left) and len(left) > 1:
+            return [left]
+        result = []
+        for component in self._components(left):
+            if len(component) > 1:
+                result.append(component)
+                continue
+            node = component[0]
+            for k in xrange(offsets[node], offsets[node + 1]):
+                if targets[k] == node:
+                    result.append(component)
+                    break
+        return result
+
+    def dead_ends(self):
+        """Return the ids of reachable steps that cannot complete."""
+        reachable = self.reachable()
+        complete = self.can_complete()
+        return [i for i in xrange(len(self.keys))
+            if reachable[i] and not complete[i]]
+
+
+class Report(object):
+    """What is wrong with a process graph, found by analyze().
+
+    starts, unreachable and dead_ends are lists of step keys, cycles a list
+    of lists of step keys and dangling as in Graph. Cycles are allowed, a
+    step that sends work back for rework is one, so they are not problems.
+    """
+
+    def __init__(self, graph):
+        keys = graph.keys
+        self.graph = graph
+        self.starts = [keys[i] for i in graph.starts]
+        reachable = graph.reachable()
+        complete = graph.can_complete()
+        self.unreachable = [keys[i] for i in xrange(len(keys))
+            if not reachable[i]]
+        self.dead_ends = [keys[i] for i in xrange(len(keys))
+            if reachable[i] and not complete[i]]
+        self.cycles = [[keys[i] for i in component]
+            for component in graph.cycles()]
+        self.dangling = graph.dangling
+
+    def __repr__(self):
+        return '<Report %s>' % (self.ok and 'ok' or
+            '%d problems' % len(self.problems()))
+
+    @property
+    def ok(self):
+        return not self.problems()
+
+    def problems(self):
+        """Return a message for each problem found."""
+        messages = []
+        if not self.graph.keys:
+            return ['The process has no steps.']
+        if not self.starts:
+            messages.append('No step is a start step.')
+        elif len(self.starts) > 1:
+            messages.append('Several start steps: %s.' %
+                ', '.join(sorted(self.starts)))
+        if not any(self.graph.completes):
+            messages.append('No step has an is_complete action.')
+        if self.unreachable:
+            messages.append('%d steps cannot be reached from a start step.'
+                % len(self.unreachable))
+        if self.dead_ends:
+            messages.append('%d steps have no way to complete.' %
+                len(self.dead_ends))
+        for action_key, direction, step_key in self.dangling:
+            messages.append('Action "%s" has %s step "%s", which is not in '
+                'the process.' % (action_key, direction, step_key))
+        return messages
+
+
+def compile_process(process):
+    """Return the Graph of a Process or process dict."""
+    if isinstance(process, dict):
+        return Graph.from_dict(process)
+    return Graph.from_process(process)
+
+
+def analyze(process):
+    """Return a Report on a Process or process dict."""
+    return Report(compile_process(process))
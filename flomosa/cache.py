@@ -0,0 +1,299 @@
+"""
+Client-side caches for Flomosa API responses.
+"""
+
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from hashlib import sha1
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+
+class LRUCache(object):
+    """Thread-safe mapping that keeps the maxsize most recently used items."""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        self._lock.acquire()
+        try:
+            try:
+                value = self._items.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._items[key] = value
+            self.hits += 1
+            return value
+        finally:
+            self._lock.release()
+
+    def set(self, key, value):
+        self._lock.acquire()
+        try:
+            self._items.pop(key, None)
+            self._items[key] = value
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+                self.evicted += 1
+        finally:
+            self._lock.release()
+
+    def delete(self, key):
+        self._lock.acquire()
+        try:
+            self._items.pop(key, None)
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._items.clear()
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        """Return a dict of cache counters."""
+        return {
+            'size': len(self._items),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evicted': self.evicted
+        }
+
+
+class FileStore(object):
+    """Store JSON-serializable values as one file per key in a directory.
+
+    With maxsize set, the least recently used files are removed once there
+    are more than maxsize of them, down to nine tenths of it.
+    """
+
+    def __init__(self, directory, maxsize=None):
+        self.directory = directory
+        self.maxsize = maxsize
+        self._count = None
+        self._lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, key):
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        return os.path.join(self.directory, '%s.json' % sha1(key).hexdigest())
+
+    def get(self, key, default=None):
+        path = self._path(key)
+        try:
+            fp = open(path, 'rb')
+        except IOError:
+            return default
+        try:
+            try:
+                stored_key, value = json.load(fp)
+            except ValueError:
+                return default
+        finally:
+            fp.close()
+        if stored_key != key:
+            return default
+        if self.maxsize is not None:
+            # The modification time orders files for eviction.
+            try:
+                os.utime(path, None)
+            except OSError:
+                pass
+        return value
+
+    def set(self, key, value):
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        fp = os.fdopen(fd, 'wb')
+        try:
+            json.dump([key, value], fp)
+        finally:
+            fp.close()
+        added = self.maxsize is not None and not os.path.exists(path)
+        os.rename(tmp_path, path)
+        if added:
+            self._added()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            return
+        self._lock.acquire()
+        try:
+            if self._count:
+                self._count -= 1
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        for name in self._names():
+            os.remove(os.path.join(self.directory, name))
+        self._lock.acquire()
+        try:
+            self._count = 0
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._names())
+
+    def _names(self):
+        return [name for name in os.listdir(self.directory)
+            if name.endswith('.json')]
+
+    def _added(self):
+        self._lock.acquire()
+        try:
+            if self._count is None:
+                self._count = len(self._names())
+            else:
+                self._count += 1
+            if self._count > self.maxsize:
+                self._prune()
+        finally:
+            self._lock.release()
+
+    def _prune(self):
+        files = []
+        for name in self._names():
+            path = os.path.join(self.directory, name)
+            try:
+                files.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+        files.sort()
+        # Prune below the limit so the directory is not listed every set().
+        excess = len(files) - (self.maxsize - self.maxsize // 10)
+        for mtime, path in files[:max(excess, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._count = len(files) - max(excess, 0)
+
+
+class CacheEntry(object):
+    """A cached response body and the validators needed to revalidate it."""
+
+    __slots__ = ('body', 'etag', 'last_modified', 'stored')
+
+    def __init__(self, body, etag=None, last_modified=None, stored=None):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored = stored or time.time()
+
+    def to_dict(self):
+        return {
+            'body': self.body,
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'stored': self.stored
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if not data or not isinstance(data, dict):
+            return None
+        body = data.get('body', None)
+        if isinstance(body, unicode):
+            body = body.encode('utf-8')
+        return cls(body, etag=data.get('etag', None),
+            last_modified=data.get('last_modified', None),
+            stored=data.get('stored', None))
+
+
+class ResponseCache(object):
+    """Cache of GET responses honoring ETag and Last-Modified.
+
+    Responses younger than ttl seconds are served without a request. Older
+    ones are revalidated with If-None-Match/If-Modified-Since, and a 304
+    reply reuses the cached body. When directory is set, entries are also
+    persisted there, at most max_files of them, and survive restarts.
+    """
+
+    def __init__(self, maxsize=256, ttl=0, directory=None, max_files=4096):
+        self.ttl = ttl
+        self.memory = LRUCache(maxsize)
+        self.store = None
+        if directory is not None:
+            self.store = FileStore(directory, max_files)
+
+    def get(self, url):
+        """Return the CacheEntry for url, or None."""
+        entry = self.memory.get(url)
+        if entry is None and self.store is not None:
+            entry = CacheEntry.from_dict(self.store.get(url))
+            if entry is not None:
+                self.memory.set(url, entry)
+        return entry
+
+    def is_fresh(self, entry):
+        """Return True if entry can be used without revalidating it."""
+        return self.ttl > 0 and time.time() - entry.stored < self.ttl
+
+    def conditional_headers(self, entry):
+        """Return the headers revalidating entry with the server."""
+        headers = {}
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def set(self, url, resp, body):
+        """Store a successful response for url and return its entry."""
+        entry = CacheEntry(body, etag=resp.get('etag', None),
+            last_modified=resp.get('last-modified', None))
+        self._save(url, entry)
+        return entry
+
+    def revalidated(self, url, entry):
+        """Mark entry as confirmed by the server just now."""
+        entry.stored = time.time()
+        self._save(url, entry)
+
+    def _save(self, url, entry):
+        self.memory.set(url, entry)
+        if self.store is not None:
+            self.store.set(url, entry.to_dict())
+
+    def invalidate(self, url):
+        """Forget the response cached for url."""
+        self.memory.delete(url)
+        if self.store is not None:
+            self.store.delete(url)
+
+    def clear(self):
+        """Forget every cached response."""
+        self.memory.clear()
+        if self.store is not None:
+            self.store.clear()
+
+    def stats(self):
+        return self.memory.stats()
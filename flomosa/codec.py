@@ -0,0 +1,103 @@
+"""
+Selectable JSON codecs for request bodies, responses and to_json().
+
+Every codec encodes to and decodes from byte strings, so response bodies
+are parsed as received without being decoded to unicode first.
+"""
+
+BACKENDS = ('ujson', 'simplejson', 'json')
+
+
+class Codec(object):
+    """A JSON backend with dumps() returning a str and loads() taking one."""
+
+    def __init__(self, name, dumps, loads):
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+
+    def __repr__(self):
+        return '<Codec %s>' % self.name
+
+
+def _ujson():
+    import ujson
+
+    def dumps(obj):
+        return ujson.dumps(obj, escape_forward_slashes=False)
+    return Codec('ujson', dumps, ujson.loads)
+
+
+def _simplejson():
+    import simplejson
+    return Codec('simplejson', simplejson.dumps, simplejson.loads)
+
+
+def _json():
+    import json
+    return Codec('json', json.dumps, json.loads)
+
+
+_LOADERS = {
+    'ujson': _ujson,
+    'simplejson': _simplejson,
+    'json': _json
+}
+
+
+def get_codec(name):
+    """Return the Codec for a backend name, or the fastest one for 'auto'.
+
+    Raises ImportError if the backend is not installed.
+    """
+    if name == 'auto':
+        for name in BACKENDS:
+            try:
+                return _LOADERS[name]()
+            except ImportError:
+                pass
+    try:
+        loader = _LOADERS[name]
+    except KeyError:
+        raise ValueError('Unknown JSON backend "%s"' % name)
+    return loader()
+
+
+def available():
+    """Return the names of the installed backends, fastest first."""
+    names = []
+    for name in BACKENDS:
+        try:
+            _LOADERS[name]()
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def use(codec):
+    """Select the codec used from now on, by name or as a Codec."""
+    global _current
+    if not isinstance(codec, Codec):
+        codec = get_codec(codec)
+    _current = codec
+    return codec
+
+
+def current():
+    """Return the codec in use."""
+    return _current
+
+
+def dumps(obj):
+    return _current.dumps(obj)
+
+
+def loads(data):
+    return _current.loads(data)
+
+
+try:
+    _current = _json()
+except ImportError:
+    _current = _simplejson()
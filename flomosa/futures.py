@@ -0,0 +1,232 @@
+"""
+Futures and a bounded worker pool for running Flomosa API calls concurrently.
+"""
+
+import sys
+import threading
+import Queue
+
+
+class TimeoutError(Exception):
+    """The operation did not complete within the given timeout."""
+
+
+class CancelledError(Exception):
+    """The future was cancelled before it started running."""
+
+
+class Future(object):
+    """The result of a call that may not have completed yet."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._state = 'pending'
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+
+    def __repr__(self):
+        return '<Future %s>' % self._state
+
+    def done(self):
+        """Return True if the call finished or was cancelled."""
+        return self._state in ('finished', 'cancelled')
+
+    def running(self):
+        """Return True if the call is currently executing."""
+        return self._state == 'running'
+
+    def cancelled(self):
+        """Return True if the call was cancelled."""
+        return self._state == 'cancelled'
+
+    def cancel(self):
+        """Cancel the call if it has not started yet."""
+        self._condition.acquire()
+        try:
+            if self._state == 'pending':
+                self._state = 'cancelled'
+                self._condition.notify_all()
+            elif self._state != 'cancelled':
+                return False
+        finally:
+            self._condition.release()
+        self._run_callbacks()
+        return True
+
+    def set_running(self):
+        """Mark the future as running, returns False if it was cancelled."""
+        self._condition.acquire()
+        try:
+            if self._state == 'cancelled':
+                return False
+            self._state = 'running'
+            return True
+        finally:
+            self._condition.release()
+
+    def set_result(self, result):
+        """Store the result of the call and wake up any waiters."""
+        self._finish(result, None)
+
+    def set_exc_info(self, exc_info):
+        """Store the exception raised by the call and wake up any waiters."""
+        self._finish(None, exc_info)
+
+    def _finish(self, result, exc_info):
+        self._condition.acquire()
+        try:
+            self._result = result
+            self._exc_info = exc_info
+            self._state = 'finished'
+            self._condition.notify_all()
+        finally:
+            self._condition.release()
+        self._run_callbacks()
+
+    def _run_callbacks(self):
+        self._condition.acquire()
+        try:
+            callbacks, self._callbacks = self._callbacks, []
+        finally:
+            self._condition.release()
+        for callback in callbacks:
+            callback(self)
+
+    def _wait(self, timeout):
+        self._condition.acquire()
+        try:
+            if not self.done():
+                self._condition.wait(timeout)
+            if self._state == 'cancelled':
+                raise CancelledError()
+            if not self.done():
+                raise TimeoutError()
+        finally:
+            self._condition.release()
+
+    def add_done_callback(self, callback):
+        """Call callback(future) once the future is done."""
+        self._condition.acquire()
+        try:
+            if not self.done():
+                self._callbacks.append(callback)
+                return
+        finally:
+            self._condition.release()
+        callback(self)
+
+    def exception(self, timeout=None):
+        """Return the exception raised by the call, or None."""
+        self._wait(timeout)
+        if self._exc_info:
+            return self._exc_info[1]
+        return None
+
+    def result(self, timeout=None):
+        """Return the value of the call, re-raising any exception."""
+        self._wait(timeout)
+        if self._exc_info:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+
+def as_completed(futures, timeout=None):
+    """Yield futures as they complete, in completion order."""
+    futures = list(futures)
+    finished = Queue.Queue()
+    for future in futures:
+        future.add_done_callback(finished.put)
+    for i in xrange(len(futures)):
+        try:
+            yield finished.get(True, timeout)
+        except Queue.Empty:
+            raise TimeoutError()
+
+
+def wait(futures, timeout=None):
+    """Block until every future is done and return them."""
+    futures = list(futures)
+    for future in as_completed(futures, timeout):
+        pass
+    return futures
+
+
+class Executor(object):
+    """Run callables on at most max_workers threads.
+
+    When max_pending is set, submit() blocks once that many calls are queued,
+    so producers cannot run arbitrarily far ahead of the workers.
+    """
+
+    def __init__(self, max_workers=10, max_pending=0):
+        if max_workers < 1:
+            raise ValueError('max_workers must be at least 1.')
+        self.max_workers = max_workers
+        self._queue = Queue.Queue(max_pending)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown(wait=True)
+        return False
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedule fn(*args, **kwargs) and return a Future for it."""
+        if self._shutdown:
+            raise RuntimeError('Cannot submit after shutdown.')
+        future = Future()
+        self._queue.put((future, fn, args, kwargs))
+        self._spawn()
+        return future
+
+    def map(self, fn, *iterables):
+        """Like map(), but calls run concurrently. Results keep input order."""
+        futures = [self.submit(fn, *args) for args in zip(*iterables)]
+        return [future.result() for future in futures]
+
+    def _spawn(self):
+        self._lock.acquire()
+        try:
+            if len(self._threads) >= self.max_workers:
+                return
+            thread = threading.Thread(target=self._work,
+                name='flomosa-worker-%d' % len(self._threads))
+            thread.daemon = True
+            self._threads.append(thread)
+            thread.start()
+        finally:
+            self._lock.release()
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            if not future.set_running():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except:
+                future.set_exc_info(sys.exc_info())
+            else:
+                future.set_result(result)
+
+    def shutdown(self, wait=True):
+        """Stop accepting work and let the workers exit once idle."""
+        self._lock.acquire()
+        try:
+            self._shutdown = True
+            threads = list(self._threads)
+        finally:
+            self._lock.release()
+        for thread in threads:
+            self._queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
@@ -0,0 +1,180 @@
+"""
+Per-request instrumentation for the Flomosa client.
+"""
+
+import bisect
+import logging
+import math
+import threading
+
+
+class RequestEvent(object):
+    """Timings and sizes of one API call, including any retries.
+
+    sign, connect, transfer and decode seconds add up to about total_seconds.
+    connect_seconds is zero when a pooled connection was reused.
+    """
+
+    __slots__ = ('endpoint', 'url', 'method', 'status', 'attempts', 'cached',
+        'sign_seconds', 'connect_seconds', 'transfer_seconds',
+        'decode_seconds', 'total_seconds', 'request_bytes', 'response_bytes',
+        'error')
+
+    def __init__(self, endpoint, url, method):
+        self.endpoint = endpoint
+        self.url = url
+        self.method = method
+        self.status = None
+        self.attempts = 0
+        self.cached = False
+        self.sign_seconds = 0.0
+        self.connect_seconds = 0.0
+        self.transfer_seconds = 0.0
+        self.decode_seconds = 0.0
+        self.total_seconds = 0.0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.error = None
+
+    def __repr__(self):
+        return '<RequestEvent %s %s %s %.1fms>' % (self.method, self.endpoint,
+            self.status, self.total_seconds * 1000)
+
+    @property
+    def retries(self):
+        return max(self.attempts - 1, 0)
+
+    def to_dict(self):
+        data = {}
+        for name in self.__slots__:
+            data[name] = getattr(self, name)
+        data['retries'] = self.retries
+        if self.error is not None:
+            data['error'] = repr(self.error)
+        return data
+
+
+class Instrument(object):
+    """Receives a RequestEvent after every API call. Does nothing."""
+
+    def request(self, event):
+        pass
+
+
+class LogInstrument(Instrument):
+    """Log one line per call, without headers or bodies."""
+
+    def __init__(self, logger=None, level=logging.DEBUG):
+        self.logger = logger or logging.getLogger('flomosa')
+        self.level = level
+
+    def request(self, event):
+        if not self.logger.isEnabledFor(self.level):
+            return
+        self.logger.log(self.level, '%s %s %s %.1fms attempts=%d sent=%d '
+            'received=%d', event.method, event.url, event.status,
+            event.total_seconds * 1000, event.attempts, event.request_bytes,
+            event.response_bytes)
+
+
+class Histogram(object):
+    """Latency histogram with logarithmic buckets.
+
+    Bucket bounds grow by ratio from minimum seconds, so percentiles are
+    accurate to within that ratio while memory stays constant.
+    """
+
+    def __init__(self, minimum=0.0001, maximum=600.0, ratio=1.05):
+        self.bounds = []
+        bound = minimum
+        while bound < maximum:
+            self.bounds.append(bound)
+            bound *= ratio
+        self.bounds.append(maximum)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """Return the upper bound of the bucket holding the percentile."""
+        if not self.count:
+            return None
+        rank = max(int(math.ceil(self.count * percent / 100.0)), 1)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                if index < len(self.bounds):
+                    return min(self.bounds[index], self.max)
+                return self.max
+        return self.max
+
+    def mean(self):
+        if not self.count:
+            return None
+        return self.total / self.count
+
+
+class Histograms(Instrument):
+    """Latency histograms and counters per endpoint."""
+
+    percentiles = (50, 95, 99)
+
+    def __init__(self):
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    def request(self, event):
+        self._lock.acquire()
+        try:
+            try:
+                stats = self.endpoints[event.endpoint]
+            except KeyError:
+                stats = self.endpoints[event.endpoint] = {
+                    'latency': Histogram(),
+                    'requests': 0,
+                    'errors': 0,
+                    'retries': 0,
+                    'cached': 0,
+                    'request_bytes': 0,
+                    'response_bytes': 0
+                }
+            stats['latency'].add(event.total_seconds)
+            stats['requests'] += 1
+            stats['retries'] += event.retries
+            stats['request_bytes'] += event.request_bytes
+            stats['response_bytes'] += event.response_bytes
+            if event.cached:
+                stats['cached'] += 1
+            if event.error is not None:
+                stats['errors'] += 1
+        finally:
+            self._lock.release()
+
+    def summary(self):
+        """Return counters and p50/p95/p99 latency in seconds per endpoint."""
+        self._lock.acquire()
+        try:
+            result = {}
+            for endpoint, stats in self.endpoints.iteritems():
+                summary = {}
+                for name, value in stats.iteritems():
+                    if name != 'latency':
+                        summary[name] = value
+                latency = stats['latency']
+                summary['mean'] = latency.mean()
+                summary['max'] = latency.max
+                for percent in self.percentiles:
+                    summary['p%d' % percent] = latency.percentile(percent)
+                result[endpoint] = summary
+            return result
+        finally:
+            self._lock.release()
@@ -0,0 +1,207 @@
+"""
+Thread-safe pool of persistent HTTP connections.
+"""
+
+import httplib
+import socket
+import threading
+import time
+from urlparse import urlsplit
+
+from httplib2 import Response
+
+
+class PoolTimeout(Exception):
+    """No connection became available within the given timeout."""
+
+
+class ConnectionPool(object):
+    """Keep-alive HTTP connections shared between threads.
+
+    At most maxsize connections are open per (scheme, host, port). A thread
+    that needs a connection when all of them are checked out waits for one
+    to be returned, up to wait_timeout seconds (forever when None).
+    Connections left idle for longer than idle_timeout seconds are closed.
+    """
+
+    def __init__(self, maxsize=10, idle_timeout=60, timeout=None,
+        wait_timeout=None):
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1.')
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.wait_timeout = wait_timeout
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+        self._idle = {}
+        self._in_use = {}
+        self._condition = threading.Condition()
+
+    def __repr__(self):
+        return '<ConnectionPool %r>' % (self.stats(),)
+
+    def stats(self):
+        """Return a dict of connection counters for sizing the pool."""
+        self._condition.acquire()
+        try:
+            return {
+                'in_use': sum(self._in_use.values()),
+                'idle': sum([len(idle) for idle in self._idle.values()]),
+                'created': self.created,
+                'reused': self.reused,
+                'evicted': self.evicted,
+                'hosts': len(self._in_use)
+            }
+        finally:
+            self._condition.release()
+
+    def checkout(self, scheme, host, port):
+        """Return an (connection, reused) tuple for the given host."""
+        key = (scheme, host, port)
+        self._condition.acquire()
+        try:
+            self._evict(time.time())
+            deadline = None
+            if self.wait_timeout is not None:
+                deadline = time.time() + self.wait_timeout
+            while True:
+                idle = self._idle.get(key)
+                if idle:
+                    conn = idle.pop()[0]
+                    self._in_use[key] += 1
+                    self.reused += 1
+                    return conn, True
+                in_use = self._in_use.setdefault(key, 0)
+                if in_use < self.maxsize:
+                    self._in_use[key] = in_use + 1
+                    self.created += 1
+                    break
+                if deadline is None:
+                    self._condition.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise PoolTimeout('No connection available for %s:%s'
+                            % (host, port))
+                    self._condition.wait(remaining)
+        finally:
+            self._condition.release()
+
+        if scheme == 'https':
+            conn_class = httplib.HTTPSConnection
+        else:
+            conn_class = httplib.HTTPConnection
+        return conn_class(host, port, timeout=self.timeout), False
+
+    def checkin(self, scheme, host, port, conn, reusable=True):
+        """Return a connection to the pool, closing it if not reusable."""
+        key = (scheme, host, port)
+        now = time.time()
+        self._condition.acquire()
+        try:
+            self._in_use[key] -= 1
+            if reusable:
+                self._idle.setdefault(key, []).append((conn, now))
+            self._evict(now)
+            self._condition.notify()
+        finally:
+            self._condition.release()
+        if not reusable:
+            conn.close()
+
+    def evict_idle(self):
+        """Close every connection that has been idle too long."""
+        self._condition.acquire()
+        try:
+            self._evict(time.time())
+        finally:
+            self._condition.release()
+
+    def _evict(self, now):
+        if self.idle_timeout is None:
+            return
+        cutoff = now - self.idle_timeout
+        for idle in self._idle.values():
+            while idle and idle[0][1] < cutoff:
+                idle.pop(0)[0].close()
+                self.evicted += 1
+
+    def close(self):
+        """Close every idle connection."""
+        self._condition.acquire()
+        try:
+            idle, self._idle = self._idle, {}
+        finally:
+            self._condition.release()
+        for connections in idle.values():
+            for conn, last_used in connections:
+                conn.close()
+
+    def request(self, uri, method='GET', body=None, headers=None,
+        timings=None):
+        """Perform a request on a pooled connection.
+
+        body is a string, or a callable returning an iterable of strings
+        which is sent with chunked transfer encoding. Returns an
+        httplib2.Response and the body, like httplib2.Http.request. When
+        timings is a dict, the seconds spent connecting are stored under
+        'connect' and, for chunked bodies, the bytes sent under 'sent'.
+        """
+        scheme, netloc, path, query, fragment = urlsplit(uri)
+        if scheme == 'https':
+            default_port = 443
+        else:
+            default_port = 80
+        host, sep, port = netloc.rpartition(':')
+        if not sep or not port.isdigit():
+            host, port = netloc, default_port
+        port = int(port)
+        request_uri = path or '/'
+        if query:
+            request_uri = '%s?%s' % (request_uri, query)
+
+        conn, reused = self.checkout(scheme, host, port)
+        try:
+            if timings is not None and conn.sock is None:
+                started = time.time()
+                conn.connect()
+                timings['connect'] = time.time() - started
+            try:
+                response = self._send(conn, method, request_uri, body,
+                    headers or {}, timings)
+            except (httplib.HTTPException, socket.error):
+                if not reused:
+                    raise
+                # The server closed an idle keep-alive connection.
+                conn.close()
+                response = self._send(conn, method, request_uri, body,
+                    headers or {}, timings)
+            content = response.read()
+        except:
+            self.checkin(scheme, host, port, conn, reusable=False)
+            raise
+        self.checkin(scheme, host, port, conn,
+            reusable=not response.will_close)
+        return Response(response), content
+
+    def _send(self, conn, method, request_uri, body, headers, timings=None):
+        if not callable(body):
+            conn.request(method, request_uri, body, headers)
+            return conn.getresponse()
+
+        conn.putrequest(method, request_uri)
+        for name, value in headers.iteritems():
+            conn.putheader(name, value)
+        conn.putheader('Transfer-Encoding', 'chunked')
+        conn.endheaders()
+        sent = 0
+        for chunk in body():
+            if chunk:
+                conn.send('%x\r\n%s\r\n' % (len(chunk), chunk))
+                sent += len(chunk)
+        conn.send('0\r\n\r\n')
+        if timings is not None:
+            timings['sent'] = sent
+        return conn.getresponse()
@@ -0,0 +1,206 @@
+"""
+Adaptive concurrency limits and retry backoff for the Flomosa transport.
+"""
+
+import httplib
+import random
+import socket
+import threading
+import time
+from urlparse import urlsplit
+
+IDEMPOTENT_METHODS = ('GET', 'PUT', 'DELETE')
+RETRY_STATUSES = ('429', '502', '503', '504')
+OVERLOAD_STATUSES = ('429', '503')
+
+
+def parse_retry_after(value, now=None):
+    """Return the delay in seconds asked for by a Retry-After header."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    from email.utils import mktime_tz, parsedate_tz
+    parsed = parsedate_tz(value)
+    if parsed is None:
+        return None
+    if now is None:
+        now = time.time()
+    return max(0.0, mktime_tz(parsed) - now)
+
+
+def endpoint_group(url):
+    """Return the part of url that identifies its endpoint, without the key."""
+    return urlsplit(url)[2].rsplit('/', 1)[0]
+
+
+class AIMDLimiter(object):
+    """Concurrency limit with additive increase and multiplicative decrease.
+
+    Each successful call raises the limit by increase / limit, about increase
+    per round of calls, and an overload response multiplies it by decrease.
+    Only calls started since the last decrease can lower it again, so a burst
+    of rejections counts once. acquire() blocks while limit calls are in
+    flight.
+    """
+
+    def __init__(self, limit=10, minimum=1, maximum=100, increase=1.0,
+        decrease=0.5):
+        self.limit = float(limit)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.in_flight = 0
+        self._generation = 0
+        self._condition = threading.Condition()
+
+    def __repr__(self):
+        return '<AIMDLimiter %.2f (%d in flight)>' % (self.limit,
+            self.in_flight)
+
+    def acquire(self):
+        """Wait for a free slot and return a token to pass to release()."""
+        self._condition.acquire()
+        try:
+            while self.in_flight >= max(int(self.limit), 1):
+                self._condition.wait()
+            self.in_flight += 1
+            return self._generation
+        finally:
+            self._condition.release()
+
+    def release(self, token, success=True, overloaded=False):
+        """Free a slot and adjust the limit from the call's outcome."""
+        self._condition.acquire()
+        try:
+            self.in_flight -= 1
+            if overloaded:
+                if token == self._generation:
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self._generation += 1
+            elif success:
+                self.limit = min(self.maximum,
+                    self.limit + self.increase / self.limit)
+            self._condition.notify_all()
+        finally:
+            self._condition.release()
+
+
+class Throttle(object):
+    """Per-endpoint AIMD limits and retries with jittered backoff.
+
+    Calls to the same endpoint share one AIMDLimiter. Responses with a
+    status in statuses, and connection errors, are retried up to max_retries
+    times for methods in methods only. The wait before a retry honors
+    Retry-After, and is otherwise drawn uniformly from zero to
+    backoff * 2 ** attempt; either way it is capped at max_backoff.
+    """
+
+    def __init__(self, max_retries=3, backoff=0.5, max_backoff=30, limit=10,
+        minimum=1, maximum=100, methods=IDEMPOTENT_METHODS,
+        statuses=RETRY_STATUSES, sleep=time.sleep):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.limit = limit
+        self.minimum = minimum
+        self.maximum = maximum
+        self.methods = methods
+        self.statuses = statuses
+        self.sleep = sleep
+        self.requests = 0
+        self.retries = 0
+        self.overloaded = 0
+        self.failures = 0
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, url):
+        """Return the AIMDLimiter for the endpoint of url."""
+        group = endpoint_group(url)
+        self._lock.acquire()
+        try:
+            try:
+                return self._limiters[group]
+            except KeyError:
+                limiter = self._limiters[group] = AIMDLimiter(self.limit,
+                    self.minimum, self.maximum)
+                return limiter
+        finally:
+            self._lock.release()
+
+    def delay(self, attempt, retry_after=None):
+        """Return how long to wait before retry number attempt (from 0)."""
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        return random.uniform(0, min(self.max_backoff,
+            self.backoff * 2 ** attempt))
+
+    def call(self, url, method, send):
+        """Call send() under the endpoint's limit, retrying when allowed.
+
+        send returns a (response, content) tuple and is called again for
+        every attempt.
+        """
+        limiter = self.limiter(url)
+        retryable = method in self.methods
+        attempt = 0
+        while True:
+            self._count('requests')
+            token = limiter.acquire()
+            try:
+                resp, content = send()
+            except (httplib.HTTPException, socket.error):
+                limiter.release(token, success=False)
+                if not retryable or attempt >= self.max_retries:
+                    self._count('failures')
+                    raise
+                retry_after = None
+            except:
+                # Anything else, such as PoolTimeout or KeyboardInterrupt,
+                # must still give the slot back.
+                limiter.release(token, success=False)
+                self._count('failures')
+                raise
+            else:
+                status = resp['status']
+                overloaded = status in OVERLOAD_STATUSES
+                if overloaded:
+                    self._count('overloaded')
+                limiter.release(token, success=status[0] != '5',
+                    overloaded=overloaded)
+                if status not in self.statuses:
+                    return resp, content
+                if not retryable or attempt >= self.max_retries:
+                    self._count('failures')
+                    return resp, content
+                retry_after = parse_retry_after(resp.get('retry-after'))
+            self._count('retries')
+            self.sleep(self.delay(attempt, retry_after))
+            attempt += 1
+
+    def _count(self, name):
+        self._lock.acquire()
+        try:
+            setattr(self, name, getattr(self, name) + 1)
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        """Return the current limit per endpoint and the retry counters."""
+        self._lock.acquire()
+        try:
+            limits = {}
+            for group, limiter in self._limiters.iteritems():
+                limits[group] = limiter.limit
+            return {
+                'limits': limits,
+                'requests': self.requests,
+                'retries': self.retries,
+                'overloaded': self.overloaded,
+                'failures': self.failures
+            }
+        finally:
+            self._lock.release()
@@ -0,0 +1,478 @@
+"""
+In-process stand-in for the Flomosa API, for tests and load tests.
+
+StandInServer serves every route in Client.endpoints from memory on a
+background thread and checks the OAuth signature of each request. Latency
+and error responses can be injected to see how a client copes with a slow
+or overloaded API.
+"""
+
+import BaseHTTPServer
+import SocketServer
+import datetime
+import hmac
+import json
+import random
+import re
+import socket
+import threading
+import time
+import urllib
+from hashlib import sha1
+from urlparse import parse_qsl, urlsplit
+
+import oauth2 as oauth
+
+from flomosa.stats import METRICS, period_end, period_start
+
+# Route name, as in Client.endpoints, and the pattern of its path.
+ROUTES = (
+    ('processes', re.compile(r'^/processes/([^/]+)\.json$')),
+    ('teams', re.compile(r'^/teams/([^/]+)\.json$')),
+    ('requests', re.compile(r'^/requests/([^/]+)\.json$')),
+    ('process_search', re.compile(r'^/search/process/([^/]+)\.json$')),
+    ('step_search', re.compile(r'^/search/step/([^/]+)\.json$')),
+    ('stats_year', re.compile(r'^/stats/by-year/([^/]+)\.json$')),
+    ('stats_month', re.compile(r'^/stats/by-month/([^/]+)\.json$')),
+    ('stats_week', re.compile(r'^/stats/by-week/([^/]+)\.json$')),
+    ('stats_day', re.compile(r'^/stats/by-day/([^/]+)\.json$'))
+)
+
+# The query parameters giving the period of each stats route.
+STATS_PERIODS = {
+    'stats_year': ('year', ('year',)),
+    'stats_month': ('month', ('year', 'month')),
+    'stats_week': ('week', ('year', 'week_num')),
+    'stats_day': ('day', ('year', 'month', 'day'))
+}
+
+try:
+    _compare_digest = hmac.compare_digest
+except AttributeError:
+    def _compare_digest(a, b):
+        return a == b
+
+
+class HTTPError(Exception):
+    """An error response with a Flomosa JSON body."""
+
+    def __init__(self, code, message, headers=None):
+        Exception.__init__(self, message)
+        self.code = code
+        self.message = message
+        self.headers = headers or {}
+
+
+class StandInServer(object):
+    """Serve the Flomosa API from memory on a background thread.
+
+    consumers maps OAuth consumer keys to secrets; requests from any other
+    consumer, with a bad signature or with a timestamp more than
+    timestamp_window seconds off are answered with 401. Every response is
+    delayed by latency plus up to jitter seconds, and answered instead with
+    a status from error_statuses with probability error_rate. These
+    attributes may be changed while the server runs. seed makes the
+    injected delays and errors reproducible.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, consumers=None, latency=0.0,
+        jitter=0.0, error_rate=0.0, error_statuses=(503,), retry_after=None,
+        timestamp_window=300, seed=None):
+        if consumers is None:
+            consumers = {'test-key': 'test-secret'}
+        self.consumers = consumers
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_statuses = error_statuses
+        self.retry_after = retry_after
+        self.timestamp_window = timestamp_window
+        self.processes = {}
+        self.teams = {}
+        self.requests = {}
+        self.hits = {}
+        self.errors = {}
+        self._random = random.Random(seed)
+        self._signature = oauth.SignatureMethod_HMAC_SHA1()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.httpd = _HTTPServer((host, port), _Handler)
+        self.httpd.standin = self
+
+    def __repr__(self):
+        return '<StandInServer %s>' % self.url
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def host(self):
+        return self.httpd.server_address[0]
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % (self.host, self.port)
+
+    def start(self):
+        """Start serving on a daemon thread and return self."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever,
+            kwargs={'poll_interval': 0.05})
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the listening socket and connections."""
+        if self._thread is not None:
+            self.httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.httpd.server_close()
+        self.httpd.close_connections()
+
+    def add_request(self, process, step=None, timestamp=None, seconds=None,
+        is_completed=True, key=None):
+        """Record a request through a process, for search and stats.
+
+        Returns the request dict, as served at requests/<key>.json.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        if key is None:
+            key = sha1('%s %s %r %s' % (process, step, timestamp,
+                self._random.random())).hexdigest()
+        request = {
+            'key': key,
+            'kind': 'Request',
+            'process': process,
+            'step': step,
+            'timestamp': timestamp,
+            'seconds': seconds,
+            'is_completed': is_completed
+        }
+        self._lock.acquire()
+        try:
+            self.requests[key] = request
+        finally:
+            self._lock.release()
+        return request
+
+    def reset(self):
+        """Forget every stored object and counter."""
+        self._lock.acquire()
+        try:
+            self.processes.clear()
+            self.teams.clear()
+            self.requests.clear()
+            self.hits.clear()
+            self.errors.clear()
+        finally:
+            self._lock.release()
+
+    def _count(self, counters, name):
+        self._lock.acquire()
+        try:
+            counters[name] = counters.get(name, 0) + 1
+        finally:
+            self._lock.release()
+
+    def _fault(self):
+        """Return the delay and any injected status for one request."""
+        self._lock.acquire()
+        try:
+            delay = self.latency
+            if self.jitter:
+                delay += self._random.uniform(0, self.jitter)
+            status = None
+            if self.error_rate and self._random.random() < self.error_rate:
+                status = self._random.choice(self.error_statuses)
+            return delay, status
+        finally:
+            self._lock.release()
+
+    def verify(self, method, url, authorization):
+        """Raise HTTPError(401) unless the request is signed by a consumer.
+
+        The signature is checked with oauth2 rather than flomosa.signing, so
+        a mistake in the client's signer cannot also pass here. Query
+        parameters are signed, the body never is.
+        """
+        if not authorization or not authorization.startswith('OAuth '):
+            raise HTTPError(401, 'Missing OAuth credentials')
+        try:
+            request = oauth.Request.from_request(method, url,
+                headers={'Authorization': authorization})
+        except oauth.Error:
+            raise HTTPError(401, 'Malformed OAuth credentials')
+        key = request.get('oauth_consumer_key')
+        secret = self.consumers.get(key)
+        if secret is None:
+            raise HTTPError(401, 'Unknown consumer')
+        try:
+            timestamp = int(request['oauth_timestamp'])
+            # oauth2 decodes header values to unicode.
+            signature = request['oauth_signature'].encode('ascii')
+        except (KeyError, ValueError, UnicodeError):
+            raise HTTPError(401, 'Incomplete OAuth credentials')
+        if self.timestamp_window is not None and \
+            abs(time.time() - timestamp) > self.timestamp_window:
+            raise HTTPError(401, 'Expired timestamp')
+        if request.get('oauth_signature_method') != self._signature.name:
+            raise HTTPError(401, 'Unsupported signature method')
+        expected = self._signature.sign(request, oauth.Consumer(key, secret),
+            None)
+        if not _compare_digest(expected, signature):
+            raise HTTPError(401, 'Invalid signature')
+
+    def handle(self, method, url, headers, body):
+        """Return the status, headers and JSON body answering a request."""
+        scheme, netloc, path, query, fragment = urlsplit(url)
+        query = dict(parse_qsl(query, keep_blank_values=True))
+        for name, pattern in ROUTES:
+            match = pattern.match(path)
+            if match is not None:
+                break
+        else:
+            name = None
+
+        delay, status = self._fault()
+        if delay:
+            time.sleep(delay)
+        try:
+            if name is None:
+                raise HTTPError(404, 'No such resource')
+            self._count(self.hits, name)
+            if status is not None:
+                extra = {}
+                if self.retry_after is not None:
+                    extra['Retry-After'] = str(self.retry_after)
+                raise HTTPError(status, 'Injected error', extra)
+            self.verify(method, url, headers.get('authorization'))
+            key = urllib.unquote(match.group(1))
+            return self._route(name, method, key, query, headers, body)
+        except HTTPError, e:
+            if name is not None:
+                self._count(self.errors, name)
+            return e.code, e.headers, json.dumps({'code': e.code,
+                'message': e.message})
+
+    def _route(self, name, method, key, query, headers, body):
+        if name in ('processes', 'teams'):
+            return self._objects(name, method, key, headers, body)
+        if method != 'GET':
+            raise HTTPError(405, 'Method not allowed')
+        if name == 'requests':
+            self._lock.acquire()
+            try:
+                request = self.requests.get(key)
+            finally:
+                self._lock.release()
+            if request is None:
+                raise HTTPError(404, 'Request not found')
+            return 200, {}, json.dumps(request)
+        elif name in ('process_search', 'step_search'):
+            return 200, {}, json.dumps(self._search(name, key, query))
+        return 200, {}, json.dumps(self._stats(name, key, query))
+
+    def _objects(self, name, method, key, headers, body):
+        store = getattr(self, name)
+        kind = name == 'processes' and 'Process' or 'Team'
+        if method == 'PUT':
+            try:
+                data = json.loads(body)
+            except ValueError:
+                raise HTTPError(400, 'Invalid JSON')
+            if not isinstance(data, dict) or not data.get('name'):
+                raise HTTPError(400, 'A %s needs a name' % kind)
+            data['key'] = key
+            data['kind'] = kind
+            self._lock.acquire()
+            try:
+                created = key not in store
+                store[key] = json.dumps(data)
+            finally:
+                self._lock.release()
+            return created and 201 or 200, {}, json.dumps({'key': key,
+                'kind': kind})
+
+        self._lock.acquire()
+        try:
+            if method == 'GET':
+                content = store.get(key)
+            elif method == 'DELETE':
+                content = store.pop(key, None)
+            else:
+                raise HTTPError(405, 'Method not allowed')
+        finally:
+            self._lock.release()
+        if content is None:
+            raise HTTPError(404, '%s not found' % kind)
+        if method == 'DELETE':
+            return 204, {}, ''
+        etag = '"%s"' % sha1(content).hexdigest()
+        if headers.get('if-none-match') == etag:
+            return 304, {'ETag': etag}, ''
+        return 200, {'ETag': etag}, content
+
+    def _matching(self, field, key):
+        self._lock.acquire()
+        try:
+            return [request for request in self.requests.itervalues()
+                if request[field] == key]
+        finally:
+            self._lock.release()
+
+    def _search(self, name, key, query):
+        """Return the requests through a process or step, oldest first."""
+        try:
+            start = float(query.get('start', 0))
+            end = float(query.get('end', time.time()))
+            limit = int(query.get('limit', 25))
+        except ValueError:
+            raise HTTPError(400, 'Invalid search parameters')
+        field = name == 'process_search' and 'process' or 'step'
+        results = [request for request in self._matching(field, key)
+            if start <= request['timestamp'] <= end]
+        results.sort(key=lambda request: (request['timestamp'],
+            request['key']))
+        return results[:limit]
+
+    def _stats(self, name, key, query):
+        """Return the metrics of the requests through a process in a period."""
+        granularity, fields = STATS_PERIODS[name]
+        try:
+            period = tuple([int(query[field]) for field in fields])
+            first = period_start(period, granularity)
+            last = period_end(period, granularity)
+        except (KeyError, ValueError):
+            raise HTTPError(400, 'Invalid period')
+
+        num_requests = 0
+        seconds = []
+        for request in self._matching('process', key):
+            day = datetime.datetime.utcfromtimestamp(
+                request['timestamp']).date()
+            if first <= day <= last:
+                num_requests += 1
+                if request['is_completed'] and request['seconds'] is not None:
+                    seconds.append(request['seconds'])
+        stats = {
+            'num_requests': num_requests,
+            'num_requests_completed': len(seconds),
+            'min_request_seconds': None,
+            'max_request_seconds': None,
+            'avg_request_seconds': None,
+            'total_request_seconds': sum(seconds)
+        }
+        if seconds:
+            stats['min_request_seconds'] = min(seconds)
+            stats['max_request_seconds'] = max(seconds)
+            stats['avg_request_seconds'] = sum(seconds) / len(seconds)
+        metrics = METRICS
+        if query.get('filter'):
+            metrics = query['filter'].split(',')
+        result = {}
+        for metric in metrics:
+            if metric in stats:
+                result[metric] = stats[metric]
+        return result
+
+
+class _HTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    allow_reuse_address = True
+
+    def __init__(self, address, handler):
+        BaseHTTPServer.HTTPServer.__init__(self, address, handler)
+        # Open keep-alive connections and their threads, closed by stop().
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        thread = threading.Thread(target=self.process_request_thread,
+            args=(request, client_address))
+        thread.daemon = True
+        self._lock.acquire()
+        try:
+            self._connections[request] = thread
+        finally:
+            self._lock.release()
+        thread.start()
+
+    def shutdown_request(self, request):
+        self._lock.acquire()
+        try:
+            self._connections.pop(request, None)
+        finally:
+            self._lock.release()
+        BaseHTTPServer.HTTPServer.shutdown_request(self, request)
+
+    def close_connections(self, timeout=1.0):
+        self._lock.acquire()
+        try:
+            connections = self._connections.items()
+        finally:
+            self._lock.release()
+        for request, thread in connections:
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        for request, thread in connections:
+            thread.join(timeout)
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Buffer each response into one write and send it without waiting for
+    # the client's delayed ACK.
+    wbufsize = -1
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _dispatch(self):
+        if self.headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = self._read_chunked()
+        else:
+            body = self.rfile.read(int(self.headers.get('content-length', 0)))
+        url = 'http://%s%s' % (self.headers.get('host', '%s:%d' %
+            self.server.server_address), self.path)
+        headers = {}
+        for name in self.headers.keys():
+            headers[name.lower()] = self.headers[name]
+        status, headers, content = self.server.standin.handle(self.command,
+            url, headers, body)
+
+        self.send_response(status)
+        if content:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in headers.iteritems():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_PUT = do_DELETE = do_POST = _dispatch
+
+    def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().split(';', 1)[0].strip(), 16)
+            if not size:
+                while self.rfile.readline().strip():
+                    pass
+                break
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+        return ''.join(chunks)
+
+    def log_message(self, *args):
+        pass
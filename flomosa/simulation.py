@@ -0,0 +1,443 @@
+"""
+Monte Carlo simulation of requests flowing through a process.
+
+Each simulated request starts at a start step, spends a service time drawn
+from the step's distribution there, and leaves by one of the step's
+actions, chosen by the actions' probabilities, until it reaches an
+is_complete action. With numpy all requests in a batch advance one step per
+iteration as arrays; without it each request is simulated in turn.
+"""
+
+import bisect
+import math
+import random
+
+# numpy is optional and only imported by the first simulation.
+numpy = False
+
+# Service time distributions: (name, parameters) as accepted by Simulator.
+FIXED, EXPONENTIAL, UNIFORM, LOGNORMAL, NORMAL = range(5)
+DISTRIBUTIONS = {
+    'fixed': (FIXED, 1),
+    'exponential': (EXPONENTIAL, 1),
+    'uniform': (UNIFORM, 2),
+    'lognormal': (LOGNORMAL, 2),
+    'normal': (NORMAL, 2)
+}
+
+# Choice targets that are not steps.
+COMPLETE = -1
+STOP = -2
+
+# Request outcomes.
+UNFINISHED, COMPLETED, STUCK = range(3)
+
+
+def _numpy():
+    global numpy
+    if numpy is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+    return numpy
+
+
+def _key(obj):
+    return getattr(obj, 'key', obj)
+
+
+def _distribution(spec):
+    """Return (kind, a, b) for a service time spec.
+
+    spec is a number of seconds, or a tuple of a name in DISTRIBUTIONS and
+    its parameters: ('exponential', mean), ('uniform', low, high),
+    ('lognormal', mu, sigma) of the underlying normal, ('normal', mean,
+    sigma) clipped at zero, or ('fixed', seconds).
+    """
+    if isinstance(spec, (int, long, float)):
+        spec = ('fixed', spec)
+    try:
+        kind, count = DISTRIBUTIONS[spec[0]]
+    except (KeyError, TypeError, IndexError):
+        raise ValueError('Unknown service time %r' % (spec,))
+    params = [float(value) for value in spec[1:]]
+    if len(params) != count:
+        raise ValueError('%s takes %d parameters' % (spec[0], count))
+    params.append(0.0)
+    return kind, params[0], params[1]
+
+
+class Simulator(object):
+    """A process compiled for simulation.
+
+    probabilities maps actions, or their keys, to weights; the actions of a
+    step are chosen in proportion to them and default to 1. An action with
+    several outgoing steps goes to one of them at random. service_times
+    maps steps, or their keys, to a service time spec (see _distribution),
+    and default_service is used for the others. A step with no actions, or
+    an action going nowhere without completing, leaves the request stuck.
+    """
+
+    def __init__(self, process, probabilities=None, service_times=None,
+        default_service=0.0):
+        probabilities = dict([(_key(action), weight) for action, weight in
+            (probabilities or {}).iteritems()])
+        service_times = dict([(_key(step), spec) for step, spec in
+            (service_times or {}).iteritems()])
+
+        steps = process._steps
+        self.keys = sorted(steps)
+        ids = dict([(key, i) for i, key in enumerate(self.keys)])
+        self.teams = []
+        self.starts = []
+        self.kinds = []
+        self.a = []
+        self.b = []
+        # Choices of all steps in one sorted array: the choices of step i
+        # have cumulative weights in (i, i + 1] and lead to targets.
+        self.cumulative = []
+        self.targets = []
+        self.num_choices = []
+        for i, key in enumerate(self.keys):
+            step = steps[key]
+            if step.is_start:
+                self.starts.append(i)
+            self.teams.append(_key(step.team))
+            kind, a, b = _distribution(service_times.get(key,
+                default_service))
+            self.kinds.append(kind)
+            self.a.append(a)
+            self.b.append(b)
+
+            choices = []
+            actions = sorted(step.get_actions_by_name(),
+                key=lambda action: action.key)
+            for action in actions:
+                weight = float(probabilities.get(action.key, 1.0))
+                if weight < 0:
+                    raise ValueError('Negative probability for action "%s"'
+                        % action.key)
+                outgoing = [ids[key] for key in sorted(action._outgoing)
+                    if key in ids]
+                if action.is_complete:
+                    choices.append((weight, COMPLETE))
+                elif outgoing:
+                    for target in outgoing:
+                        choices.append((weight / len(outgoing), target))
+                else:
+                    choices.append((weight, STOP))
+            total = sum([weight for weight, target in choices])
+            if not total:
+                choices = []
+            seen = 0.0
+            for n, (weight, target) in enumerate(choices):
+                seen += weight
+                if n == len(choices) - 1:
+                    self.cumulative.append(i + 1.0)
+                else:
+                    self.cumulative.append(i + seen / total)
+                self.targets.append(target)
+            self.num_choices.append(len(choices))
+        if not self.starts:
+            raise ValueError('The process has no start step.')
+
+    def __repr__(self):
+        return '<Simulator %d steps>' % len(self.keys)
+
+    def run(self, requests, seed=None, max_hops=1000, batch_size=1000000):
+        """Simulate requests and return a SimulationResult.
+
+        The same seed gives the same result for the same backend. Requests
+        still moving after max_hops steps, such as those caught in a loop
+        without exit, are counted as unfinished. With numpy, at most
+        batch_size requests are held in memory at once.
+        """
+        np = _numpy()
+        result = SimulationResult(self)
+        if np is None:
+            _simulate_python(self, result, requests, random.Random(seed),
+                max_hops)
+            return result
+        rng = np.random.RandomState(seed)
+        arrays = _Arrays(np, self)
+        done = 0
+        while done < requests:
+            size = min(batch_size, requests - done)
+            _simulate_numpy(np, arrays, result, size, rng, max_hops)
+            done += size
+        if result.times:
+            result.times = np.concatenate(result.times).tolist()
+        return result
+
+
+class _Arrays(object):
+    """The tables of a Simulator as numpy arrays."""
+
+    def __init__(self, np, simulator):
+        self.size = len(simulator.keys)
+        self.starts = np.array(simulator.starts, dtype=np.intp)
+        self.kinds = np.array(simulator.kinds, dtype=np.int8)
+        self.a = np.array(simulator.a)
+        self.b = np.array(simulator.b)
+        self.cumulative = np.array(simulator.cumulative)
+        # A search past the last choice lands on the STOP at the end.
+        self.targets = np.array(simulator.targets + [STOP], dtype=np.intp)
+        self.num_choices = np.array(simulator.num_choices, dtype=np.intp)
+        self.used_kinds = sorted(set(simulator.kinds) - set([FIXED]))
+        self.uniform_kind = None
+        if len(set(simulator.kinds)) == 1:
+            self.uniform_kind = simulator.kinds[0]
+
+
+def _sample_numpy(np, rng, arrays, steps):
+    a = arrays.a[steps]
+    if arrays.uniform_kind is not None:
+        return _sample_kind(np, rng, arrays.uniform_kind, a,
+            arrays.b[steps], len(steps))
+    kinds = arrays.kinds[steps]
+    b = arrays.b[steps]
+    seconds = a
+    for kind in arrays.used_kinds:
+        mask = kinds == kind
+        count = int(np.count_nonzero(mask))
+        if count:
+            seconds[mask] = _sample_kind(np, rng, kind, a[mask], b[mask],
+                count)
+    return seconds
+
+
+def _sample_kind(np, rng, kind, a, b, count):
+    if kind == EXPONENTIAL:
+        return rng.standard_exponential(count) * a
+    elif kind == UNIFORM:
+        return a + (b - a) * rng.random_sample(count)
+    elif kind == LOGNORMAL:
+        return np.exp(a + b * rng.standard_normal(count))
+    elif kind == NORMAL:
+        return np.maximum(a + b * rng.standard_normal(count), 0.0)
+    return a
+
+
+def _simulate_numpy(np, arrays, result, requests, rng, max_hops):
+    # The state of the requests still moving is kept in compact arrays,
+    # so each hop only touches those; finished requests are dropped.
+    size = arrays.size
+    if len(arrays.starts) == 1:
+        current = np.empty(requests, dtype=np.intp)
+        current.fill(arrays.starts[0])
+    else:
+        current = arrays.starts[rng.randint(len(arrays.starts),
+            size=requests)]
+    elapsed = np.zeros(requests)
+    visits = np.zeros(size)
+    busy = np.zeros(size)
+    completed = 0
+    stuck = 0
+    total_hops = 0
+    completed_hops = 0
+    for hop in xrange(1, max_hops + 1):
+        if not len(current):
+            break
+        seconds = _sample_numpy(np, rng, arrays, current)
+        elapsed += seconds
+        visits += np.bincount(current, minlength=size)
+        busy += np.bincount(current, weights=seconds, minlength=size)
+        total_hops += len(current)
+
+        choice = np.searchsorted(arrays.cumulative,
+            current + rng.random_sample(len(current)), side='right')
+        following = arrays.targets[choice]
+        # The search for a step without choices lands on the next step's.
+        following[arrays.num_choices[current] == 0] = STOP
+        done = following == COMPLETE
+        count = int(np.count_nonzero(done))
+        if count:
+            completed += count
+            completed_hops += count * hop
+            result.times.append(elapsed[done])
+        moving = following >= 0
+        stuck += len(current) - count - int(np.count_nonzero(moving))
+        current = following[moving]
+        elapsed = elapsed[moving]
+
+    result.requests += requests
+    result.completed += completed
+    result.stuck += stuck
+    result.unfinished += len(current)
+    result.total_hops += total_hops
+    result.completed_hops += completed_hops
+    for i, (count, seconds) in enumerate(zip(visits.tolist(),
+        busy.tolist())):
+        result.visits[i] += int(count)
+        result.busy[i] += seconds
+
+
+def _sample_python(rng, kind, a, b):
+    if kind == FIXED:
+        return a
+    elif kind == EXPONENTIAL:
+        return rng.expovariate(1.0 / a) if a else 0.0
+    elif kind == UNIFORM:
+        return rng.uniform(a, b)
+    elif kind == LOGNORMAL:
+        return rng.lognormvariate(a, b)
+    return max(rng.gauss(a, b), 0.0)
+
+
+def _simulate_python(simulator, result, requests, rng, max_hops):
+    starts = simulator.starts
+    kinds = simulator.kinds
+    a = simulator.a
+    b = simulator.b
+    cumulative = simulator.cumulative
+    targets = simulator.targets
+    num_choices = simulator.num_choices
+    visits = result.visits
+    busy = result.busy
+    times = result.times
+    for n in xrange(requests):
+        if len(starts) == 1:
+            step = starts[0]
+        else:
+            step = starts[rng.randrange(len(starts))]
+        elapsed = 0.0
+        outcome = UNFINISHED
+        for hop in xrange(max_hops):
+            seconds = _sample_python(rng, kinds[step], a[step], b[step])
+            elapsed += seconds
+            visits[step] += 1
+            busy[step] += seconds
+            if not num_choices[step]:
+                outcome = STUCK
+                break
+            following = targets[bisect.bisect_right(cumulative,
+                step + rng.random())]
+            if following == COMPLETE:
+                outcome = COMPLETED
+                break
+            elif following == STOP:
+                outcome = STUCK
+                break
+            step = following
+        hops = hop + 1
+        result.requests += 1
+        result.total_hops += hops
+        if outcome == COMPLETED:
+            result.completed += 1
+            result.completed_hops += hops
+            times.append(elapsed)
+        elif outcome == STUCK:
+            result.stuck += 1
+        else:
+            result.unfinished += 1
+
+
+class SimulationResult(object):
+    """Outcomes, completion times and per-step load of a simulation.
+
+    times holds the completion time in seconds of every completed request.
+    visits and busy hold, per step id, the number of visits and the
+    service seconds spent there.
+    """
+
+    def __init__(self, simulator):
+        self.simulator = simulator
+        self.requests = 0
+        self.completed = 0
+        self.stuck = 0
+        self.unfinished = 0
+        self.total_hops = 0
+        self.completed_hops = 0
+        self.times = []
+        self.visits = [0] * len(simulator.keys)
+        self.busy = [0.0] * len(simulator.keys)
+
+    def __repr__(self):
+        return '<SimulationResult %d requests, %.1f%% completed>' % (
+            self.requests, self.completion_probability * 100)
+
+    @property
+    def completion_probability(self):
+        if not self.requests:
+            return 0.0
+        return self.completed / float(self.requests)
+
+    @property
+    def mean_hops(self):
+        """Mean number of steps visited per request."""
+        if not self.requests:
+            return None
+        return self.total_hops / float(self.requests)
+
+    @property
+    def mean_completed_hops(self):
+        """Mean number of steps visited per completed request."""
+        if not self.completed:
+            return None
+        return self.completed_hops / float(self.completed)
+
+    def percentile(self, percent):
+        """Return a completion time percentile, by nearest rank."""
+        if not self.times:
+            return None
+        times = sorted(self.times)
+        rank = max(int(math.ceil(len(times) * percent / 100.0)), 1)
+        return times[rank - 1]
+
+    def histogram(self, bins=20):
+        """Return (edges, counts) of the completion times in equal bins."""
+        if not self.times:
+            return [], []
+        low = min(self.times)
+        high = max(self.times)
+        width = (high - low) / bins or 1.0
+        counts = [0] * bins
+        for value in self.times:
+            counts[min(int((value - low) / width), bins - 1)] += 1
+        return [low + width * i for i in xrange(bins + 1)], counts
+
+    def step_load(self):
+        """Return visits per request, service seconds and share by step key."""
+        total = sum(self.busy) or 1.0
+        load = {}
+        for key, count, seconds in zip(self.simulator.keys, self.visits,
+            self.busy):
+            load[key] = {
+                'visits': count / float(self.requests or 1),
+                'seconds': seconds,
+                'share': seconds / total
+            }
+        return load
+
+    def team_load(self):
+        """Return step_load() summed by the team of each step."""
+        step_load = self.step_load()
+        load = {}
+        for key, team in zip(self.simulator.keys, self.simulator.teams):
+            totals = load.setdefault(team, {'visits': 0.0, 'seconds': 0.0,
+                'share': 0.0})
+            for name, value in step_load[key].iteritems():
+                totals[name] += value
+        return load
+
+    def summary(self):
+        return {
+            'requests': self.requests,
+            'completed': self.completed,
+            'stuck': self.stuck,
+            'unfinished': self.unfinished,
+            'completion_probability': self.completion_probability,
+            'mean_hops': self.mean_hops,
+            'mean_completed_hops': self.mean_completed_hops,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99)
+        }
+
+
+def simulate(process, requests, probabilities=None, service_times=None,
+    default_service=0.0, seed=None, max_hops=1000):
+    """Simulate requests through a process, see Simulator."""
+    return Simulator(process, probabilities, service_times,
+        default_service).run(requests, seed=seed, max_hops=max_hops)
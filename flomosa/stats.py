@@ -0,0 +1,557 @@
+"""
+Calendar periods and columnar time series for Flomosa statistics.
+"""
+
+import datetime
+import time
+from array import array
+from itertools import izip
+
+# numpy is optional and only imported by the first rollup().
+numpy = False
+
+NAN = float('nan')
+
+GRANULARITIES = ('day', 'week', 'month', 'year')
+
+METRICS = (
+    'num_requests',
+    'num_requests_completed',
+    'min_request_seconds',
+    'max_request_seconds',
+    'avg_request_seconds',
+    'total_request_seconds'
+)
+
+COUNTS = ('num_requests', 'num_requests_completed')
+
+# How rollup() combines each metric across days.
+AGGREGATES = {
+    'num_requests': 'sum',
+    'num_requests_completed': 'sum',
+    'min_request_seconds': 'min',
+    'max_request_seconds': 'max',
+    'avg_request_seconds': 'avg',
+    'total_request_seconds': 'sum'
+}
+
+
+def to_date(value):
+    """Return value as a datetime.date."""
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    elif isinstance(value, datetime.date):
+        return value
+    raise TypeError('Expected a date, got %r' % (value,))
+
+
+def period_of(day, granularity):
+    """Return the period containing the given date.
+
+    Periods are tuples matching the arguments of the get_*_stats methods:
+    (year, month, day), (year, week_num), (year, month) or (year,). Weeks
+    are ISO 8601 weeks.
+    """
+    if granularity == 'day':
+        return (day.year, day.month, day.day)
+    elif granularity == 'week':
+        iso_year, week_num, weekday = day.isocalendar()
+        return (iso_year, week_num)
+    elif granularity == 'month':
+        return (day.year, day.month)
+    elif granularity == 'year':
+        return (day.year,)
+    raise ValueError('Unknown granularity "%s"' % granularity)
+
+
+def period_start(period, granularity):
+    """Return the first date of a period."""
+    if granularity == 'day':
+        return datetime.date(*period)
+    elif granularity == 'week':
+        return period_end(period, granularity) - datetime.timedelta(days=6)
+    elif granularity == 'month':
+        return datetime.date(period[0], period[1], 1)
+    elif granularity == 'year':
+        return datetime.date(period[0], 1, 1)
+    raise ValueError('Unknown granularity "%s"' % granularity)
+
+
+def period_end(period, granularity):
+    """Return the last date of a period."""
+    if granularity == 'day':
+        return datetime.date(*period)
+    elif granularity == 'week':
+        year, week_num = period
+        jan4 = datetime.date(year, 1, 4)
+        monday = jan4 - datetime.timedelta(days=jan4.weekday())
+        return monday + datetime.timedelta(weeks=week_num - 1, days=6)
+    elif granularity == 'month':
+        year, month = period
+        return datetime.date(year + month // 12, month % 12 + 1, 1) - \
+            datetime.timedelta(days=1)
+    elif granularity == 'year':
+        return datetime.date(period[0], 12, 31)
+    raise ValueError('Unknown granularity "%s"' % granularity)
+
+
+def is_closed(period, granularity, today=None):
+    """Return True if the period ended before today (UTC)."""
+    if today is None:
+        today = datetime.datetime.utcnow().date()
+    return period_end(period, granularity) < today
+
+
+def periods(start, end, granularity):
+    """Return every period overlapping the date range, in order."""
+    start = to_date(start)
+    end = to_date(end)
+    if granularity not in GRANULARITIES:
+        raise ValueError('Unknown granularity "%s"' % granularity)
+    if end < start:
+        return []
+
+    result = []
+    if granularity == 'day' or granularity == 'week':
+        if granularity == 'day':
+            step = datetime.timedelta(days=1)
+        else:
+            step = datetime.timedelta(days=7)
+            start = start - datetime.timedelta(days=start.weekday())
+        day = start
+        while day <= end:
+            result.append(period_of(day, granularity))
+            day += step
+    elif granularity == 'month':
+        year, month = start.year, start.month
+        while (year, month) <= (end.year, end.month):
+            result.append((year, month))
+            year, month = year + month // 12, month % 12 + 1
+    else:
+        for year in xrange(start.year, end.year + 1):
+            result.append((year,))
+    return result
+
+
+class StatsSeries(object):
+    """Dense, columnar statistics indexed by (process key, period).
+
+    index is a list of (key, period) tuples and columns maps each metric to
+    an array of floats aligned with index, NaN where there is no value.
+    series[metric] lists a column with fill in place of NaN and the counts
+    as ints. Periods the server had no data for are flagged in missing.
+    """
+
+    def __init__(self, granularity, metrics, fill=None):
+        self.granularity = granularity
+        self.metrics = tuple(metrics)
+        self.fill = fill
+        self.index = []
+        self.missing = []
+        self.columns = {}
+        for metric in self.metrics:
+            self.columns[metric] = array('d')
+        self._positions = {}
+        # The key of each row as an id into _keys, and the ordinal of the
+        # first day of its period, so rows can be grouped as arrays.
+        self._keys = {}
+        self._key_ids = array('l')
+        self._ordinals = array('l')
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, metric):
+        fill = self.fill
+        if metric in COUNTS:
+            return [fill if value != value else int(value)
+                for value in self.columns[metric]]
+        return [fill if value != value else value
+            for value in self.columns[metric]]
+
+    def __repr__(self):
+        return '<StatsSeries %s: %d rows x %d columns>' % (self.granularity,
+            len(self.index), len(self.metrics))
+
+    def append(self, key, period, data):
+        """Add a row from a stats response dict, or None if missing."""
+        self._add_row(key, period)
+        row_missing = not isinstance(data, dict)
+        if row_missing:
+            data = {}
+        for metric in self.metrics:
+            value = data.get(metric, None)
+            if value is None:
+                value = NAN
+            self.columns[metric].append(value)
+        self.missing.append(row_missing)
+
+    def _add_row(self, key, period):
+        self._positions[(key, period)] = len(self.index)
+        self.index.append((key, period))
+        key_id = self._keys.get(key, None)
+        if key_id is None:
+            key_id = self._keys[key] = len(self._keys)
+        self._key_ids.append(key_id)
+        self._ordinals.append(period_start(period,
+            self.granularity).toordinal())
+
+    def _set_index(self, index):
+        # Bulk _add_row(); each distinct period is converted once.
+        self.index = index
+        self._positions = dict(izip(index, xrange(len(index))))
+        keys = self._keys
+        starts = {}
+        key_ids = []
+        ordinals = []
+        for key, period in index:
+            key_id = keys.get(key, None)
+            if key_id is None:
+                key_id = keys[key] = len(keys)
+            key_ids.append(key_id)
+            ordinal = starts.get(period, None)
+            if ordinal is None:
+                ordinal = starts[period] = period_start(period,
+                    self.granularity).toordinal()
+            ordinals.append(ordinal)
+        self._key_ids = array('l', key_ids)
+        self._ordinals = array('l', ordinals)
+
+    def get(self, key, period):
+        """Return the row for (key, period) as a dict, or None."""
+        try:
+            position = self._positions[(key, period)]
+        except KeyError:
+            return None
+        row = {}
+        for metric in self.metrics:
+            value = self.columns[metric][position]
+            if value != value:
+                value = self.fill
+            elif metric in COUNTS:
+                value = int(value)
+            row[metric] = value
+        return row
+
+    def rows(self):
+        """Yield (key, period, row dict) tuples in index order."""
+        for key, period in self.index:
+            yield key, period, self.get(key, period)
+
+    def select(self, metrics):
+        """Return a series with only the given columns, sharing the index."""
+        series = StatsSeries(self.granularity, metrics, self.fill)
+        series.index = self.index
+        series.missing = self.missing
+        series._positions = self._positions
+        series._keys = self._keys
+        series._key_ids = self._key_ids
+        series._ordinals = self._ordinals
+        for metric in series.metrics:
+            series.columns[metric] = self.columns[metric]
+        return series
+
+
+def _numpy():
+    global numpy
+    if numpy is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+    return numpy
+
+
+def rollup(series, granularity, weight='num_requests_completed'):
+    """Aggregate a day StatsSeries into a week, month or year StatsSeries.
+
+    Counts and total_request_seconds are summed, min/max_request_seconds
+    take the extreme, and avg_request_seconds is averaged weighted by the
+    weight column (unweighted when the series does not have it). Missing
+    days are skipped; periods with no data at all are missing in the result.
+    Uses numpy when it is installed.
+    """
+    if series.granularity != 'day':
+        raise ValueError('Can only roll up day statistics.')
+    if granularity not in GRANULARITIES:
+        raise ValueError('Unknown granularity "%s"' % granularity)
+
+    np = _numpy()
+    if np is None or not len(series):
+        groups, counts, columns = _rollup_python(series, granularity, weight)
+    else:
+        groups, counts, columns = _rollup_numpy(np, series, granularity,
+            weight)
+    result = StatsSeries(granularity, series.metrics, series.fill)
+    result._set_index(groups)
+    result.missing = [not count for count in counts]
+    result.columns = columns
+    return result
+
+
+def _rollup_numpy(np, series, granularity, weight):
+    # Each distinct day is mapped to its period once, then rows are grouped
+    # by key id and period id with unique(), in order of first appearance.
+    ordinals = np.frombuffer(series._ordinals, dtype=np.int_)
+    days, day_rows = np.unique(ordinals, return_inverse=True)
+    periods = []
+    period_ids = {}
+    day_periods = np.empty(len(days), dtype=np.int_)
+    for i, ordinal in enumerate(days.tolist()):
+        period = period_of(datetime.date.fromordinal(ordinal), granularity)
+        period_id = period_ids.get(period, None)
+        if period_id is None:
+            period_id = period_ids[period] = len(periods)
+            periods.append(period)
+        day_periods[i] = period_id
+    codes = np.frombuffer(series._key_ids, dtype=np.int_) * len(periods) + \
+        day_periods[day_rows]
+    codes, first, group_ids = np.unique(codes, return_index=True,
+        return_inverse=True)
+    order = np.argsort(first, kind='mergesort')
+    rank = np.empty(len(order), dtype=np.int_)
+    rank[order] = np.arange(len(order))
+    group_ids = rank[group_ids]
+    codes = codes[order]
+    size = len(codes)
+
+    keys = [None] * len(series._keys)
+    for key, key_id in series._keys.iteritems():
+        keys[key_id] = key
+    groups = [(keys[code // len(periods)], periods[code % len(periods)])
+        for code in codes.tolist()]
+    present = ~np.array(series.missing, dtype=bool)
+    counts = np.bincount(group_ids[present], minlength=size)
+    # Rows sorted by group, for reduceat(); every group has a row.
+    by_group = np.argsort(group_ids, kind='mergesort')
+    starts = np.zeros(size, dtype=np.int_)
+    np.cumsum(np.bincount(group_ids, minlength=size)[:-1], out=starts[1:])
+
+    weights = series.columns.get(weight)
+    if weights is not None:
+        weights = np.nan_to_num(np.frombuffer(weights, dtype=float))
+    columns = {}
+    for metric in series.metrics:
+        values = np.frombuffer(series.columns[metric], dtype=float)
+        valid = ~np.isnan(values)
+        found = np.bincount(group_ids, valid, minlength=size)
+        how = AGGREGATES.get(metric, 'sum')
+        if how == 'min' or how == 'max':
+            if how == 'min':
+                reduce = np.minimum.reduceat
+                values = np.where(valid, values, np.inf)
+            else:
+                reduce = np.maximum.reduceat
+                values = np.where(valid, values, -np.inf)
+            totals = reduce(values[by_group], starts)
+        elif how == 'avg':
+            values = np.where(valid, values, 0.0)
+            if weights is None:
+                day_weights = valid.astype(float)
+            else:
+                day_weights = np.where(valid, weights, 0.0)
+            weighted = np.bincount(group_ids, values * day_weights,
+                minlength=size)
+            weight_totals = np.bincount(group_ids, day_weights,
+                minlength=size)
+            plain = np.bincount(group_ids, values, minlength=size)
+            totals = np.where(weight_totals > 0,
+                weighted / np.where(weight_totals > 0, weight_totals, 1),
+                plain / np.maximum(found, 1))
+        else:
+            totals = np.bincount(group_ids, np.where(valid, values, 0.0),
+                minlength=size)
+        totals[found == 0] = np.nan
+        column = array('d')
+        column.fromstring(totals.astype(float).tostring())
+        columns[metric] = column
+    return groups, counts.tolist(), columns
+
+
+def _rollup_python(series, granularity, weight):
+    group_ids, groups = _group(series.index, granularity)
+    size = len(groups)
+    counts = [0] * size
+    for group_id, row_missing in izip(group_ids, series.missing):
+        if not row_missing:
+            counts[group_id] += 1
+
+    weights = series.columns.get(weight)
+    columns = {}
+    for metric in series.metrics:
+        values = series.columns[metric]
+        how = AGGREGATES.get(metric, 'sum')
+        if how == 'avg':
+            totals = _average(group_ids, values, weights, size)
+        else:
+            totals = _aggregate(group_ids, values, how, size)
+        columns[metric] = array('d', totals)
+    return groups, counts, columns
+
+
+def _group(index, granularity):
+    """Return (group id of each row, (key, period) of each group)."""
+    groups = []
+    group_ids = []
+    day_periods = {}
+    key_groups = {}
+    last_key = None
+    positions = None
+    for key, day in index:
+        try:
+            period = day_periods[day]
+        except KeyError:
+            period = day_periods[day] = period_of(datetime.date(*day),
+                granularity)
+        # Rows usually come key by key, so the per-key dict is reused.
+        if positions is None or key != last_key:
+            positions = key_groups.setdefault(key, {})
+            last_key = key
+        try:
+            group_id = positions[period]
+        except KeyError:
+            group_id = positions[period] = len(groups)
+            groups.append((key, period))
+        group_ids.append(group_id)
+    return group_ids, groups
+
+
+def _aggregate(ids, values, how, size):
+    # NaN compares unequal to itself; those values are skipped.
+    totals = [NAN] * size
+    if how == 'min':
+        for group_id, value in izip(ids, values):
+            if value == value:
+                total = totals[group_id]
+                if total != total or value < total:
+                    totals[group_id] = value
+    elif how == 'max':
+        for group_id, value in izip(ids, values):
+            if value == value:
+                total = totals[group_id]
+                if total != total or value > total:
+                    totals[group_id] = value
+    else:
+        for group_id, value in izip(ids, values):
+            if value == value:
+                total = totals[group_id]
+                if total != total:
+                    totals[group_id] = value
+                else:
+                    totals[group_id] = total + value
+    return totals
+
+
+def _average(ids, values, weights, size):
+    weighted = [0.0] * size
+    weight_totals = [0.0] * size
+    plain = [0.0] * size
+    days = [0] * size
+    if weights is None:
+        weights = [1.0] * len(ids)
+    for group_id, value, day_weight in izip(ids, values, weights):
+        if value == value:
+            if day_weight != day_weight:
+                day_weight = 0.0
+            weighted[group_id] += value * day_weight
+            weight_totals[group_id] += day_weight
+            plain[group_id] += value
+            days[group_id] += 1
+    totals = [NAN] * size
+    for group_id in xrange(size):
+        if weight_totals[group_id]:
+            totals[group_id] = weighted[group_id] / weight_totals[group_id]
+        elif days[group_id]:
+            totals[group_id] = plain[group_id] / days[group_id]
+    return totals
+
+
+class StatsCache(object):
+    """Cache of stats responses that knows when a period has ended.
+
+    Statistics for a period that is over never change, so they are kept
+    indefinitely, in memory and in directory when given. The current period
+    is only cached for open_ttl seconds. Entries remember which metrics they
+    hold, so a response fetched for more metrics answers a narrower filter.
+    """
+
+    def __init__(self, directory=None, open_ttl=60, maxsize=4096):
+        from flomosa.cache import FileStore, LRUCache
+        self.open_ttl = open_ttl
+        self.memory = LRUCache(maxsize)
+        self.store = None
+        if directory is not None:
+            self.store = FileStore(directory)
+
+    def _key(self, granularity, key, period):
+        return '%s/%s/%s' % (granularity, key,
+            '-'.join([str(part) for part in period]))
+
+    def get(self, granularity, key, period, metrics=None):
+        """Return the cached response restricted to metrics, or None.
+
+        metrics is a list of metric names, or None for every metric.
+        """
+        entry = self._entry(self._key(granularity, key, period))
+        if entry is None:
+            return None
+        if not entry['closed'] and \
+            time.time() - entry['stored'] >= self.open_ttl:
+            return None
+        if entry['metrics'] is not None and (metrics is None or
+            not set(metrics).issubset(entry['metrics'])):
+            return None
+        return self._project(entry['data'], metrics)
+
+    def set(self, granularity, key, period, metrics, data, today=None):
+        """Store a stats response fetched for metrics (None for all)."""
+        if not isinstance(data, dict):
+            return
+        data = dict(data)
+        cache_key = self._key(granularity, key, period)
+        closed = is_closed(period, granularity, today)
+        if metrics is not None:
+            metrics = sorted(set(metrics))
+        if closed and metrics is not None:
+            entry = self._entry(cache_key)
+            if entry is not None and entry['closed']:
+                merged, data = data, dict(entry['data'])
+                data.update(merged)
+                if entry['metrics'] is None:
+                    metrics = None
+                else:
+                    metrics = sorted(set(metrics) | set(entry['metrics']))
+        entry = {
+            'closed': closed,
+            'stored': time.time(),
+            'metrics': metrics,
+            'data': data
+        }
+        self.memory.set(cache_key, entry)
+        if closed and self.store is not None:
+            self.store.set(cache_key, entry)
+
+    def _entry(self, cache_key):
+        entry = self.memory.get(cache_key)
+        if entry is None and self.store is not None:
+            entry = self.store.get(cache_key)
+            if entry is not None:
+                self.memory.set(cache_key, entry)
+        return entry
+
+    def _project(self, data, metrics):
+        data = dict(data)
+        if metrics is not None:
+            for metric in METRICS:
+                if metric not in metrics:
+                    data.pop(metric, None)
+        return data
+
+    def clear(self):
+        """Forget every cached response."""
+        self.memory.clear()
+        if self.store is not None:
+            self.store.clear()
+
+    def stats(self):
+        return self.memory.stats()
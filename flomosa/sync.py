@@ -0,0 +1,177 @@
+"""
+Structural hashes, manifests and reports for syncing definitions to Flomosa.
+"""
+
+import os
+import tempfile
+import threading
+from hashlib import sha1
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+
+def canonical_json(value):
+    """Return value as JSON that does not depend on dict or list order.
+
+    Dict keys are sorted, and list items are sorted too since the order of
+    steps, actions and members carries no meaning.
+    """
+    if isinstance(value, dict):
+        return '{%s}' % ','.join(['%s:%s' % (json.dumps(name),
+            canonical_json(item)) for name, item in sorted(value.items())])
+    elif isinstance(value, (list, tuple)):
+        return '[%s]' % ','.join(sorted([canonical_json(item)
+            for item in value]))
+    return json.dumps(value)
+
+
+def content_hash(obj):
+    """Return the hex SHA-1 of an object's to_dict(), or of a dict."""
+    if not isinstance(obj, dict):
+        obj = obj.to_dict()
+    return sha1(canonical_json(obj)).hexdigest()
+
+
+def _unique(keys):
+    seen = set()
+    result = []
+    for key in keys or []:
+        if key not in seen:
+            seen.add(key)
+            result.append(key)
+    return result
+
+
+def process_dict(data):
+    """Return a process dict from the server in the form of to_dict().
+
+    Fields are defaulted and references deduplicated the way
+    Process.from_dict() would, without creating or registering objects.
+    """
+    key = data.get('key', None)
+    steps = {}
+    for step in data.get('steps', []):
+        steps[step.get('key', None)] = {
+            'kind': 'Step',
+            'key': step.get('key', None),
+            'process': key,
+            'name': step.get('name', None),
+            'description': step.get('description', None),
+            'is_start': bool(step.get('is_start', None)),
+            'members': step.get('members', None) or [],
+            'team': step.get('team', None)
+        }
+    actions = {}
+    for action in data.get('actions', []):
+        outgoing = _unique(action.get('outgoing', []))
+        actions[action.get('key', None)] = {
+            'kind': 'Action',
+            'key': action.get('key', None),
+            'process': key,
+            'name': action.get('name', None),
+            'is_complete': bool(action.get('is_complete', None)) and
+                not outgoing,
+            'incoming': _unique(action.get('incoming', [])),
+            'outgoing': outgoing
+        }
+    return {
+        'kind': 'Process',
+        'key': key,
+        'name': data.get('name', None),
+        'description': data.get('description', None),
+        'collect_stats': data.get('collect_stats', False),
+        'steps': steps.values(),
+        'actions': actions.values()
+    }
+
+
+def team_dict(data):
+    """Return a team dict from the server in the form of to_dict()."""
+    return {
+        'kind': 'Team',
+        'key': data.get('key', None),
+        'name': data.get('name', None),
+        'description': data.get('description', None),
+        'members': data.get('members', None) or []
+    }
+
+
+class Manifest(object):
+    """Content hashes of the objects last synced, by kind and key.
+
+    When path is set the manifest is loaded from and saved to that JSON file.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.hashes = {}
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            fp = open(path, 'rb')
+            try:
+                self.hashes = json.load(fp)
+            finally:
+                fp.close()
+
+    def get(self, kind, key):
+        return self.hashes.get(kind, {}).get(key, None)
+
+    def set(self, kind, key, digest):
+        self._lock.acquire()
+        try:
+            self.hashes.setdefault(kind, {})[key] = digest
+        finally:
+            self._lock.release()
+
+    def remove(self, kind, key):
+        self._lock.acquire()
+        try:
+            self.hashes.get(kind, {}).pop(key, None)
+        finally:
+            self._lock.release()
+
+    def keys(self, kind):
+        return list(self.hashes.get(kind, {}))
+
+    def save(self):
+        """Write the manifest to path, replacing the old file atomically."""
+        if self.path is None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        fp = os.fdopen(fd, 'wb')
+        try:
+            json.dump(self.hashes, fp, sort_keys=True, indent=1)
+        finally:
+            fp.close()
+        os.rename(tmp_path, self.path)
+
+
+class SyncReport(object):
+    """What a sync created, updated, skipped and deleted.
+
+    Each list holds (kind, key) tuples; errors holds (kind, key, exception)
+    tuples for the objects that could not be synced.
+    """
+
+    def __init__(self):
+        self.created = []
+        self.updated = []
+        self.skipped = []
+        self.deleted = []
+        self.errors = []
+
+    def __repr__(self):
+        return '<SyncReport created=%d updated=%d skipped=%d deleted=%d ' \
+            'errors=%d>' % (len(self.created), len(self.updated),
+            len(self.skipped), len(self.deleted), len(self.errors))
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def add(self, outcome, kind, key):
+        getattr(self, outcome).append((kind, key))
@@ -11,6 +11,7 @@ setup(name='flomosa',
       packages=find_packages(),
       license='MIT License',
       install_requires=['httplib2>=0.6.0', 'oauth2>=1.0.6', 'simplejson>=2.0.9'],
+      extras_require={'numpy': ['numpy'], 'ujson': ['ujson']},
       keywords='flomosa',
       zip_safe=True,
       tests_require=['nose', 'coverage'])
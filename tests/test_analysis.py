@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import unittest
+sys.path[0:0] = [os.path.join(os.path.dirname(__file__), '..'),]
+
+import flomosa
+from flomosa.analysis import Graph, analyze, compile_process
+
+class TestAnalysis(unittest.TestCase):
+    def setUp(self):
+        self.process = flomosa.Process(name='test process',
+            key='test-analysis-id')
+        self.step1 = self.process.add_step('1st Approval', key='step1')
+        self.step2 = self.process.add_step('2nd Approval', key='step2')
+        self.step3 = self.process.add_step('3rd Approval', key='step3')
+        self.step1.add_action('Approved', next_step=self.step2, key='approve')
+        self.step1.add_action('Skip', next_step=self.step3, key='skip')
+        self.step2.add_action('Approved', next_step=self.step3, key='finish')
+        self.step3.add_action('Done', is_complete=True, key='done')
+
+    def keys(self, graph, ids):
+        return sorted([graph.keys[i] for i in ids])
+
+    def test_ok(self):
+        report = self.process.analyze()
+        self.assertTrue(report.ok)
+        self.assertEqual(report.starts, ['step1'])
+        self.assertEqual(report.cycles, [])
+
+    def test_paths(self):
+        graph = compile_process(self.process)
+        self.assertEqual(len(graph), 3)
+        self.assertEqual(len(graph.targets), 3)
+        self.assertEqual(graph.path_to_completion('step1'), ['step1', 'step3'])
+        self.assertEqual(graph.path_to_completion('step3'), ['step3'])
+        distance, following = graph.distances()
+        self.assertEqual(distance[graph.ids['step2']], 2)
+        reachable = graph.reachable(['step2'])
+        self.assertFalse(reachable[graph.ids['step1']])
+        self.assertTrue(reachable[graph.ids['step3']])
+
+    def test_cycles(self):
+        self.step2.add_action('Rework', next_step=self.step1)
+        self.step3.add_action('Again', next_step=self.step3)
+        graph = compile_process(self.process)
+        self.assertEqual(sorted([self.keys(graph, component)
+            for component in graph.cycles()]),
+            [['step1', 'step2'], ['step3']])
+        order = [self.keys(graph, component)
+            for component in graph.components()]
+        self.assertEqual(order, [['step3'], ['step1', 'step2']])
+        self.assertTrue(self.process.analyze().ok)
+
+        # A loaded process is compiled from its actions, not the indexes.
+        loaded = flomosa.Process.from_dict(self.process.to_dict())
+        other = compile_process(loaded)
+        self.assertTrue(loaded._indexes is None)
+        self.assertEqual(other.keys, graph.keys)
+        self.assertEqual(other.completes, graph.completes)
+        for i in xrange(len(graph)):
+            self.assertEqual(
+                sorted(other.targets[other.offsets[i]:other.offsets[i + 1]]),
+                sorted(graph.targets[graph.offsets[i]:graph.offsets[i + 1]]))
+
+    def test_problems(self):
+        step4 = self.process.add_step('Stuck', key='step4')
+        self.step2.add_action('Escalate', next_step=step4)
+        self.process.add_step('Orphan', key='step5', is_start=True)
+        self.process.add_step('Island', key='step6')
+        report = self.process.analyze()
+        self.assertFalse(report.ok)
+        self.assertEqual(sorted(report.dead_ends), ['step4', 'step5'])
+        self.assertEqual(report.unreachable, ['step6'])
+        self.assertEqual(sorted(report.starts), ['step1', 'step5'])
+        self.assertEqual(len(report.problems()), 3)
+
+    def test_dangling(self):
+        data = self.process.to_dict()
+        for action in data['actions']:
+            if action['key'] == 'finish':
+                action['outgoing'] = ['missing']
+        report = analyze(data)
+        self.assertEqual(report.dangling, [('finish', 'outgoing', 'missing')])
+        self.assertEqual(report.dead_ends, ['step2'])
+
+        flomosa.Step(self.process, 'Replaced', key='step2')
+        orphan = flomosa.Action(self.process, 'Orphan', key='orphan')
+        orphan.add_outgoing_step(self.step2)
+        graph = compile_process(self.process)
+        self.assertEqual(sorted(graph.dangling), [('approve', 'outgoing',
+            'step2'), ('finish', 'incoming', 'step2'), ('orphan', 'outgoing',
+            'step2')])
+        self.assertEqual(len(graph.targets), 1)
+
+        self.process._indexes = None
+        graph = compile_process(self.process)
+        self.assertEqual(sorted(graph.dangling), [('approve', 'outgoing',
+            'step2'), ('finish', 'incoming', 'step2'), ('orphan', 'outgoing',
+            'step2')])
+        self.assertEqual(len(graph.targets), 1)
+
+    def test_large(self):
+        size = 20000
+        keys = ['s%d' % i for i in xrange(size)]
+        heads = range(size)
+        tails = range(1, size) + [0]
+        graph = Graph(keys, [0], heads, tails, bytearray(size))
+        self.assertEqual([len(component) for component in graph.cycles()],
+            [size])
+        self.assertEqual(len(graph.dead_ends()), size)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+sys.path[0:0] = [os.path.join(os.path.dirname(__file__), '..'),]
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+import flomosa
+from flomosa.cache import LRUCache, FileStore, ResponseCache
+
+class FakeClient(flomosa.Client):
+    def __init__(self, *args, **kwargs):
+        flomosa.Client.__init__(self, *args, **kwargs)
+        self.debug = False
+        self.objects = {}
+        self.sent = []
+
+    def _send(self, endpoint, method, body, headers):
+        self.sent.append((method, headers.get('If-None-Match', None)))
+        path = endpoint[len(self.uri):]
+        if method == 'PUT':
+            self.objects[path] = body
+            return {'status': '201'}, body
+        if method == 'DELETE':
+            self.objects.pop(path, None)
+            return {'status': '204'}, ''
+        if path not in self.objects:
+            return {'status': '404'}, json.dumps({'code': 404,
+                'message': 'Not found'})
+        etag = '"%d"' % hash(self.objects[path])
+        if headers.get('If-None-Match', None) == etag:
+            return {'status': '304', 'etag': etag}, ''
+        return {'status': '200', 'etag': etag}, self.objects[path]
+
+class TestLRUCache(unittest.TestCase):
+    def test_lru(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        cache.delete('a')
+        self.assertFalse('a' in cache)
+        stats = cache.stats()
+        self.assertEqual(stats['evicted'], 1)
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 1)
+
+class TestFileStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_store(self):
+        store = FileStore(os.path.join(self.directory, 'cache'))
+        store.set('http://test/a.json', {'body': 'test'})
+        self.assertEqual(store.get('http://test/a.json'), {'body': 'test'})
+        self.assertEqual(store.get('http://test/b.json'), None)
+        store.delete('http://test/a.json')
+        self.assertEqual(store.get('http://test/a.json'), None)
+
+    def test_maxsize(self):
+        store = FileStore(self.directory, maxsize=10)
+        for i in range(10):
+            store.set('key-%d' % i, i)
+            os.utime(store._path('key-%d' % i), (1000 + i, 1000 + i))
+        self.assertEqual(store.get('key-0'), 0)
+        store.set('key-10', 10)
+        self.assertEqual(len(store), 9)
+        self.assertEqual(store.get('key-1'), None)
+        self.assertEqual(store.get('key-2'), None)
+        self.assertEqual(store.get('key-0'), 0)
+        self.assertEqual(store.get('key-10'), 10)
+
+    def test_persistence(self):
+        client = FakeClient('test-key', 'test-secret', host='127.0.0.1',
+            port=8080, cache=ResponseCache(directory=self.directory))
+        team = flomosa.Team(name='test team', key='test-team-id')
+        client.add_team(team)
+        client.get_team(team.key)
+        client2 = FakeClient('test-key', 'test-secret', host='127.0.0.1',
+            port=8080, cache=ResponseCache(directory=self.directory))
+        client2.objects = client.objects
+        self.assertEqual(client2.get_team(team.key).name, 'test team')
+        self.assertNotEqual(client2.sent[0][1], None)
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.client = FakeClient('test-key', 'test-secret', host='127.0.0.1',
+            port=8080, cache=True, identity_map=True)
+        self.process = flomosa.Process(name='test process',
+            key='test-cache-id')
+        step = self.process.add_step('1st Approval', key='step1')
+        step.add_action('Done', is_complete=True, key='done')
+        self.client.add_process(self.process)
+        self.client.sent = []
+
+    def test_conditional(self):
+        process = self.client.get_process(self.process.key)
+        self.assertEqual(self.client.sent, [('GET', None)])
+        process2 = self.client.get_process(self.process.key)
+        self.assertTrue(process is process2)
+        self.assertEqual(len(self.client.sent), 2)
+        self.assertNotEqual(self.client.sent[1][1], None)
+        self.assertRaises(flomosa.APIError,
+            lambda: self.client.get_process('missing'))
+
+    def test_ttl(self):
+        self.client.cache.ttl = 60
+        self.client.get_process(self.process.key)
+        self.client.get_process(self.process.key)
+        self.assertEqual(len(self.client.sent), 1)
+
+    def test_identity(self):
+        process = self.client.get_process(self.process.key)
+        step = process._steps['step1']
+        self.process.description = 'changed'
+        self.process.add_step('2nd Approval', key='step2')
+        self.client.add_process(self.process)
+        process2 = self.client.get_process(self.process.key)
+        self.assertTrue(process is process2)
+        self.assertEqual(process.description, 'changed')
+        self.assertEqual(sorted(process._steps.keys()), ['step1', 'step2'])
+        self.assertFalse(process._steps['step1'] is step)
+        self.assertEqual(process._steps['step1'].get_actions_by_name(
+            'Done')[0].key, 'done')
+
+    def test_endpoints(self):
+        self.client.cache.ttl = 60
+        self.client.objects['/requests/r1.json'] = json.dumps({'key': 'r1',
+            'status': 'open'})
+        self.client.get_request('r1')
+        self.client.get_request('r1')
+        self.assertEqual(self.client.sent, [('GET', None), ('GET', None)])
+        self.assertEqual(len(self.client.cache.memory), 0)
+
+    def test_invalidate(self):
+        self.client.cache.ttl = 60
+        self.client.get_process(self.process.key)
+        self.client.delete_process(self.process.key)
+        self.assertRaises(flomosa.APIError,
+            lambda: self.client.get_process(self.process.key))
+
+    def test_versions(self):
+        registry = flomosa._TEAMS.maxsize
+        flomosa._TEAMS.resize(0)
+        try:
+            for i in range(10):
+                team = flomosa.Team(name='test team', key='test-team-%d' % i)
+                self.client.add_team(team)
+                loaded = self.client.get_team(team.key)
+            self.assertEqual(len(self.client._versions), 1)
+            del loaded
+            self.assertEqual(len(self.client._versions), 0)
+        finally:
+            flomosa._TEAMS.resize(registry)
+
+    def test_team(self):
+        team = flomosa.Team(name='test team', key='test-team-id',
+            members=['test@flomosa.com'])
+        self.client.add_team(team)
+        team2 = self.client.get_team(team.key)
+        team.members = []
+        self.client.add_team(team)
+        self.assertTrue(self.client.get_team(team.key) is team2)
+        self.assertEqual(team2.members, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,8 @@
 import os
 import sys
 import unittest
+import urllib
+import urlparse
 sys.path[0:0] = [os.path.join(os.path.dirname(__file__), '..'),]
 
 try:
@@ -10,7 +12,213 @@ try:
 except ImportError:
     import json
 
+import oauth2 as oauth
+
 import flomosa
+from flomosa.signing import Signer
+
+class TestSigner(unittest.TestCase):
+    def setUp(self):
+        self.consumer = oauth.Consumer('test-key', 'test-secret')
+        self.realm = flomosa.Client.realm
+        self.signer = Signer('test-key', 'test-secret', realm=self.realm,
+            user_agent='test-agent')
+
+    def oauth_header(self, method, url, parameters):
+        make_timestamp = oauth.Request.make_timestamp
+        make_nonce = oauth.Request.make_nonce
+        oauth.Request.make_timestamp = classmethod(lambda cls: '1271000000')
+        oauth.Request.make_nonce = classmethod(lambda cls: '12345678')
+        try:
+            request = oauth.Request.from_consumer_and_token(self.consumer,
+                http_method=method, http_url=url, parameters=parameters)
+        finally:
+            oauth.Request.make_timestamp = make_timestamp
+            oauth.Request.make_nonce = make_nonce
+        request.sign_request(oauth.SignatureMethod_HMAC_SHA1(), self.consumer,
+            None)
+        return request.to_header(self.realm)['Authorization']
+
+    def assertSameHeader(self, method, url, parameters=None):
+        if parameters:
+            url = url + '?' + urllib.urlencode(parameters)
+        headers = self.signer.sign(method, url, parameters,
+            timestamp='1271000000', nonce='12345678')
+        self.assertEqual(headers['Authorization'],
+            self.oauth_header(method, url, parameters))
+        self.assertEqual(headers['User-Agent'], 'test-agent')
+
+    def test_sign(self):
+        self.assertSameHeader('GET', 'http://127.0.0.1:8080/processes/a.json')
+        self.assertSameHeader('PUT', 'http://flomosa.appspot.com:80/teams/'
+            'a b~c.json')
+        self.assertSameHeader('DELETE', 'https://flomosa.appspot.com:443/'
+            'requests/a.json')
+        self.assertSameHeader('GET', 'http://127.0.0.1:8080/stats/by-day/'
+            'a.json', {'year': 2010, 'month': 4, 'day': 20,
+            'filter': 'num_requests,avg_request_seconds'})
+        self.assertSameHeader('GET', 'http://127.0.0.1:8080/search/process/'
+            'a.json', {'start': 1271000000.25, 'end': 1271000100.5,
+            'limit': None})
+
+    def test_url_cache(self):
+        for i in range(100):
+            self.assertSameHeader('GET', 'http://127.0.0.1:8080/processes/'
+                'key-%d.json' % i)
+        self.assertSameHeader('GET', 'http://127.0.0.1:8080')
+        self.assertEqual(len(self.signer._prefixes), 1)
+
+    def test_nonce(self):
+        url = 'http://127.0.0.1:8080/processes/a.json'
+        self.assertNotEqual(self.signer.sign('GET', url)['Authorization'],
+            self.signer.sign('GET', url)['Authorization'])
+
+class FakeAsyncClient(flomosa.AsyncClient):
+    def _send(self, endpoint, method, body, headers):
+        content = json.dumps({'key': endpoint.rsplit('/', 1)[-1][:-5],
+            'method': method})
+        return {'status': '200'}, content
+
+class TestAsyncClient(unittest.TestCase):
+    def setUp(self):
+        self.client = FakeAsyncClient(key='test-key', secret='test-secret',
+            host='127.0.0.1', port=8080, max_workers=4)
+        self.client.debug = False
+
+    def test_futures(self):
+        futures = [self.client.get_request('test-%d' % i) for i in range(20)]
+        for i, future in enumerate(futures):
+            self.assertEqual(future.result(5)['key'], 'test-%d' % i)
+        resp = self.client.delete_team('test-team').result(5)
+        self.assertEqual(resp['method'], 'DELETE')
+
+    def test_context(self):
+        with self.client as client:
+            future = client.get_year_stats('test', 2010)
+        self.assertTrue(future.done())
+        self.assertRaises(RuntimeError, lambda: client.get_request('test'))
+
+class FakeSearchClient(flomosa.Client):
+    records = [{'key': 'r%d' % i, 'timestamp': 1000 + i // 3}
+        for i in range(20)]
+
+    def _send(self, endpoint, method, body, headers):
+        url = urlparse.urlparse(endpoint)
+        params = dict(urlparse.parse_qsl(url.query))
+        self.sent.append(params)
+        start = float(params.get('start', 0))
+        end = float(params['end'])
+        page = [record for record in self.records
+            if start <= record['timestamp'] <= end]
+        return {'status': '200'}, json.dumps(page[:int(params['limit'])])
+
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        self.client = FakeSearchClient(key='test-key', secret='test-secret',
+            host='127.0.0.1', port=8080)
+        self.client.debug = False
+        self.client.sent = []
+
+    def test_limit(self):
+        self.assertEqual(len(self.client.search_process('a', 0, 2000)), 20)
+        self.assertEqual(self.client.sent[-1]['limit'], '25')
+        self.assertEqual(len(self.client.search_step('a', 0, 2000, 4)), 4)
+        self.assertEqual(self.client.sent[-1]['limit'], '4')
+
+    def test_iter(self):
+        results = list(self.client.iter_search_process('a', 0, 2000,
+            page_size=4))
+        self.assertEqual([r['key'] for r in results],
+            ['r%d' % i for i in range(20)])
+        self.assertEqual(self.client.sent[1]['start'], '1001')
+
+        results = list(self.client.iter_search_step('a', 1002, 1004,
+            page_size=4))
+        self.assertEqual([r['key'] for r in results],
+            ['r%d' % i for i in range(6, 15)])
+
+        # Pages smaller than a run of equal timestamps cannot move on.
+        results = list(self.client.iter_search_step('a', 1002, 1004,
+            page_size=2))
+        self.assertEqual([r['key'] for r in results], ['r6', 'r7'])
+
+    def test_iter_limit(self):
+        results = self.client.iter_search_process('a', 0, 2000, page_size=5,
+            limit=7)
+        self.assertEqual(len(list(results)), 7)
+        self.assertTrue(len(self.client.sent) <= 3)
+
+class FakeSaveClient(flomosa.Client):
+    def _send(self, endpoint, method, body, headers):
+        self.sent.append(method)
+        return {'status': '201'}, ''
+
+class FakeFailClient(flomosa.Client):
+    def _send(self, endpoint, method, body, headers):
+        self.sent.append(method)
+        return {'status': '500'}, ''
+
+class TestAddProcess(unittest.TestCase):
+    def test_skip_clean(self):
+        client = FakeSaveClient(key='test-key', secret='test-secret',
+            host='127.0.0.1', port=8080)
+        client.debug = False
+        client.sent = []
+        process = flomosa.Process(name='test process')
+        step = process.add_step('1st Approval')
+        client.add_process(process)
+        self.assertEqual(client.add_process(process), None)
+        self.assertEqual(client.sent, ['PUT'])
+
+        step.members = ['a@flomosa.com']
+        client.add_process(process, stream=True)
+        self.assertEqual(client.sent, ['PUT', 'PUT'])
+        self.assertFalse(process.is_dirty())
+        client.add_process(process, force=True)
+        self.assertEqual(len(client.sent), 3)
+
+    def test_saved_state(self):
+        client = FakeSaveClient(key='test-key', secret='test-secret',
+            host='127.0.0.1', port=8080)
+        other = FakeSaveClient(key='test-key', secret='test-secret',
+            host='127.0.0.1', port=8081)
+        client.sent = []
+        other.sent = []
+        process = flomosa.Process(name='test process')
+        process.add_step('1st Approval')
+        client.add_process(process)
+        # A second server does not have it yet.
+        other.add_process(process)
+        self.assertEqual(other.sent, ['PUT'])
+
+        self.assertEqual(client.add_process(process), None)
+        client.delete_process(process.key)
+        client.add_process(process)
+        self.assertEqual(client.sent, ['PUT', 'DELETE', 'PUT'])
+        self.assertEqual(client.add_process(process), None)
+
+        # Loading another copy of the process does not hide the delete.
+        flomosa.Process.from_dict(process.to_dict())
+        client.delete_process(process.key)
+        client.add_process(process)
+        self.assertEqual(client.sent[-2:], ['DELETE', 'PUT'])
+
+    def test_failed_save(self):
+        client = FakeFailClient(key='test-key', secret='test-secret',
+            host='127.0.0.1', port=8080, throttle=False)
+        client.sent = []
+        process = flomosa.Process(name='test process')
+        step = process.add_step('1st Approval')
+        process.mark_saved()
+        step.members = ['a@flomosa.com']
+        changes = process.changes()
+        self.assertEqual(len(changes), 1)
+        self.assertRaises(flomosa.APIError,
+            lambda: client.add_process(process))
+        self.assertEqual(process.changes(), changes)
+        self.assertTrue(process.is_dirty())
+        step.members = ['b@flomosa.com']
+        self.assertEqual(len(process.changes()), 2)
 
 class TestClient(unittest.TestCase):
     def setUp(self):
@@ -64,9 +272,9 @@ class TestClient(unittest.TestCase):
             lambda: self.client.get_process(process.key))
 
         step1 = process.add_step('1st Approval')
-        step1.teams = [team]
+        step1.team = team
         step2 = process.add_step('2nd Approval')
-        step2.teams = [team]
+        step2.team = team
 
         self.assertRaises(flomosa.APIError,
             lambda: self.client.get_process(process.key))
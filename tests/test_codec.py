@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import unittest
+sys.path[0:0] = [os.path.join(os.path.dirname(__file__), '..'),]
+
+import flomosa
+from flomosa import codec
+
+class FakeClient(flomosa.Client):
+    def _send(self, endpoint, method, body, headers):
+        return {'status': '200'}, '{"key": "test", "name": "caf\xc3\xa9"}'
+
+class TestCodec(unittest.TestCase):
+    def setUp(self):
+        self.default = codec.current()
+        self.process = flomosa.Process(name='test process', key='test-codec')
+        step1 = self.process.add_step('1st Approval', key='step1')
+        step2 = self.process.add_step('2nd / Approval', key='step2')
+        step1.add_action(u'Approv\xe9', next_step=step2, key='approve')
+
+    def tearDown(self):
+        codec.use(self.default)
+
+    def test_select(self):
+        self.assertEqual(codec.current().name, 'json')
+        self.assertTrue('json' in codec.available())
+        self.assertEqual(codec.use('json').name, 'json')
+        self.assertTrue(codec.get_codec('auto').name in codec.available())
+        self.assertRaises(ValueError, lambda: codec.use('xml'))
+
+    def test_backends(self):
+        expected = self.process.to_dict()
+        for name in codec.available():
+            codec.use(name)
+            data = self.process.to_json()
+            self.assertTrue(isinstance(data, str), name)
+            self.assertEqual(codec.loads(data), expected)
+            self.assertEqual(codec.loads(''.join(self.process.iter_json(
+                chunk_size=10))), expected)
+
+            client = FakeClient(key='test-key', secret='test-secret',
+                host='127.0.0.1', port=8080)
+            self.assertEqual(client.get_request('test')['name'], u'caf\xe9')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,10 @@
 #!/usr/bin/env python
 
+import gc
 import os
 import sys
 import unittest
+from StringIO import StringIO
 sys.path[0:0] = [os.path.join(os.path.dirname(__file__), '..'),]
 
 try:
@@ -246,5 +248,327 @@ class TestAction(unittest.TestCase):
         data = {'is_complete': self.is_complete}
         self.assertRaises(ValueError, lambda: flomosa.Action.from_dict(data))
 
+class TestSmallDict(unittest.TestCase):
+    def test_single(self):
+        items = flomosa.SmallDict()
+        self.assertFalse(items)
+        self.assertEqual(items, {})
+        items['a'] = 1
+        items['a'] = 2
+        self.assertEqual(len(items), 1)
+        self.assertTrue('a' in items)
+        self.assertEqual(items['a'], 2)
+        self.assertEqual(items.get('b'), None)
+        self.assertRaises(KeyError, lambda: items['b'])
+        del items['a']
+        self.assertEqual(items.keys(), [])
+        self.assertRaises(KeyError, lambda: items.pop('a'))
+        self.assertEqual(items.pop('a', None), None)
+
+    def test_many(self):
+        items = flomosa.SmallDict([('a', 1), ('b', 2)])
+        items['c'] = 3
+        self.assertEqual(items, {'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(sorted(items), ['a', 'b', 'c'])
+        self.assertEqual(sorted(items.values()), [1, 2, 3])
+        self.assertEqual(items.pop('b'), 2)
+        del items['a']
+        self.assertEqual(items.items(), [('c', 3)])
+        self.assertEqual(items, flomosa.SmallDict([('c', 3)]))
+
+    def test_compact(self):
+        process = flomosa.Process(name='test process')
+        step = process.add_step(name=u'test step', key=u'test-step-id')
+        action = step.add_action(name='test action', next_step=step)
+        self.assertTrue(type(step.key) is str)
+        self.assertFalse(hasattr(step, '__dict__'))
+        self.assertFalse(hasattr(action, '__dict__'))
+        self.assertRaises(AttributeError, lambda: setattr(step, 'teams', []))
+        self.assertEqual(action.to_dict()['incoming'], ['test-step-id'])
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = flomosa.Registry(maxsize=2)
+        flomosa._PROCESSES.resize(0)
+
+    def tearDown(self):
+        flomosa._PROCESSES.resize(100)
+
+    def test_weak(self):
+        self.registry.resize(0)
+        process = flomosa.Process(name='test process')
+        self.registry[process.key] = process
+        self.assertEqual(self.registry[process.key], process)
+        key = process.key
+        del process
+        gc.collect()
+        self.assertFalse(key in self.registry)
+        self.assertEqual(self.registry.get(key), None)
+        self.assertRaises(KeyError, lambda: self.registry[key])
+
+    def test_lru(self):
+        processes = [flomosa.Process(name='test process', key='test-%d' % i)
+            for i in range(3)]
+        for process in processes:
+            self.registry[process.key] = process
+        self.registry.get('test-1')
+        del process, processes
+        gc.collect()
+        self.assertEqual(len(self.registry), 2)
+        self.assertFalse('test-0' in self.registry)
+        self.assertTrue('test-1' in self.registry)
+        stats = self.registry.stats()
+        self.assertEqual(stats['evicted'], 1)
+        self.assertEqual(stats['retained'], 2)
+        self.assertEqual(stats['hits'], 1)
+
+    def test_fromdict(self):
+        data = {'name': 'test process', 'key': 'test-registry-id',
+            'steps': [{'key': 'step1', 'name': 'Step',
+                'process': 'test-registry-id'}],
+            'actions': [{'key': 'action1', 'name': 'Done',
+                'process': 'test-registry-id', 'is_complete': True,
+                'incoming': ['step1']}]}
+        process = flomosa.Process.from_dict(data)
+        self.assertEqual(process._actions['action1']._incoming.keys(),
+            ['step1'])
+        self.assertTrue('processes' in flomosa.registry_stats())
+
+class TestGraph(unittest.TestCase):
+    def setUp(self):
+        self.process = flomosa.Process(name='test process',
+            key='test-graph-id')
+        self.step1 = self.process.add_step('1st Approval', key='step1')
+        self.step2 = self.process.add_step('2nd Approval', key='step2')
+        self.step3 = self.process.add_step('3rd Approval', key='step3')
+        self.approve = self.step1.add_action('Approved',
+            next_step=self.step2, key='approve')
+        self.skip = self.step1.add_action('Skip', next_step=self.step3,
+            key='skip')
+        self.finish = self.step2.add_action('Approved', next_step=self.step3,
+            key='finish')
+        self.done = self.step3.add_action('Done', is_complete=True,
+            key='done')
+
+    def keys(self, items):
+        return sorted([item.key for item in items])
+
+    def test_getactions(self):
+        self.assertEqual(self.keys(self.step1.get_actions_by_name()),
+            ['approve', 'skip'])
+        self.assertEqual(self.keys(self.step1.get_actions_by_name('Approved')),
+            ['approve'])
+        self.assertEqual(self.step1.get_actions_by_name('Missing'), [])
+        self.assertEqual(self.keys(self.step3.get_incoming_actions()),
+            ['finish', 'skip'])
+
+    def test_traversal(self):
+        self.assertEqual(self.keys(self.step1.next_steps()),
+            ['step2', 'step3'])
+        self.assertEqual(self.keys(self.step3.previous_steps()),
+            ['step1', 'step2'])
+        self.assertEqual(list(self.step3.next_steps()), [])
+        self.assertEqual(list(self.step1.previous_steps()), [])
+
+    def test_updateaction(self):
+        self.step1.update_action('Approved', 'Accepted', next_step=self.step3)
+        self.assertEqual(self.step1.get_actions_by_name('Approved'), [])
+        self.assertEqual(self.step1.get_actions_by_name('Accepted'),
+            [self.approve])
+        self.assertEqual(self.keys(self.step3.previous_steps()),
+            ['step1', 'step2'])
+        self.assertEqual(self.keys(self.step3.get_incoming_actions()),
+            ['approve', 'finish', 'skip'])
+
+    def test_deleteactions(self):
+        self.step1.delete_actions_by_name('Approved')
+        self.assertFalse('approve' in self.process._actions)
+        self.assertEqual(self.keys(self.step1.next_steps()), ['step3'])
+        self.assertEqual(list(self.step2.previous_steps()), [])
+        self.assertEqual(self.step2.get_actions_by_name('Approved'),
+            [self.finish])
+
+    def test_replaceaction(self):
+        action = flomosa.Action(process=self.process, name='Other',
+            key='skip')
+        self.assertEqual(self.keys(self.step1.get_actions_by_name()),
+            ['approve'])
+        self.assertEqual(self.keys(self.step3.get_incoming_actions()),
+            ['finish'])
+        action.add_incoming_step(self.step2)
+        self.assertEqual(self.step2.get_actions_by_name('Other'), [action])
+
+    def test_iterjson(self):
+        self.assertEqual(''.join(self.process.iter_json()),
+            self.process.to_json())
+        chunks = list(self.process.iter_json(chunk_size=1))
+        self.assertTrue(len(chunks) > 4)
+        self.assertEqual(''.join(chunks), self.process.to_json())
+        empty = flomosa.Process(name='test process', description=u'caf\xe9')
+        self.assertEqual(''.join(empty.iter_json()), empty.to_json())
+        out = StringIO()
+        self.process.dump_json(out)
+        self.assertEqual(out.getvalue(), self.process.to_json())
+
+    def test_fromdict(self):
+        data = json.loads(self.process.to_json())
+        process = flomosa.Process.from_dict(data)
+        # The step indexes are only built when first needed.
+        self.assertTrue(process._indexes is None)
+        self.assertEqual(json.loads(process.to_json()), data)
+        step1 = process._steps['step1']
+        self.assertEqual(step1.get_actions_by_name('Approved')[0].key,
+            'approve')
+        self.assertEqual(sorted([step.key for step in step1.next_steps()]),
+            ['step2', 'step3'])
+        self.assertEqual(process.get_steps_by_name('3rd Approval').key,
+            'step3')
+        self.assertTrue(process._actions['done'].is_complete)
+        process.delete_step(process._steps['step2'])
+        self.assertEqual(sorted([step.key for step in step1.next_steps()]),
+            ['step3'])
+
+        data['actions'][0]['incoming'] = ['missing']
+        self.assertRaises(ValueError, lambda: flomosa.Process.from_dict(data))
+        data['actions'] = []
+        data['steps'][0]['process'] = 'other'
+        self.assertRaises(ValueError, lambda: flomosa.Process.from_dict(data))
+        data['steps'][0] = {'process': data['key']}
+        self.assertRaises(ValueError, lambda: flomosa.Process.from_dict(data))
+
+    def test_loadmany(self):
+        team = flomosa.Team(name='test team')
+        items = [self.process.to_dict(), team.to_dict(), None,
+            flomosa.Process(name='other', key='test-other-id').to_json()]
+        processes = list(flomosa.Process.load_many(items))
+        self.assertEqual([process.key for process in processes],
+            ['test-graph-id', 'test-other-id'])
+        lines = StringIO('%s\n\n%s\n' % (self.process.to_json(),
+            processes[1].to_json()))
+        processes = list(flomosa.Process.load_json_lines(lines))
+        self.assertEqual(len(processes), 2)
+        self.assertEqual(len(processes[0]._actions), 4)
+
+    def test_todot(self):
+        dot = self.process.to_dot()
+        self.assertTrue(dot.startswith('digraph "test process" {\n'))
+        self.assertTrue('"step1" [label="1st Approval"]\n' in dot)
+        self.assertTrue('"step1" -> "step2" [label="Approved"]\n' in dot)
+        self.assertTrue('"step3" -> "finish" [label="Done"]\n' in dot)
+        self.assertTrue(dot.endswith('}'))
+        out = StringIO()
+        self.process.write_dot(out)
+        self.assertEqual(out.getvalue(), dot)
+
+    def test_writedot(self):
+        self.step1.add_action('Rush', next_step=self.step2)
+        self.step1.add_action('Approved', next_step=self.step2)
+        out = StringIO()
+        self.process.write_dot(out, collapse=True)
+        dot = out.getvalue()
+        self.assertTrue('"step1" -> "step2" [label="Approved, Rush"]\n' in dot
+            or '"step1" -> "step2" [label="Rush, Approved"]\n' in dot)
+        self.assertEqual(dot.count('"step1" -> "step2"'), 1)
+
+        self.step2.team = flomosa.Team(name='test team', key='test-team')
+        self.step3.team = 'other-team'
+        out = StringIO()
+        self.process.write_dot(out, cluster_by_team=True)
+        dot = out.getvalue()
+        self.assertTrue('subgraph "cluster_test-team" {\nlabel="test team"\n'
+            '"step2" [label="2nd Approval"]\n}\n' in dot)
+        self.assertTrue('subgraph "cluster_other-team" {' in dot)
+
+        step4 = self.process.add_step('4th Approval', key='step4')
+        self.step3.add_action('Reopen', next_step=step4)
+        out = StringIO()
+        self.process.write_dot(out, around='step1', depth=1)
+        dot = out.getvalue()
+        self.assertTrue('"step1" -> "step3"' in dot)
+        self.assertTrue('"step2" -> "step3"' in dot)
+        self.assertFalse('step4' in dot)
+        out = StringIO()
+        self.process.write_dot(out, around=step4, depth=0)
+        self.assertEqual(out.getvalue(), 'digraph "test process" {\n'
+            '"step4" [label="4th Approval"]\n"finish" [label="Finish"]\n\n}')
+
+    def test_getsteps(self):
+        self.assertEqual(self.process.get_steps_by_name('1st Approval'),
+            self.step1)
+        self.assertEqual(self.process.get_steps_by_name('Missing'), [])
+        self.step3.name = '2nd Approval'
+        self.assertEqual(self.keys(self.process.get_steps_by_name(
+            '2nd Approval')), ['step2', 'step3'])
+        self.assertEqual(self.process.get_steps_by_name('3rd Approval'), [])
+        step = self.process.add_step('Replaced', key='step1')
+        self.assertEqual(self.process.get_steps_by_name('1st Approval'), [])
+        self.assertEqual(self.process.get_steps_by_name('Replaced'), step)
+
+    def test_deletesteps(self):
+        self.process.delete_steps_by_name('2nd Approval')
+        self.assertEqual(sorted(self.process._steps.keys()),
+            ['step1', 'step3'])
+        self.assertFalse('finish' in self.process._actions)
+        self.assertEqual(self.approve._outgoing, {})
+        self.assertEqual(self.keys(self.step1.next_steps()), ['step3'])
+        self.assertEqual(self.keys(self.step3.previous_steps()), ['step1'])
+        self.assertEqual(self.process.get_steps_by_name('2nd Approval'), [])
+
+        self.process.delete_step(self.step1)
+        self.assertEqual(self.process._steps.keys(), ['step3'])
+        self.assertEqual(sorted(self.process._actions.keys()), ['done'])
+        self.assertEqual(self.step3.get_incoming_actions(), [])
+        self.assertEqual(self.process._step_outgoing.keys(), ['step3'])
+
+class TestChanges(unittest.TestCase):
+    def setUp(self):
+        self.process = flomosa.Process(name='test process',
+            key='test-changes-id')
+        self.step1 = self.process.add_step('1st Approval', key='step1')
+        self.step2 = self.process.add_step('2nd Approval', key='step2')
+        self.step3 = self.process.add_step('3rd Approval', key='step3')
+        self.step1.add_action('Approved', next_step=self.step2,
+            key='approve')
+        self.step3.add_action('Done', is_complete=True, key='done')
+        self.process.mark_saved()
+
+    def test_clean(self):
+        self.assertFalse(self.process.is_dirty())
+        self.assertEqual(self.process.changes(), [])
+        self.assertTrue(flomosa.Process(name='new').is_dirty())
+
+    def test_log(self):
+        self.step2.team = 'team-a'
+        self.step2.members = ['a@flomosa.com']
+        self.step1.update_action('Approved', 'Accepted')
+        self.process.delete_steps_by_name('3rd Approval')
+        self.assertTrue(self.process.is_dirty())
+        self.assertEqual(self.process.changes(), [
+            ('update_step', 'step2', ('team', None, 'team-a')),
+            ('update_step', 'step2', ('members', [], ['a@flomosa.com'])),
+            ('update_action', 'approve', ('name', 'Approved', 'Accepted')),
+            ('delete_step', 'step3', '3rd Approval'),
+            ('delete_action', 'done', 'Done')])
+
+    def test_cancel_out(self):
+        self.step1.name = 'First'
+        self.step1.name = '1st Approval'
+        self.step2.members.append('a@flomosa.com')
+        self.assertTrue(self.process.is_dirty())
+        self.step2.members.pop()
+        self.assertEqual(len(self.process.changes()), 2)
+        self.assertFalse(self.process.is_dirty())
+
+        step4 = self.process.add_step('4th Approval', key='step4')
+        self.assertTrue(self.process.is_dirty())
+        self.process.delete_step(step4)
+        self.assertFalse(self.process.is_dirty())
+
+    def test_loaded(self):
+        process = flomosa.Process.from_dict(self.process.to_dict())
+        self.assertEqual(process.changes(), [])
+        process.mark_saved()
+        self.assertEqual(process.state_hash(), self.process.state_hash())
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import threading
+import unittest
+sys.path[0:0] = [os.path.join(os.path.dirname(__file__), '..'),]
+
+from flomosa import futures
+
+class TestFuture(unittest.TestCase):
+    def test_result(self):
+        future = futures.Future()
+        self.assertFalse(future.done())
+        self.assertRaises(futures.TimeoutError, lambda: future.result(0.01))
+        future.set_result('test')
+        self.assertTrue(future.done())
+        self.assertEqual(future.result(), 'test')
+        self.assertEqual(future.exception(), None)
+
+    def test_exception(self):
+        future = futures.Future()
+        try:
+            raise ValueError('test')
+        except ValueError:
+            future.set_exc_info(sys.exc_info())
+        self.assertRaises(ValueError, future.result)
+        self.assertTrue(isinstance(future.exception(), ValueError))
+
+    def test_cancel(self):
+        future = futures.Future()
+        self.assertTrue(future.cancel())
+        self.assertTrue(future.cancelled())
+        self.assertFalse(future.set_running())
+        self.assertRaises(futures.CancelledError, future.result)
+
+    def test_callback(self):
+        future = futures.Future()
+        called = []
+        future.add_done_callback(called.append)
+        future.set_result(1)
+        future.add_done_callback(called.append)
+        self.assertEqual(called, [future, future])
+
+class TestExecutor(unittest.TestCase):
+    def test_submit(self):
+        executor = futures.Executor(max_workers=2)
+        future = executor.submit(lambda x, y=0: x + y, 1, y=2)
+        self.assertEqual(future.result(1), 3)
+        executor.shutdown()
+        self.assertRaises(RuntimeError, lambda: executor.submit(len, []))
+
+    def test_map(self):
+        executor = futures.Executor(max_workers=4)
+        self.assertEqual(executor.map(abs, range(-10, 0)), range(10, 0, -1))
+        executor.shutdown()
+
+    def test_bounded(self):
+        lock = threading.Lock()
+        state = {'active': 0, 'peak': 0}
+        release = threading.Event()
+
+        def work():
+            lock.acquire()
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+            lock.release()
+            release.wait(1)
+            lock.acquire()
+            state['active'] -= 1
+            lock.release()
+
+        executor = futures.Executor(max_workers=3)
+        results = [executor.submit(work) for i in range(10)]
+        release.set()
+        futures.wait(results, 5)
+        executor.shutdown()
+        self.assertEqual(state['peak'], 3)
+
+    def test_as_completed(self):
+        executor = futures.Executor(max_workers=2)
+        submitted = [executor.submit(abs, i) for i in range(5)]
+        completed = list(futures.as_completed(submitted, 5))
+        executor.shutdown()
+        self.assertEqual(sorted(f.result() for f in completed), range(5))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+import os
+import subprocess
+import sys
+import unittest
+sys.path[0:0] = [os.path.join(os.path.dirname(__file__), '..'),]
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+PROBE = '''
+import sys
+sys.path.insert(0, %r)
+%s
+print(' '.join(sorted(sys.modules)))
+'''
+
+TRANSPORT_MODULES = ('oauth2', 'httplib2', 'httplib', 'urllib', 'uuid',
+    'numpy', 'email', 'flomosa.pool', 'flomosa.signing', 'flomosa.retry')
+
+def imported(code):
+    """Return the modules loaded after running code in a new interpreter."""
+    output = subprocess.check_output([sys.executable, '-c',
+        PROBE % (ROOT, code)])
+    return output.split()
+
+class TestImports(unittest.TestCase):
+    def test_model_only(self):
+        modules = imported('import flomosa\n'
+            'p = flomosa.Process(name="p")\n'
+            'p.add_step("s", is_start=True)\n'
+            'list(flomosa.Process.load_many([p.to_json()]))')
+        for name in TRANSPORT_MODULES:
+            self.assertFalse(name in modules, '%s was imported' % name)
+
+    def test_client(self):
+        modules = imported('import flomosa\n'
+            'flomosa.Client(key="k", secret="s")')
+        for name in ('oauth2', 'flomosa.pool', 'flomosa.signing',
+            'flomosa.retry'):
+            self.assertTrue(name in modules, '%s was not imported' % name)
+
+    def test_names_stable(self):
+        import flomosa
+        names = set(dir(flomosa))
+        flomosa.Client(key='k', secret='s').close()
+        # Only the submodules just imported may appear on the package.
+        added = [name for name in set(dir(flomosa)) - names
+            if sys.modules.get('flomosa.' + name) is not getattr(flomosa,
+            name)]
+        self.assertEqual(added, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import logging
+import unittest
+sys.path[0:0] = [os.path.join(os.path.dirname(__file__), '..'),]
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+import flomosa
+from flomosa.instrument import Histogram, Histograms, Instrument
+
+class FakeClient(flomosa.Client):
+    def _send(self, endpoint, method, body, headers):
+        if endpoint.endswith('/missing.json'):
+            return {'status': '404'}, json.dumps({'code': 404,
+                'message': 'Not found'})
+        return {'status': '200'}, json.dumps({'key': 'test',
+            'name': 'test team', 'members': []})
+
+class Recorder(Instrument):
+    def __init__(self):
+        self.events = []
+
+    def request(self, event):
+        self.events.append(event)
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+class TestHistogram(unittest.TestCase):
+    def test_percentiles(self):
+        histogram = Histogram()
+        self.assertEqual(histogram.percentile(50), None)
+        for i in range(1, 101):
+            histogram.add(i / 1000.0)
+        self.assertEqual(histogram.count, 100)
+        self.assertAlmostEqual(histogram.mean(), 0.0505)
+        for percent, expected in ((50, 0.050), (95, 0.095), (99, 0.099)):
+            value = histogram.percentile(percent)
+            self.assertTrue(expected <= value <= expected * 1.05, value)
+        self.assertEqual(histogram.percentile(100), 0.1)
+
+class TestInstrument(unittest.TestCase):
+    def client(self, instrument):
+        return FakeClient(key='test-key', secret='test-secret',
+            host='127.0.0.1', port=8080, instrument=instrument)
+
+    def test_events(self):
+        recorder = Recorder()
+        client = self.client(recorder)
+        client.get_team('test')
+        client.add_team(flomosa.Team(name='test team', key='test'))
+        self.assertRaises(flomosa.APIError,
+            lambda: client.get_request('missing'))
+
+        get, put, missing = recorder.events
+        self.assertEqual(get.endpoint, 'teams')
+        self.assertEqual(get.method, 'GET')
+        self.assertEqual(get.status, '200')
+        self.assertEqual(get.attempts, 1)
+        self.assertEqual(get.retries, 0)
+        self.assertTrue(get.response_bytes > 0)
+        self.assertTrue(get.total_seconds >= get.sign_seconds +
+            get.transfer_seconds)
+        self.assertEqual(put.request_bytes,
+            len(flomosa.Team(name='test team', key='test').to_json()))
+        self.assertEqual(missing.endpoint, 'requests')
+        self.assertEqual(missing.status, '404')
+        self.assertTrue(isinstance(missing.error, flomosa.APIError))
+
+    def test_histograms(self):
+        histograms = Histograms()
+        client = self.client(histograms)
+        for i in range(10):
+            client.get_request('test-%d' % i)
+        client.get_year_stats('test', 2010)
+        summary = histograms.summary()
+        self.assertEqual(sorted(summary), ['requests', 'stats_year'])
+        self.assertEqual(summary['requests']['requests'], 10)
+        self.assertEqual(summary['requests']['errors'], 0)
+        self.assertTrue(summary['requests']['p99'] >=
+            summary['requests']['p50'])
+
+    def test_debug(self):
+        handler = ListHandler()
+        logger = logging.getLogger('flomosa')
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        try:
+            client = self.client(None)
+            client.get_request('test')
+            self.assertEqual(handler.messages, [])
+            client.debug = True
+            client.get_request('test')
+        finally:
+            logger.removeHandler(handler)
+            logger.setLevel(logging.NOTSET)
+        self.assertEqual(len(handler.messages), 1)
+        self.assertTrue(handler.messages[0].startswith('GET http://'))
+        self.assertFalse('oauth' in handler.messages[0].lower())
+
+if __name__ == '__main__':
+    unittest.main()
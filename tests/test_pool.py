@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import threading
+import unittest
+import BaseHTTPServer
+import SocketServer
+sys.path[0:0] = [os.path.join(os.path.dirname(__file__), '..'),]
+
+from flomosa import futures
+from flomosa.pool import ConnectionPool, PoolTimeout
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = self.path
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_PUT(self):
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().strip(), 16)
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+            if not size:
+                break
+        body = '%d:%s' % (len(chunks) - 1, ''.join(chunks))
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.uri = 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_reuse(self):
+        pool = ConnectionPool(maxsize=2)
+        for i in range(5):
+            resp, content = pool.request(self.uri + '/test/%d?x=1' % i)
+            self.assertEqual(resp['status'], '200')
+            self.assertEqual(content, '/test/%d?x=1' % i)
+        stats = pool.stats()
+        self.assertEqual(stats['created'], 1)
+        self.assertEqual(stats['reused'], 4)
+        self.assertEqual(stats['in_use'], 0)
+        self.assertEqual(stats['idle'], 1)
+        pool.close()
+        self.assertEqual(pool.stats()['idle'], 0)
+
+    def test_chunked(self):
+        pool = ConnectionPool()
+        timings = {}
+        resp, content = pool.request(self.uri + '/', 'PUT',
+            body=lambda: iter(['{"a": ', '', '1}']), timings=timings)
+        self.assertEqual(content, '2:{"a": 1}')
+        self.assertEqual(timings['sent'], 8)
+        self.assertTrue(timings['connect'] >= 0)
+
+        timings = {}
+        pool.request(self.uri + '/', timings=timings)
+        self.assertFalse('connect' in timings)
+
+    def test_threads(self):
+        pool = ConnectionPool(maxsize=3)
+        executor = futures.Executor(max_workers=8)
+        results = [executor.submit(pool.request, self.uri + '/%d' % i)
+            for i in range(50)]
+        for i, future in enumerate(results):
+            self.assertEqual(future.result(5)[1], '/%d' % i)
+        executor.shutdown()
+        stats = pool.stats()
+        self.assertTrue(stats['created'] <= 3)
+        self.assertEqual(stats['created'] + stats['reused'], 50)
+        self.assertEqual(stats['in_use'], 0)
+
+    def test_wait_timeout(self):
+        pool = ConnectionPool(maxsize=1, wait_timeout=0.01)
+        conn, reused = pool.checkout('http', '127.0.0.1', 80)
+        self.assertFalse(reused)
+        self.assertRaises(PoolTimeout,
+            lambda: pool.checkout('http', '127.0.0.1', 80))
+        pool.checkin('http', '127.0.0.1', 80, conn)
+        self.assertEqual(pool.checkout('http', '127.0.0.1', 80)[0], conn)
+
+    def test_idle_eviction(self):
+        pool = ConnectionPool(maxsize=2, idle_timeout=0)
+        pool.request(self.uri + '/')
+        pool.evict_idle()
+        stats = pool.stats()
+        self.assertEqual(stats['idle'], 0)
+        self.assertEqual(stats['evicted'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import socket
+import unittest
+sys.path[0:0] = [os.path.join(os.path.dirname(__file__), '..'),]
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+import flomosa
+from flomosa.pool import PoolTimeout
+from flomosa.retry import AIMDLimiter, Throttle, endpoint_group, \
+    parse_retry_after
+
+class FakeClient(flomosa.Client):
+    def __init__(self, *args, **kwargs):
+        self.responses = kwargs.pop('responses')
+        flomosa.Client.__init__(self, *args, **kwargs)
+        self.debug = False
+        self.sent = []
+
+    def _send(self, endpoint, method, body, headers):
+        self.sent.append(headers['Authorization'])
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response, json.dumps({'code': response['status'],
+            'message': 'test'})
+
+class TestAIMDLimiter(unittest.TestCase):
+    def test_limit(self):
+        limiter = AIMDLimiter(limit=4, minimum=1, maximum=5)
+        tokens = [limiter.acquire() for i in range(4)]
+        self.assertEqual(limiter.in_flight, 4)
+        limiter.release(tokens[0], overloaded=True)
+        self.assertEqual(limiter.limit, 2.0)
+        # Calls started before the decrease do not lower it again.
+        limiter.release(tokens[1], overloaded=True)
+        self.assertEqual(limiter.limit, 2.0)
+        limiter.release(tokens[2])
+        self.assertEqual(limiter.limit, 2.5)
+        limiter.release(tokens[3], success=False)
+        self.assertEqual(limiter.limit, 2.5)
+        self.assertEqual(limiter.in_flight, 0)
+        for i in range(50):
+            limiter.release(limiter.acquire())
+        self.assertEqual(limiter.limit, 5)
+
+class TestThrottle(unittest.TestCase):
+    def setUp(self):
+        self.delays = []
+        self.throttle = Throttle(max_retries=2, backoff=1, max_backoff=3,
+            sleep=self.delays.append)
+
+    def client(self, *responses):
+        return FakeClient(key='test-key', secret='test-secret',
+            host='127.0.0.1', port=8080, throttle=self.throttle,
+            responses=list(responses))
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after('120'), 120.0)
+        self.assertEqual(parse_retry_after('Fri, 09 Apr 2010 15:33:20 GMT',
+            now=1270827190), 10.0)
+        self.assertEqual(parse_retry_after('soon'), None)
+        self.assertEqual(parse_retry_after(None), None)
+        self.assertEqual(endpoint_group('http://127.0.0.1:8080/teams/a.json'
+            '?x=1'), '/teams')
+
+    def test_retry(self):
+        client = self.client({'status': '503'},
+            {'status': '429', 'retry-after': '7'}, {'status': '200'})
+        self.assertEqual(client.get_request('a'), {'code': '200',
+            'message': 'test'})
+        self.assertEqual(len(client.sent), 3)
+        self.assertNotEqual(client.sent[0], client.sent[1])
+        self.assertTrue(0 <= self.delays[0] <= 1)
+        # Retry-After is honored up to max_backoff.
+        self.assertEqual(self.delays[1], 3)
+
+        stats = self.throttle.stats()
+        self.assertEqual(stats['requests'], 3)
+        self.assertEqual(stats['retries'], 2)
+        self.assertEqual(stats['overloaded'], 2)
+        self.assertEqual(stats['limits'], {'/requests': 2.5 + 1 / 2.5})
+
+    def test_give_up(self):
+        client = self.client({'status': '503'}, {'status': '503'},
+            {'status': '503'})
+        self.assertRaises(flomosa.APIError, lambda: client.get_request('a'))
+        self.assertEqual(len(client.sent), 3)
+        self.assertEqual(self.throttle.failures, 1)
+
+    def test_errors(self):
+        client = self.client(socket.error('reset'), {'status': '404'})
+        self.assertRaises(flomosa.APIError, lambda: client.get_request('a'))
+        self.assertEqual(len(client.sent), 2)
+
+        sent = []
+        def send():
+            sent.append(1)
+            return {'status': '503'}, ''
+        resp, content = self.throttle.call('http://127.0.0.1/requests/a.json',
+            'POST', send)
+        self.assertEqual(resp['status'], '503')
+        self.assertEqual(len(sent), 1)
+
+    def test_release(self):
+        self.throttle.limit = 2
+        url = 'http://127.0.0.1/requests/a.json'
+        def send():
+            raise PoolTimeout('No connection available')
+        for i in range(3):
+            self.assertRaises(PoolTimeout,
+                lambda: self.throttle.call(url, 'GET', send))
+        self.assertEqual(self.throttle.limiter(url).in_flight, 0)
+        self.assertEqual(self.throttle.failures, 3)
+
+if __name__ == '__main__':
+    unittest.main()
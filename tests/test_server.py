@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+import calendar
+import os
+import sys
+import unittest
+sys.path[0:0] = [os.path.join(os.path.dirname(__file__), '..'),]
+
+import flomosa
+from flomosa.retry import Throttle
+from flomosa.server import ROUTES, StandInServer
+from flomosa.signing import Signer
+
+# 2010-04-20 12:00 UTC
+NOON = calendar.timegm((2010, 4, 20, 12, 0, 0))
+
+class TestStandInServer(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer(seed=1).start()
+        self.client = self.connect()
+        self.process = flomosa.Process(name='test process',
+            key='test-process-id')
+        self.step = self.process.add_step('step 1', is_start=True)
+        self.step.add_action('done', is_complete=True)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def connect(self, secret='test-secret', **kwargs):
+        kwargs.setdefault('throttle', False)
+        return flomosa.Client(key='test-key', secret=secret,
+            host=self.server.host, port=self.server.port, **kwargs)
+
+    def test_routes(self):
+        self.assertEqual(sorted([name for name, pattern in ROUTES]),
+            sorted(flomosa.Client.endpoints))
+
+    def test_objects(self):
+        resp = self.client.add_process(self.process, stream=True)
+        self.assertEqual(resp['key'], self.process.key)
+        process = self.client.get_process(self.process.key)
+        self.assertEqual(process.to_dict(), self.process.to_dict())
+        self.assertEqual(self.client.delete_process(self.process.key), '')
+        self.assertRaises(flomosa.APIError,
+            lambda: self.client.get_process(self.process.key))
+
+        team = flomosa.Team(name='test team', members=['a@flomosa.com'])
+        self.assertEqual(self.client.add_team(team)['key'], team.key)
+        self.assertEqual(self.client.get_team(team.key).members,
+            ['a@flomosa.com'])
+        self.assertEqual(self.server.hits, {'processes': 4, 'teams': 2})
+
+    def test_revalidate(self):
+        client = self.connect(cache=True)
+        revalidated = []
+        client.cache.revalidated = lambda url, entry: revalidated.append(url)
+        self.client.add_process(self.process)
+        client.get_process(self.process.key)
+        process = client.get_process(self.process.key)
+        self.assertEqual(len(revalidated), 1)
+        self.assertEqual(process.to_dict(), self.process.to_dict())
+        client.close()
+
+    def test_search_and_stats(self):
+        for i in range(5):
+            self.server.add_request(self.process.key, step=self.step.key,
+                timestamp=NOON + i, seconds=i + 1.0)
+        self.server.add_request(self.process.key, timestamp=NOON + 86400,
+            is_completed=False)
+
+        results = self.client.search_process(self.process.key, start=NOON + 1,
+            end=NOON + 86400, limit=3)
+        self.assertEqual([result['timestamp'] for result in results],
+            [NOON + 1, NOON + 2, NOON + 3])
+        self.assertEqual(len(self.client.search_step(self.step.key,
+            start=NOON, end=NOON + 86400)), 5)
+        self.assertEqual(self.client.get_request(results[0]['key']),
+            results[0])
+
+        stats = self.client.get_day_stats(self.process.key, 2010, 4, 20)
+        self.assertEqual(stats['num_requests'], 5)
+        self.assertEqual(stats['min_request_seconds'], 1.0)
+        self.assertEqual(stats['avg_request_seconds'], 3.0)
+        self.assertEqual(self.client.get_month_stats(self.process.key, 2010,
+            4, filter=['num_requests', 'num_requests_completed']),
+            {'num_requests': 6, 'num_requests_completed': 5})
+        self.assertEqual(self.client.get_year_stats(self.process.key, 2009,
+            filter='num_requests'), {'num_requests': 0})
+
+    def test_signature(self):
+        client = self.connect(secret='wrong-secret')
+        try:
+            client.get_team('test-team-id')
+        except flomosa.APIError, e:
+            self.assertEqual(e['code'], 401)
+        else:
+            self.fail('APIError not raised')
+        client.close()
+
+    def test_signer_regression(self):
+        # The server checks with oauth2, so a broken Signer is caught.
+        normalize = Signer._normalize_parameters
+        Signer._normalize_parameters = lambda self, request, query: \
+            normalize(self, request, None)
+        try:
+            self.client.get_day_stats(self.process.key, 2010, 4, 20)
+        except flomosa.APIError, e:
+            self.assertEqual(e['code'], 401)
+        else:
+            self.fail('APIError not raised')
+        finally:
+            Signer._normalize_parameters = normalize
+
+    def test_errors(self):
+        self.server.error_rate = 1.0
+        self.server.retry_after = 0
+        try:
+            self.client.add_process(self.process)
+        except flomosa.APIError, e:
+            self.assertEqual(e['code'], 503)
+        else:
+            self.fail('APIError not raised')
+
+        sleeps = []
+        client = self.connect(throttle=Throttle(max_retries=2,
+            sleep=sleeps.append))
+        self.assertRaises(flomosa.APIError,
+            lambda: client.get_team('test-team-id'))
+        self.assertEqual(sleeps, [0, 0])
+        self.assertEqual(self.server.errors['teams'], 3)
+        client.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import unittest
+sys.path[0:0] = [os.path.join(os.path.dirname(__file__), '..'),]
+
+import flomosa
+from flomosa import simulation
+from flomosa.simulation import Simulator, simulate
+
+class TestSimulation(unittest.TestCase):
+    def setUp(self):
+        self.numpy = simulation.numpy
+        self.process = flomosa.Process(name='test process',
+            key='test-simulation-id')
+        self.step1 = self.process.add_step('1st Approval', key='step1',
+            team='team1', is_start=True)
+        self.step2 = self.process.add_step('2nd Approval', key='step2',
+            team='team1')
+        self.step3 = self.process.add_step('3rd Approval', key='step3',
+            team='team2')
+        self.step1.add_action('Approved', next_step=self.step2, key='approve')
+        self.step1.add_action('Skip', next_step=self.step3, key='skip')
+        self.step2.add_action('Approved', next_step=self.step3, key='finish')
+        self.step3.add_action('Done', is_complete=True, key='done')
+        self.service_times = {self.step1: 1.0, 'step2': ('fixed', 2.0),
+            'step3': 0.5}
+
+    def tearDown(self):
+        simulation.numpy = self.numpy
+
+    def backends(self):
+        simulation.numpy = None
+        yield 'python'
+        simulation.numpy = False
+        if simulation._numpy() is not None:
+            yield 'numpy'
+
+    def test_fixed(self):
+        for backend in self.backends():
+            result = self.process.simulate(100, {'skip': 0},
+                self.service_times)
+            self.assertEqual(result.completed, 100, backend)
+            self.assertEqual(result.completion_probability, 1.0)
+            self.assertEqual(result.mean_hops, 3.0)
+            self.assertEqual(result.percentile(50), 3.5)
+            self.assertEqual(result.histogram(2), ([3.5, 4.5, 5.5],
+                [100, 0]))
+            load = result.step_load()
+            self.assertEqual(load['step2']['visits'], 1.0)
+            self.assertEqual(load['step2']['seconds'], 200.0)
+            self.assertEqual(result.team_load()['team1']['seconds'], 300.0)
+
+    def test_random(self):
+        simulator = Simulator(self.process, {'approve': 3, 'skip': 1},
+            {'step1': ('exponential', 1.0), 'step2': ('uniform', 1.0, 3.0),
+            'step3': ('lognormal', 0.0, 0.5)})
+        for backend in self.backends():
+            result = simulator.run(20000, seed=1)
+            self.assertEqual(result.completed, 20000)
+            self.assertEqual(simulator.run(20000, seed=1).times,
+                result.times)
+            self.assertNotEqual(simulator.run(20000, seed=2).times,
+                result.times)
+            self.assertAlmostEqual(result.mean_hops, 2.75, 1)
+            self.assertAlmostEqual(result.step_load()['step2']['visits'],
+                0.75, 1)
+            self.assertTrue(result.percentile(5) < result.percentile(95))
+
+    def test_batches(self):
+        if simulation._numpy() is None:
+            return
+        simulator = Simulator(self.process, service_times=self.service_times)
+        result = simulator.run(1001, seed=0, batch_size=100)
+        self.assertEqual(result.requests, 1001)
+        self.assertEqual(len(result.times), 1001)
+        self.assertEqual(sorted(set(result.times)), [1.5, 3.5])
+
+    def test_stuck_and_unfinished(self):
+        step4 = self.process.add_step('Rework', key='step4')
+        self.step2.add_action('Rework', next_step=step4, key='rework')
+        step4.add_action('Again', next_step=step4, key='again')
+        self.step3.add_action('Stop', key='stop')
+        for backend in self.backends():
+            result = simulate(self.process, 10, {'skip': 0, 'finish': 0,
+                'stop': 1, 'done': 0}, max_hops=5)
+            self.assertEqual((result.completed, result.stuck,
+                result.unfinished), (0, 0, 10), backend)
+            self.assertEqual(result.percentile(50), None)
+            result = simulate(self.process, 10, {'approve': 0, 'stop': 1,
+                'done': 0})
+            self.assertEqual(result.stuck, 10, backend)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, lambda: Simulator(self.process,
+            service_times={'step1': ('gamma', 1.0)}))
+        self.assertRaises(ValueError, lambda: Simulator(self.process,
+            service_times={'step1': ('uniform', 1.0)}))
+        self.assertRaises(ValueError, lambda: Simulator(self.process,
+            {'skip': -1}))
+
+if __name__ == '__main__':
+    unittest.main()
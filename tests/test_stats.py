@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import datetime
+import shutil
+import tempfile
+import unittest
+import urlparse
+sys.path[0:0] = [os.path.join(os.path.dirname(__file__), '..'),]
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+import flomosa
+from flomosa import stats
+
+class FakeClient(flomosa.Client):
+    def _send(self, endpoint, method, body, headers):
+        url = urlparse.urlparse(endpoint)
+        params = dict(urlparse.parse_qsl(url.query))
+        key = url.path.rsplit('/', 1)[-1][:-5]
+        if key == 'missing' or params.get('day') == '2':
+            return {'status': '404'}, json.dumps({'code': 404,
+                'message': 'Not found'})
+        data = {'num_requests': int(params.get('day', params['year'])),
+            'avg_request_seconds': 1.5}
+        return {'status': '200'}, json.dumps(data)
+
+class TestPeriods(unittest.TestCase):
+    def test_day(self):
+        days = stats.periods(datetime.date(2010, 2, 27),
+            datetime.date(2010, 3, 2), 'day')
+        self.assertEqual(days, [(2010, 2, 27), (2010, 2, 28), (2010, 3, 1),
+            (2010, 3, 2)])
+
+    def test_week(self):
+        weeks = stats.periods(datetime.date(2009, 12, 30),
+            datetime.date(2010, 1, 12), 'week')
+        self.assertEqual(weeks, [(2009, 53), (2010, 1), (2010, 2)])
+
+    def test_month(self):
+        months = stats.periods(datetime.date(2009, 11, 30),
+            datetime.datetime(2010, 2, 1), 'month')
+        self.assertEqual(months, [(2009, 11), (2009, 12), (2010, 1),
+            (2010, 2)])
+
+    def test_year(self):
+        years = stats.periods(datetime.date(2008, 5, 1),
+            datetime.date(2010, 1, 1), 'year')
+        self.assertEqual(years, [(2008,), (2009,), (2010,)])
+        self.assertEqual(stats.periods(datetime.date(2010, 1, 1),
+            datetime.date(2009, 1, 1), 'year'), [])
+        self.assertRaises(ValueError, lambda: stats.periods(
+            datetime.date(2010, 1, 1), datetime.date(2010, 1, 1), 'hour'))
+
+class TestStatsSeries(unittest.TestCase):
+    def setUp(self):
+        self.client = FakeClient(key='test-key', secret='test-secret',
+            host='127.0.0.1', port=8080)
+        self.client.debug = False
+
+    def test_series(self):
+        series = self.client.get_stats_series(['test', 'missing'],
+            datetime.date(2010, 4, 1), datetime.date(2010, 4, 3),
+            filter=['num_requests', 'bogus'], fill=0)
+        self.assertEqual(series.metrics, ('num_requests',))
+        self.assertEqual(len(series), 6)
+        self.assertEqual(series.index[0], ('test', (2010, 4, 1)))
+        self.assertEqual(series['num_requests'], [1, 0, 3, 0, 0, 0])
+        self.assertEqual(series.missing, [False, True, False, True, True,
+            True])
+        self.assertEqual(series.get('test', (2010, 4, 3)),
+            {'num_requests': 3})
+        self.assertEqual(series.get('test', (2010, 5, 1)), None)
+
+    def test_all_metrics(self):
+        series = self.client.get_stats_series(['test'],
+            datetime.date(2009, 1, 1), datetime.date(2010, 1, 1), 'year')
+        self.assertEqual(series.metrics, flomosa.Client.stats)
+        self.assertEqual(series['num_requests'], [2009, 2010])
+        self.assertEqual(series['max_request_seconds'], [None, None])
+        self.assertRaises(ValueError, lambda: self.client.get_stats_series(
+            ['test'], datetime.date(2010, 1, 1), datetime.date(2010, 1, 1),
+            'hour'))
+
+class CountingClient(FakeClient):
+    def __init__(self, *args, **kwargs):
+        FakeClient.__init__(self, *args, **kwargs)
+        self.sent = []
+
+    def _send(self, endpoint, method, body, headers):
+        self.sent.append(endpoint)
+        return FakeClient._send(self, endpoint, method, body, headers)
+
+class TestStatsCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.client = CountingClient(key='test-key', secret='test-secret',
+            host='127.0.0.1', port=8080,
+            stats_cache=stats.StatsCache(self.directory, open_ttl=0))
+        self.client.debug = False
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_period_end(self):
+        self.assertEqual(stats.period_end((2010, 2), 'month'),
+            datetime.date(2010, 2, 28))
+        self.assertEqual(stats.period_end((2009, 53), 'week'),
+            datetime.date(2010, 1, 3))
+        self.assertEqual(stats.period_end((2010, 1), 'week'),
+            datetime.date(2010, 1, 10))
+        self.assertEqual(stats.period_end((2010,), 'year'),
+            datetime.date(2010, 12, 31))
+        self.assertTrue(stats.is_closed((2010, 4, 1), 'day',
+            datetime.date(2010, 4, 2)))
+        self.assertFalse(stats.is_closed((2010, 4), 'month',
+            datetime.date(2010, 4, 2)))
+
+    def test_closed_period(self):
+        first = self.client.get_day_stats('test', 2010, 4, 1)
+        second = self.client.get_day_stats('test', 2010, 4, 1)
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.client.sent), 1)
+
+        # A narrower filter is answered from the full response.
+        data = self.client.get_day_stats('test', 2010, 4, 1,
+            filter=['num_requests'])
+        self.assertEqual(data, {'num_requests': 1})
+        self.assertEqual(len(self.client.sent), 1)
+
+    def test_persisted(self):
+        self.client.get_year_stats('test', 2009, filter=['num_requests'])
+        client = CountingClient(key='test-key', secret='test-secret',
+            host='127.0.0.1', port=8080,
+            stats_cache=stats.StatsCache(self.directory))
+        client.debug = False
+        data = client.get_year_stats('test', 2009, filter=['num_requests'])
+        self.assertEqual(data, {'num_requests': 2009})
+        self.assertEqual(client.sent, [])
+
+        # Metrics that were never fetched still go to the server.
+        client.get_year_stats('test', 2009)
+        self.assertEqual(len(client.sent), 1)
+
+    def test_open_period(self):
+        today = datetime.datetime.utcnow().date()
+        self.client.get_year_stats('test', today.year)
+        self.client.get_year_stats('test', today.year)
+        self.assertEqual(len(self.client.sent), 2)
+        self.assertEqual(os.listdir(self.directory), [])
+
+class TestRollup(unittest.TestCase):
+    def setUp(self):
+        metrics = ('num_requests', 'num_requests_completed',
+            'min_request_seconds', 'avg_request_seconds')
+        self.days = stats.StatsSeries('day', metrics)
+        self.days.append('a', (2010, 1, 31), {'num_requests': 4,
+            'num_requests_completed': 1, 'min_request_seconds': 2.0,
+            'avg_request_seconds': 2.0})
+        self.days.append('a', (2010, 2, 1), {'num_requests': 6,
+            'num_requests_completed': 3, 'min_request_seconds': 1.0,
+            'avg_request_seconds': 4.0})
+        self.days.append('a', (2010, 2, 2), None)
+        self.days.append('b', (2010, 2, 1), None)
+        self.days.append('b', (2010, 2, 2), {'num_requests': 1,
+            'num_requests_completed': 0, 'avg_request_seconds': 3.0})
+
+    def test_rollup(self):
+        months = stats.rollup(self.days, 'month')
+        self.assertEqual(months.index, [('a', (2010, 1)), ('a', (2010, 2)),
+            ('b', (2010, 2))])
+        self.assertEqual(months.missing, [False, False, False])
+        self.assertEqual(months['num_requests'], [4, 6, 1])
+        self.assertEqual(months['min_request_seconds'], [2.0, 1.0, None])
+
+        years = stats.rollup(self.days, 'year')
+        self.assertEqual(years.get('a', (2010,)), {'num_requests': 10,
+            'num_requests_completed': 4, 'min_request_seconds': 1.0,
+            'avg_request_seconds': 3.5})
+        # No completed requests to weight by, so a plain average is used.
+        self.assertEqual(years.get('b', (2010,))['avg_request_seconds'], 3.0)
+
+        weeks = stats.rollup(self.days.select(['num_requests']), 'week')
+        self.assertEqual(weeks.index, [('a', (2010, 4)), ('a', (2010, 5)),
+            ('b', (2010, 5))])
+        self.assertEqual(weeks['num_requests'], [4, 6, 1])
+        self.assertRaises(ValueError, lambda: stats.rollup(weeks, 'year'))
+
+    def test_python(self):
+        np = stats._numpy()
+        if np is None:
+            return
+        for granularity in ('week', 'month', 'year'):
+            expected = stats.rollup(self.days, granularity)
+            stats.numpy = None
+            try:
+                result = stats.rollup(self.days, granularity)
+            finally:
+                stats.numpy = np
+            self.assertEqual(result.index, expected.index)
+            self.assertEqual(result.missing, expected.missing)
+            self.assertEqual(list(result.rows()), list(expected.rows()))
+
+    def test_client(self):
+        client = FakeClient(key='test-key', secret='test-secret',
+            host='127.0.0.1', port=8080)
+        client.debug = False
+        result = client.get_rollup_stats(['test'], datetime.date(2010, 4, 1),
+            datetime.date(2010, 4, 1), ('day', 'month'),
+            filter=['num_requests', 'avg_request_seconds'])
+        self.assertEqual(len(result['day']), 30)
+        self.assertEqual(result['day'].metrics, ('num_requests',
+            'avg_request_seconds'))
+        self.assertEqual(result['month'].get('test', (2010, 4)),
+            {'num_requests': 463, 'avg_request_seconds': 1.5})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+sys.path[0:0] = [os.path.join(os.path.dirname(__file__), '..'),]
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+import flomosa
+from flomosa.sync import Manifest, canonical_json, content_hash, \
+    process_dict
+
+class FakeClient(flomosa.Client):
+    def __init__(self, *args, **kwargs):
+        flomosa.Client.__init__(self, *args, **kwargs)
+        self.debug = False
+        self.objects = {}
+        self.sent = []
+
+    def _send(self, endpoint, method, body, headers):
+        path = endpoint[len(self.uri):]
+        self.sent.append((method, path))
+        if method == 'PUT':
+            self.objects[path] = body
+            return {'status': '201'}, body
+        if path not in self.objects:
+            return {'status': '404'}, json.dumps({'code': 404,
+                'message': 'Not found'})
+        if method == 'DELETE':
+            del self.objects[path]
+            return {'status': '204'}, ''
+        return {'status': '200'}, self.objects[path]
+
+class TestSync(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.client = FakeClient(key='test-key', secret='test-secret',
+            host='127.0.0.1', port=8080)
+        self.team = flomosa.Team(name='test team', key='test-team-id',
+            members=['a@flomosa.com', 'b@flomosa.com'])
+        self.process = flomosa.Process(name='test process',
+            key='test-process-id')
+        self.process.add_step('step 1', is_start=True,
+            team=self.team.key)
+        self.process.add_step('step 2')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def puts(self):
+        return [path for method, path in self.client.sent if method == 'PUT']
+
+    def test_hash(self):
+        self.assertEqual(canonical_json({'b': [2, 1],
+            'a': {'d': 1, 'c': None}}), '{"a":{"c":null,"d":1},"b":[1,2]}')
+        data = self.team.to_dict()
+        digest = content_hash(self.team)
+        data['members'].reverse()
+        self.assertEqual(content_hash(data), digest)
+        self.team.description = 'changed'
+        self.assertNotEqual(content_hash(self.team), digest)
+
+    def test_server(self):
+        report = self.client.sync([self.process], [self.team])
+        self.assertEqual(report.created, [('teams', 'test-team-id'),
+            ('processes', 'test-process-id')])
+        self.assertEqual(len(self.puts()), 2)
+
+        self.team.description = 'changed'
+        report = self.client.sync([self.process], [self.team])
+        self.assertTrue(report.ok)
+        self.assertEqual(report.updated, [('teams', 'test-team-id')])
+        self.assertEqual(report.skipped, [('processes', 'test-process-id')])
+        self.assertEqual(len(self.puts()), 3)
+        # Reading the server copies left the registries alone.
+        self.assertTrue(flomosa._PROCESSES.get(self.process.key) is
+            self.process)
+        self.assertTrue(flomosa._TEAMS.get(self.team.key) is self.team)
+
+    def test_process_dict(self):
+        step = self.process._steps.values()[0]
+        step.add_action('done', is_complete=True)
+        data = self.process.to_dict()
+        self.assertEqual(content_hash(process_dict(data)),
+            content_hash(self.process))
+        # Server copies may omit defaults and repeat references.
+        for item in data['steps'] + data['actions']:
+            del item['kind']
+            del item['process']
+        data['actions'][0]['incoming'] *= 2
+        del data['steps'][0]['members']
+        self.assertEqual(content_hash(process_dict(data)),
+            content_hash(flomosa.Process.from_dict(data)))
+
+    def test_manifest(self):
+        path = os.path.join(self.directory, 'manifest.json')
+        report = self.client.sync([self.process], [self.team],
+            manifest=Manifest(path))
+        self.assertEqual(len(report.created), 2)
+
+        self.client.sent = []
+        report = self.client.sync([self.process], [self.team],
+            manifest=Manifest(path))
+        self.assertEqual(len(report.skipped), 2)
+        self.assertEqual(self.client.sent, [])
+
+        report = self.client.sync([self.process], manifest=Manifest(path),
+            dry_run=True)
+        self.assertEqual(report.deleted, [('teams', 'test-team-id')])
+        self.assertEqual(self.client.sent, [])
+
+        report = self.client.sync([self.process], manifest=Manifest(path))
+        self.assertEqual(report.deleted, [('teams', 'test-team-id')])
+        self.assertEqual(self.client.sent, [('DELETE',
+            '/teams/test-team-id.json')])
+        self.assertEqual(Manifest(path).keys('teams'), [])
+
+    def test_dry_run(self):
+        manifest = Manifest(os.path.join(self.directory, 'manifest.json'))
+        report = self.client.sync([self.process], [self.team],
+            manifest=manifest, dry_run=True)
+        self.assertEqual(len(report.created), 2)
+        self.assertEqual(self.client.sent, [])
+        self.assertEqual(manifest.keys('processes'), [])
+
+        report = self.client.sync([self.process], [self.team],
+            manifest=manifest)
+        self.assertEqual(len(report.created), 2)
+        self.assertEqual(len(self.puts()), 2)
+
+    def test_errors(self):
+        self.client.objects['/processes/test-process-id.json'] = 'garbage'
+        report = self.client.sync([self.process], [self.team])
+        self.assertFalse(report.ok)
+        self.assertEqual(report.errors[0][:2], ('processes',
+            'test-process-id'))
+        self.assertEqual(report.created, [('teams', 'test-team-id')])
+
+if __name__ == '__main__':
+    unittest.main()